@@ -9,9 +9,16 @@
 4. Подсистема NLP и интерфейса
 """
 
-from flask import Flask, render_template, g
+import json
+from time import perf_counter_ns
+
+import click
+from flask import Flask, render_template, g, request
 from config import config
 from utils.database import Database
+from utils.metrics import metrics
+from utils.sql_profiler import sql_profiler
+from utils.request_profiler import request_profiler
 
 # Импорт контроллеров (Blueprint)
 from controllers.auth import auth_bp
@@ -20,6 +27,17 @@ from controllers.developer import developer_bp
 from controllers.expert import expert_bp
 from controllers.chat import chat_bp
 from controllers.api import api_bp
+from controllers.monitoring import monitoring_bp
+from services.chat_pipeline import chat_pipeline
+from services.shadow_service import shadow_runner
+from services.assistant_catalog import assistant_catalog
+from services.knowledge_passages import backfill_passages
+from services.near_duplicates import backfill_signatures, backfill_question_groups
+
+# Длительность HTTP-запросов по маршруту (endpoint Blueprint, а не URL)
+HTTP_REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration', 'Длительность обработки HTTP-запросов', ('endpoint', 'method', 'status')
+)
 
 
 def create_app(config_name='development'):
@@ -43,12 +61,36 @@ def create_app(config_name='development'):
     app.register_blueprint(expert_bp, url_prefix='/expert')
     app.register_blueprint(chat_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(monitoring_bp)
+
+    # Фоновая обработка сообщений чата
+    chat_pipeline.init_app(app)
+    shadow_runner.init_app(app)
 
     # Обработчики событий приложения
     @app.before_request
     def before_request():
         """Выполняется перед каждым запросом"""
-        pass
+        g.request_started = perf_counter_ns()
+        request_profiler.start()
+
+    @app.after_request
+    def after_request(response):
+        """Замер длительности запроса по маршруту"""
+        started = g.pop('request_started', None)
+        if started is not None:
+            HTTP_REQUEST_LATENCY.observe(
+                (request.endpoint or 'unmatched', request.method, str(response.status_code)),
+                perf_counter_ns() - started
+            )
+        if sql_profiler.enabled:
+            sql_profiler.end_request()
+        return response
+
+    @app.teardown_request
+    def finish_profile(error):
+        """Сохранение профиля запроса (вызывается и при ошибке)"""
+        request_profiler.finish()
 
     @app.teardown_appcontext
     def close_db(error):
@@ -63,15 +105,160 @@ def create_app(config_name='development'):
         db = Database()
         stats = {
             'users': db.execute_one('SELECT COUNT(*) as count FROM users')['count'],
-            'assistants': db.execute_one('SELECT COUNT(*) as count FROM assistants')['count']
+            'assistants': len(assistant_catalog.current().assistants)
         }
         return render_template('index.html', stats=stats)
 
+    @app.cli.command('backfill-rendered')
+    def backfill_rendered():
+        """Рендеринг HTML ответов для сообщений, сохранённых ранее"""
+        from services.render_service import RenderService
+        count = RenderService.backfill()
+        print(f"✅ Обработано сообщений: {count}")
+
+    @app.cli.command('nlp-pipeline')
+    @click.option('--all', 'load_all', is_flag=True, help='Загрузить все этапы (для сравнения)')
+    def nlp_pipeline(load_all):
+        """Время загрузки и память этапов Natasha (Config.NLP_PIPELINE)"""
+        from services.nlp_service import NATASHA_AVAILABLE
+        if not NATASHA_AVAILABLE:
+            print("⚠️ Natasha не установлена, этапы не загружаются")
+            return
+        from services.natasha_pipeline import NatashaPipeline
+        pipeline = NatashaPipeline()
+        if load_all:
+            for stage in pipeline.factories:
+                pipeline.load(stage)
+
+        print(f"{'Этап':<16} {'Режим':<6} {'Загружен':<9} {'Время, с':>9} {'Память, МБ':>11}")
+        for item in pipeline.report():
+            seconds = f"{item['seconds']:.3f}" if item['seconds'] is not None else '—'
+            memory = f"{item['rss_kb'] / 1024:.1f}" if item['rss_kb'] is not None else '—'
+            print(f"{item['stage']:<16} {item['mode']:<6} {'да' if item['loaded'] else 'нет':<9} "
+                  f"{seconds:>9} {memory:>11}")
+        loaded = [item for item in pipeline.report() if item['loaded']]
+        print(f"Итого: {sum(i['seconds'] for i in loaded):.3f} с, "
+              f"{sum(i['rss_kb'] or 0 for i in loaded) / 1024:.1f} МБ")
+
+    @app.cli.command('replay-messages')
+    @click.option('--workers', type=int, default=None, help='Процессов NLP (0 - без пула)')
+    @click.option('--batch-size', type=int, default=500)
+    @click.option('--verified-only', is_flag=True, help='Только одобренные экспертами сообщения')
+    @click.option('--since', help='Сообщения начиная с даты (YYYY-MM-DD)')
+    @click.option('--limit', type=int, help='Максимум сообщений')
+    @click.option('--output', type=click.Path(dir_okay=False), help='Файл JSON-отчёта')
+    @click.option('--min-accuracy', type=float, help='Минимальная точность интентов по одобренным сообщениям')
+    def replay_messages(workers, batch_size, verified_only, since, limit, output, min_accuracy):
+        """Повторный прогон истории чатов через текущий NLP-конвейер"""
+        from services.replay_service import ReplayService
+        report = ReplayService.replay(workers, batch_size, verified_only, since, limit)
+
+        print(f"📊 Сообщений: {report['messages']} за {report['seconds']} с "
+              f"({report['messages_per_second']} сообщ./с, процессов: {report['workers']})")
+        for scope, title in (('verified', 'Одобренные экспертами'), ('unverified', 'Остальные')):
+            accuracy = report[scope]
+            if accuracy['messages']:
+                print(f"   {title}: {accuracy['messages']}, интент {accuracy['intent']:.1%}, "
+                      f"категория {accuracy['category']:.1%}")
+        for change in report['intent_changes'][:10]:
+            print(f"   {change['stored']} → {change['replayed']}: {change['count']}")
+
+        if output:
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"✅ Отчёт сохранён: {output}")
+
+        if min_accuracy is not None:
+            reference = report['verified'] if report['verified']['messages'] else report['all']
+            if reference['intent'] is not None and reference['intent'] < min_accuracy:
+                print(f"❌ Точность интентов {reference['intent']:.1%} ниже {min_accuracy:.1%}")
+                raise SystemExit(1)
+
+    @app.cli.command('import-knowledge')
+    @click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+    @click.option('--category', help='Категория статей без своей категории')
+    @click.option('--source', help='Источник (по умолчанию - имя файла для текстовых файлов)')
+    @click.option('--unverified', is_flag=True, help='Не отмечать статьи как проверенные')
+    @click.option('--workers', type=int, default=None, help='Процессов лемматизации (0 - без пула)')
+    @click.option('--batch-size', type=int, default=None, help='Статей в одной транзакции')
+    @click.option('--keep-indexes', is_flag=True, help='Не удалять индексы на время загрузки')
+    def import_knowledge(paths, category, source, unverified, workers, batch_size, keep_indexes):
+        """Массовый импорт статей базы знаний из JSONL и текстовых файлов (каталогов)"""
+        from services.knowledge_import import KnowledgeImporter
+
+        def progress(stats):
+            print(f"   {stats['inserted']} статей, {stats['rate']} статей/с", flush=True)
+
+        importer = KnowledgeImporter(workers, batch_size,
+                                     rebuild_indexes=app.config['KNOWLEDGE_IMPORT_REBUILD_INDEXES'] and not keep_indexes)
+        stats = importer.run(list(paths), category=category, source=source, verified=not unverified,
+                             progress=progress)
+        print(f"✅ Импортировано статей: {stats['inserted']} за {stats['seconds']} с "
+              f"({stats['rate']} статей/с), пропущено пустых: {stats['skipped']}")
+        for error in stats['errors'][:20]:
+            print(f"   ⚠️ {error}")
+        if len(stats['errors']) > 20:
+            print(f"   ... и ещё {len(stats['errors']) - 20} ошибок")
+
+    @app.cli.command('build-passages')
+    @click.option('--rebuild', is_flag=True, help='Построить фрагменты всех статей заново')
+    def build_passages(rebuild):
+        """Деление статей базы знаний на фрагменты (после изменения KNOWLEDGE_PASSAGE_*)"""
+        count = backfill_passages(rebuild=rebuild)
+        print(f"✅ Обработано статей: {count}")
+
+    @app.cli.command('train-intent-model')
+    @click.option('--full', is_flag=True, help='Обучить заново на всех одобренных сообщениях')
+    @click.option('--epochs', type=int, default=30)
+    @click.option('--features', type=int, default=None, help='Размер пространства признаков новой модели')
+    def train_intent_model(full, epochs, features):
+        """Обучение (дообучение) модели интентов на одобренных экспертами сообщениях"""
+        from services.intent_model import IntentModelTrainer
+        report = IntentModelTrainer.train(full=full, epochs=epochs, n_features=features)
+        if 'error' in report:
+            print(f"⚠️ Модель не обучена: {report['error']}")
+            raise SystemExit(1)
+
+        if report.get('up_to_date'):
+            print("✅ Новых одобренных сообщений нет, модель актуальна")
+        else:
+            print(f"✅ Модель обучена на {report['trained_on']} сообщениях за {report['seconds']} с "
+                  f"(всего одобрено {report['samples']}): {app.config['NLP_INTENT_MODEL_PATH']}")
+        if report['holdout']:
+            print(f"   Отложено для проверки: {report['holdout']}")
+            print(f"   Точность: модель {report['model_accuracy']:.1%}, "
+                  f"ключевые слова {report['keyword_accuracy']:.1%}")
+            if report['corrected']:
+                print(f"   На интентах, исправленных экспертами ({report['corrected']}): "
+                      f"модель {report['model_accuracy_corrected']:.1%}, "
+                      f"ключевые слова {report['keyword_accuracy_corrected']:.1%}")
+            else:
+                print("   ⚠️ Метки - интенты самого конвейера (эксперты их не исправляли): "
+                      "сравнение с ключевыми словами завышено в их пользу")
+            print(f"   Задержка, мкс/запрос: модель {report['model_us']} (пачкой {report['model_batch_us']}), "
+                  f"ключевые слова {report['keyword_us']}")
+
     # Инициализация БД
     with app.app_context():
         db = Database()
         db.init_database()
 
+        # Статьи БД предыдущих версий и вставленные мимо KnowledgeService
+        passages_built = backfill_passages()
+        if passages_built:
+            print(f"✅ Статьи разделены на фрагменты: {passages_built}")
+        signatures_built = backfill_signatures()
+        if signatures_built:
+            print(f"✅ Подписи почти дубликатов статей: {signatures_built}")
+        questions_grouped = backfill_question_groups()
+        if questions_grouped:
+            print(f"✅ Непроверенные вопросы разбиты на группы похожих: {questions_grouped}")
+
+        # Сообщения чата, принятые процессом до перезапуска или падения
+        requeued, failed = chat_pipeline.recover()
+        if requeued or failed:
+            print(f"♻️ Зависшие сообщения: повторно в очереди {requeued}, отмечено failed {failed}")
+
         # Добавление демо-данных если БД пустая
         users_count = db.execute_one('SELECT COUNT(*) as count FROM users')['count']
         if users_count == 0:
@@ -129,7 +316,7 @@ def init_demo_data(db):
         except Exception as e:
             print(f"   ✗ Ошибка при создании помощника {name}: {e}")
 
-    db.commit()
+    assistant_catalog.invalidate(db)
     print("\n✅ Демо-данные успешно добавлены!")
     print("\n" + "=" * 60)
     print("📊 ДОСТУПНЫЕ ПОЛЬЗОВАТЕЛИ:")
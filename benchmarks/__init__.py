@@ -0,0 +1,4 @@
+"""
+Бенчмарки производительности платформы
+Запускаются как модули: python -m benchmarks.<имя>
+"""
@@ -0,0 +1,280 @@
+"""
+Нагрузочный бенчмарк основных маршрутов платформы
+Прогоняет сценарии через тестовый клиент Flask и через настоящий WSGI-сервер
+на синтетической БД и сохраняет пропускную способность и перцентили в JSON
+
+Запуск:
+    python -m benchmarks.bench_endpoints --messages 100000 --requests 200 --output bench.json
+    python -m benchmarks.bench_endpoints --db /tmp/bench.db --baseline bench.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import http.cookiejar
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from benchmarks.bench_nlp_pool import QUERIES
+from benchmarks.seed import seed_database
+
+# Учётные записи демо-данных приложения
+ACCOUNTS = {
+    'admin': ('admin', 'admin123'),
+    'expert': ('expert', 'expert123'),
+    'client': ('client', 'client123'),
+}
+
+# Сценарий: (имя, роль или None, метод, путь, тело запроса, вид тела, ожидаемый статус)
+SCENARIOS = [
+    ('login', None, 'POST', '/login', lambda i: {'username': 'client', 'password': 'client123'}, 'form', 302),
+    ('chat_page', 'client', 'GET', '/chat', None, None, 200),
+    ('chat_send', 'client', 'POST', '/api/chat/send',
+     lambda i: {'message': QUERIES[i % len(QUERIES)], 'assistant_id': 1}, 'json', 200),
+    ('nlp_analyze', 'client', 'POST', '/api/nlp/analyze',
+     lambda i: {'text': QUERIES[i % len(QUERIES)]}, 'json', 200),
+    ('knowledge_search', 'client', 'POST', '/api/knowledge/search',
+     lambda i: {'query': ('аренды квартиры', 'алименты', 'наследство', 'налог')[i % 4]}, 'json', 200),
+    ('admin_panel', 'admin', 'GET', '/admin/', None, None, 200),
+    ('expert_panel', 'expert', 'GET', '/expert/', None, None, 200),
+]
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по отсортированному списку (nearest-rank)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class TestClientSession:
+    """Сессия пользователя через тестовый клиент Flask (без сети)"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, kind=None):
+        """Запрос, возвращает HTTP-статус"""
+        kwargs = {'json': body} if kind == 'json' else {'data': body} if kind == 'form' else {}
+        response = self.client.open(path, method=method, **kwargs)
+        response.get_data()
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Редиректы не выполняются - измеряется сам запрос"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """Сессия пользователя через HTTP к запущенному WSGI-серверу"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, body=None, kind=None):
+        """Запрос, возвращает HTTP-статус"""
+        data, headers = None, {}
+        if kind == 'json':
+            data, headers = json.dumps(body).encode('utf-8'), {'Content-Type': 'application/json'}
+        elif kind == 'form':
+            data = urllib.parse.urlencode(body).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def run_scenario(new_session, scenario, total, concurrency):
+    """
+    Прогон сценария: concurrency потоков, у каждого своя сессия.
+
+    Returns:
+        dict: Число запросов, ошибок, запросов в секунду и перцентили (мс)
+    """
+    name, role, method, path, make_body, kind, expected = scenario
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = new_session()
+            if role:
+                username, password = ACCOUNTS[role]
+                local.session.request('POST', '/login', {'username': username, 'password': password}, 'form')
+        return local.session
+
+    def task(i):
+        current = session()
+        body = make_body(i) if make_body else None
+        started = time.perf_counter()
+        status = current.request(method, path, body, kind)
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, range(concurrency)))  # вход и прогрев каждой сессии
+        started = time.perf_counter()
+        results = list(pool.map(task, range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    return {
+        'scenario': name,
+        'requests': total,
+        'errors': sum(1 for _, status in results if status != expected),
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+    }
+
+
+@contextlib.contextmanager
+def wsgi_server(app):
+    """Многопоточный WSGI-сервер werkzeug на свободном порту"""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def _git_revision():
+    """Текущий коммит (для сравнения отчётов)"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """
+    Сравнение p95 и пропускной способности с базовым отчётом.
+
+    Returns:
+        list: Описания регрессий (пустой список - регрессий нет)
+    """
+    base = {(r['driver'], r['scenario']): r for r in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        previous = base.get((result['driver'], result['scenario']))
+        if not previous:
+            continue
+        p95_change = result['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0
+        rps_change = result['rps'] / previous['rps'] - 1 if previous['rps'] else 0.0
+        print(f"{result['driver']:<7} {result['scenario']:<18} p95 {p95_change:+7.1%}  rps {rps_change:+7.1%}")
+        if p95_change > tolerance or rps_change < -tolerance:
+            regressions.append(f"{result['driver']}/{result['scenario']}: p95 {p95_change:+.1%}, rps {rps_change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='Готовая БД (иначе создаётся синтетическая)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на сценарий')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--drivers', default='client,wsgi')
+    parser.add_argument('--scenarios', default=','.join(s[0] for s in SCENARIOS))
+    parser.add_argument('--output', help='Файл JSON-отчёта')
+    parser.add_argument('--baseline', help='Отчёт для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение (доля)')
+    args = parser.parse_args()
+
+    dataset = None
+    if args.db:
+        Config.DATABASE = args.db
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        print(f'Создание синтетической БД {path} ...')
+        dataset = seed_database(path, users=args.users, messages=args.messages,
+                                logs=args.logs, articles=args.articles)
+        print(dataset)
+
+    # NLP в потоке запроса: измеряется сам веб-слой, а не пул процессов
+    Config.NLP_POOL_SIZE = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        app = create_app('production')
+    # Сервер бенчмарка работает по http, иначе cookie сессии не отправляется
+    app.config['SESSION_COOKIE_SECURE'] = False
+
+    selected = [s for s in SCENARIOS if s[0] in args.scenarios.split(',')]
+    report = {
+        'meta': {
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'database': Config.DATABASE,
+            'dataset': dataset,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': [],
+    }
+
+    for driver in args.drivers.split(','):
+        with contextlib.ExitStack() as stack:
+            if driver == 'client':
+                new_session = lambda: TestClientSession(app)
+            elif driver == 'wsgi':
+                base_url = stack.enter_context(wsgi_server(app))
+                new_session = lambda: HttpSession(base_url)
+            else:
+                parser.error(f'Неизвестный драйвер: {driver}')
+
+            for scenario in selected:
+                result = dict(driver=driver, **run_scenario(new_session, scenario, args.requests, args.concurrency))
+                report['results'].append(result)
+                print(f"{driver:<7} {result['scenario']:<18} {result['rps']:>9} req/s  "
+                      f"p50 {result['p50_ms']:>8} мс  p95 {result['p95_ms']:>8} мс  "
+                      f"p99 {result['p99_ms']:>8} мс  ошибок {result['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Отчёт сохранён: {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print('Регрессии:\n  ' + '\n  '.join(regressions))
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Бенчмарк стоимости записи замеров в метрики
+Проверяет, что отметка этапа и запись в гистограмму дешевле микросекунды
+
+Запуск:
+    python -m benchmarks.bench_metrics --iterations 1000000
+"""
+import argparse
+import time
+
+from utils.metrics import Histogram, HistogramFamily, StageTimer
+
+
+def measure(name, func, iterations):
+    """Среднее время одного вызова func, нс"""
+    started = time.perf_counter_ns()
+    func(iterations)
+    elapsed = (time.perf_counter_ns() - started) / iterations
+    print(f"{name:<40} {elapsed:8.1f} нс")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    histogram = Histogram()
+    family = HistogramFamily('bench', '', ('stage', 'intent'))
+
+    def empty_loop(n):
+        for _ in range(n):
+            pass
+
+    def observe(n):
+        for i in range(n):
+            histogram.observe(i & 0xFFFFF)
+
+    def labeled_observe(n):
+        labels = ('intent', 'развод')
+        for i in range(n):
+            family.observe(labels, i & 0xFFFFF)
+
+    def mark(n):
+        timer = StageTimer()
+        for _ in range(n):
+            timer.mark('intent')
+            if len(timer.timings) > 64:
+                timer.timings.clear()
+
+    baseline = measure('пустой цикл', empty_loop, args.iterations)
+    spans = [
+        measure('Histogram.observe', observe, args.iterations),
+        measure('HistogramFamily.observe', labeled_observe, args.iterations),
+        measure('StageTimer.mark', mark, args.iterations),
+    ]
+    span_cost = spans[1] + spans[2] - 2 * baseline
+    print(f"{'замер этапа (mark + запись)':<40} {span_cost:8.1f} нс  {'OK' if span_cost < 1000 else 'ДОРОЖЕ 1 мкс'}")
+
+
+if __name__ == '__main__':
+    main()
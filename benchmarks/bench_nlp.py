@@ -0,0 +1,526 @@
+"""
+Микробенчмарк NLP-анализа на размеченном корпусе юридических запросов
+Задержка rule-based и Natasha анализа, пропускная способность с кэшем
+и без, пакетный анализ, память после прогрева, точность классификации,
+исправление опечаток, профили помощников и обученная модель интентов (если есть)
+
+Запуск:
+    python -m benchmarks.bench_nlp --output nlp.json
+    python -m benchmarks.bench_nlp --baseline benchmarks/baselines/nlp.json --tolerance 0.3
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import time
+import tracemalloc
+from collections import Counter
+
+from utils.metrics import NULL_TIMER
+from benchmarks.bench_endpoints import percentile, _git_revision
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'data', 'nlp_corpus.jsonl')
+TYPOS = os.path.join(os.path.dirname(__file__), 'data', 'nlp_typos.jsonl')
+INFLECTED = os.path.join(os.path.dirname(__file__), 'data', 'nlp_inflected.jsonl')
+
+
+def load_corpus(path=CORPUS):
+    """
+    Загрузка размеченного корпуса.
+
+    Returns:
+        list: Записи {text, intent, category}
+    """
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def measure_latency(func, texts, repeat):
+    """
+    Задержка одного вызова func(text) в микросекундах.
+
+    Returns:
+        dict: Перцентили и среднее
+    """
+    samples = []
+    for _ in range(repeat):
+        for text in texts:
+            started = time.perf_counter_ns()
+            func(text)
+            samples.append((time.perf_counter_ns() - started) / 1000)
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'mean_us': round(sum(samples) / len(samples), 2),
+        'p50_us': round(percentile(samples, 0.50), 2),
+        'p95_us': round(percentile(samples, 0.95), 2),
+        'p99_us': round(percentile(samples, 0.99), 2),
+    }
+
+
+def measure_throughput(func, texts, total):
+    """Запросов в секунду при total вызовах func(text)"""
+    started = time.perf_counter()
+    for i in range(total):
+        func(texts[i % len(texts)])
+    return round(total / (time.perf_counter() - started), 1)
+
+
+def measure_accuracy(nlp, corpus):
+    """
+    Точность определения интента и категории.
+
+    Returns:
+        dict: Доли верных ответов, точность по интентам и ошибки
+    """
+    per_intent = {}
+    errors = []
+    intent_hits = category_hits = 0
+    for item in corpus:
+        analysis = nlp.analyze(item['text'])
+        intent_ok = analysis['intent'] == item['intent']
+        category_ok = analysis['category'] == item['category']
+        intent_hits += intent_ok
+        category_hits += category_ok
+        hits, total = per_intent.get(item['intent'], (0, 0))
+        per_intent[item['intent']] = (hits + intent_ok, total + 1)
+        if not (intent_ok and category_ok):
+            errors.append({
+                'text': item['text'],
+                'expected': f"{item['intent']} / {item['category']}",
+                'actual': f"{analysis['intent']} / {analysis['category']}",
+            })
+    return {
+        'intent': round(intent_hits / len(corpus), 4),
+        'category': round(category_hits / len(corpus), 4),
+        'per_intent': {intent: round(hits / total, 4) for intent, (hits, total) in sorted(per_intent.items())},
+        'errors': errors,
+    }
+
+
+def measure_cascade(corpus, natasha_available):
+    """
+    Каскадный классификатор: доля запросов, переданных в Natasha, и
+    сравнение с полным конвейером (каждый запрос через Natasha).
+
+    Returns:
+        dict: Доли решений каскада, а при наличии Natasha - совпадение
+            интентов с полным конвейером, средняя разница уверенности
+            при совпавшем интенте, точность и задержка обоих
+    """
+    from services.nlp_service import NLPService
+
+    nlp = NLPService(use_natasha=False, cache_size=0)
+    reasons = Counter(nlp.cascade_decision(item['text'].lower().strip())[2] for item in corpus)
+    report = {
+        'escalation_rate': round(1 - reasons['confident'] / len(corpus), 4),
+        'reasons': {reason: round(count / len(corpus), 4) for reason, count in sorted(reasons.items())},
+    }
+    if not natasha_available:
+        return report
+
+    full = NLPService(cache_size=0, cascade=False)
+    cascade = NLPService(cache_size=0, cascade=True)
+    texts = [item['text'] for item in corpus]
+    pairs = [(full.analyze(text), cascade.analyze(text)) for text in texts]
+    agreed = [(a['confidence'], b['confidence']) for a, b in pairs if a['intent'] == b['intent']]
+    report['agreement_with_full'] = round(len(agreed) / len(corpus), 4)
+    # Уверенность каскада и полного конвейера - на одной шкале: при совпавшем интенте разница мала
+    report['confidence_gap'] = round(sum(abs(a - b) for a, b in agreed) / len(agreed), 4) if agreed else None
+    report['full_accuracy'] = measure_accuracy(full, corpus)['intent']
+    report['cascade_accuracy'] = measure_accuracy(cascade, corpus)['intent']
+    report['full_latency'] = measure_latency(full.analyze, texts, 3)
+    report['cascade_latency'] = measure_latency(cascade.analyze, texts, 3)
+    return report
+
+
+def make_typos(corpus, seed=0):
+    """
+    Запросы корпуса с одной опечаткой (замена, пропуск, перестановка или
+    лишняя буква) в слове с ключевым словом интента.
+
+    Returns:
+        list: Записи {text, intent} (только запросы, где нашлось такое слово)
+    """
+    from services.nlp_rules import nlp_rules
+
+    rng = random.Random(seed)
+    keywords = dict(nlp_rules.current().keywords)
+    alphabet = 'абвгдежзийклмнопрстуфхцчшщьыэюя'
+    typos = []
+    for item in corpus:
+        words = item['text'].lower().split()
+        positions = [i for i, word in enumerate(words)
+                     if len(word) >= 5 and any(kw in word for kw in keywords.get(item['intent'], ()))]
+        if not positions:
+            continue
+        i = rng.choice(positions)
+        word = words[i]
+        j = rng.randrange(1, len(word) - 1)
+        edit = rng.choice(('replace', 'delete', 'transpose', 'insert'))
+        if edit == 'replace':
+            word = word[:j] + rng.choice(alphabet.replace(word[j], '')) + word[j + 1:]
+        elif edit == 'delete':
+            word = word[:j] + word[j + 1:]
+        elif edit == 'transpose':
+            word = word[:j - 1] + word[j] + word[j - 1] + word[j + 1:]
+        else:
+            word = word[:j] + rng.choice(alphabet) + word[j:]
+        words[i] = word
+        typos.append({'text': ' '.join(words), 'intent': item['intent']})
+    return typos
+
+
+def measure_spelling(corpus, typos, inflected=()):
+    """
+    Исправление опечаток: доля запросов с опечатками, для которых интент
+    определяется верно с исправлением и без него, задержка исправления
+    и влияние на точность по корпусу без опечаток. Запросы inflected
+    написаны верно (формы ключевых слов): исправление не должно менять
+    в них ни слов, ни интента. Словарь - только основы ключевых слов
+    (статьи базы знаний без приложения недоступны).
+
+    Returns:
+        dict: Точность на опечатках (ручных и сгенерированных), проверка
+            верно написанных запросов и задержка
+    """
+    from services.nlp_service import NLPService
+    from services.spelling import spelling
+
+    plain = NLPService(use_natasha=False, cache_size=0, spelling_correction=False)
+    corrected = NLPService(use_natasha=False, cache_size=0, spelling_correction=True)
+    index = spelling.current()
+
+    def recovery(items):
+        before = sum(plain.analyze(item['text'])['intent'] == item['intent'] for item in items)
+        after = sum(corrected.analyze(item['text'])['intent'] == item['intent'] for item in items)
+        return {
+            'queries': len(items),
+            'accuracy_without': round(before / len(items), 4),
+            'accuracy_with': round(after / len(items), 4),
+            'recovered': round((after - before) / len(items), 4),
+        }
+
+    generated = make_typos(corpus)
+    texts = [item['text'].lower().strip() for item in typos + generated]
+
+    def uncached(text):
+        index._lookups.clear()
+        index.correct(text)
+
+    clean = inflected or corpus
+    return {
+        'vocabulary': len(index),
+        'manual': recovery(typos),
+        'generated': recovery(generated),
+        'inflected': {
+            **recovery(clean),
+            'rewritten': sum(len(index.correct(item['text'].lower().strip())[1]) for item in clean),
+        },
+        'clean_accuracy_without': round(sum(plain.analyze(item['text'])['intent'] == item['intent']
+                                            for item in corpus) / len(corpus), 4),
+        'latency': measure_latency(index.correct, texts, 5),
+        'latency_uncached': measure_latency(uncached, texts, 5),
+    }
+
+
+def measure_profiles(corpus, repeat):
+    """
+    Профили помощников: запросы корпуса, относящиеся к специализации
+    помощника, оцениваются по всем правилам и по правилам профиля.
+
+    Returns:
+        dict: По профилям - число интентов, задержка оценки ключевых слов
+            и точность определения интента в обоих вариантах
+    """
+    from config import Config
+    from services.assistant_profiles import assistant_profiles
+    from services.nlp_service import NLPService, tracer
+
+    nlp = NLPService(use_natasha=False, cache_size=0)
+    rules = nlp.rules()
+    quiet = tracer.begin()
+    report = {}
+    for name in Config.NLP_ASSISTANT_PROFILES:
+        profile = assistant_profiles.get(name, rules)
+        items = [item for item in corpus if item['category'] in profile.categories]
+        if not items:
+            continue
+        texts = [item['text'].lower().strip() for item in items]
+
+        def accuracy(selected):
+            hits = sum(nlp._classify(text, NULL_TIMER, quiet, None, rules, selected)[0] == item['intent']
+                       for text, item in zip(texts, items))
+            return round(hits / len(items), 4)
+
+        report[name] = {
+            'queries': len(items),
+            'intents': len(profile.intents),
+            'all_intents': len(rules.keywords),
+            'scores_all': measure_latency(lambda text: nlp._rule_based_scores(text, rules), texts, repeat),
+            'scores_profile': measure_latency(lambda text: nlp._rule_based_scores(text, profile.rules),
+                                              texts, repeat),
+            'accuracy_all': accuracy(None),
+            'accuracy_profile': accuracy(profile),
+        }
+    return report
+
+
+def measure_intent_model(corpus, path=None):
+    """
+    Обученная модель интентов (flask train-intent-model) на корпусе:
+    точность и задержка по одному запросу и пачкой.
+
+    Returns:
+        dict: Отчёт или None, если NumPy не установлен или модель не обучена
+    """
+    from config import Config
+    from services.intent_model import IntentModel, NUMPY_AVAILABLE
+
+    path = path or Config.NLP_INTENT_MODEL_PATH
+    if not NUMPY_AVAILABLE or not os.path.exists(path):
+        return None
+    model = IntentModel.load(path)
+    texts = [item['text'] for item in corpus]
+    predictions = model.predict(texts)
+    confident = [(item, intent) for item, (intent, probability) in zip(corpus, predictions)
+                 if probability >= Config.NLP_INTENT_MODEL_MIN_CONFIDENCE]
+    started = time.perf_counter()
+    model.predict(texts)
+    batch_us = (time.perf_counter() - started) / len(texts) * 1e6
+    return {
+        'samples': model.meta.get('samples'),
+        'accuracy': round(sum(intent == item['intent'] for item, (intent, _) in zip(corpus, predictions))
+                          / len(corpus), 4),
+        'coverage': round(len(confident) / len(corpus), 4),
+        'confident_accuracy': round(sum(intent == item['intent'] for item, intent in confident)
+                                    / len(confident), 4) if confident else None,
+        'latency': measure_latency(lambda text: model.predict([text]), texts, 3),
+        'batch_us': round(batch_us, 2),
+    }
+
+
+def measure_memory(texts, use_natasha):
+    """
+    Память, занятая NLPService после загрузки моделей и прогрева.
+
+    Returns:
+        dict: Прирост памяти Python-объектов (tracemalloc) и пиковый RSS процесса
+    """
+    from services.nlp_service import NLPService
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    nlp = NLPService(use_natasha=use_natasha)
+    for text in texts:
+        nlp.analyze(text)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return {
+        'python_kb': round(allocated / 1024, 1),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(corpus, repeat, total, typos=(), inflected=()):
+    """
+    Полный прогон бенчмарка.
+
+    Returns:
+        dict: Отчёт (latency, throughput, memory, accuracy)
+    """
+    from services.nlp_service import NLPService, NATASHA_AVAILABLE, tracer
+
+    texts = [item['text'] for item in corpus]
+    lowered = [text.lower().strip() for text in texts]
+    memory = measure_memory(texts, NATASHA_AVAILABLE)
+
+    nlp = NLPService(cache_size=0)
+    cached = NLPService(cache_size=len(texts))
+    quiet = tracer.begin()
+
+    def rule_based(text):
+        intent, _ = nlp._analyze_rule_based(text)
+        nlp._detect_category(intent, text)
+
+    latency = {'rule_based': measure_latency(rule_based, lowered, repeat)}
+    if NATASHA_AVAILABLE:
+        def natasha(text):
+            intent, _ = nlp._analyze_with_natasha(text, NULL_TIMER, quiet)
+            nlp._detect_category(intent, text)
+        latency['natasha'] = measure_latency(natasha, lowered, repeat)
+
+    # Пакет с повторами, как в истории чатов: популярные вопросы задают часто
+    batch = texts * 4
+    throughput = {
+        'analyze_no_cache': measure_throughput(nlp.analyze, texts, total),
+        'analyze_cache': measure_throughput(cached.analyze, texts, total),
+    }
+    started = time.perf_counter()
+    for _ in range(max(1, total // len(batch))):
+        nlp.analyze_batch(batch)
+    throughput['analyze_batch'] = round(max(1, total // len(batch)) * len(batch) / (time.perf_counter() - started), 1)
+
+    return {
+        'meta': {
+            'git': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'natasha': NATASHA_AVAILABLE,
+            'corpus': len(corpus),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'latency': latency,
+        'throughput': throughput,
+        'memory': memory,
+        'accuracy': measure_accuracy(nlp, corpus),
+        'cascade': measure_cascade(corpus, NATASHA_AVAILABLE),
+        'spelling': measure_spelling(corpus, typos, inflected) if typos else None,
+        'profiles': measure_profiles(corpus, repeat),
+        'intent_model': measure_intent_model(corpus),
+    }
+
+
+def compare(report, baseline, tolerance, accuracy_tolerance):
+    """
+    Сравнение с базовым отчётом: точность не должна падать больше
+    accuracy_tolerance, p95 задержки и пропускная способность - больше tolerance.
+
+    Returns:
+        list: Описания регрессий (пустой список - регрессий нет)
+    """
+    regressions = []
+    spelling, previous = report.get('spelling') or {}, baseline.get('spelling') or {}
+    inflected = spelling.get('inflected')
+    if inflected:
+        # Не зависит от базового отчёта: верно написанные слова не исправляются никогда
+        print(f"верно написанные запросы      исправлено слов {inflected['rewritten']}, "
+              f"интент {inflected['accuracy_without']:.2%} → {inflected['accuracy_with']:.2%}")
+        if inflected['rewritten'] or inflected['accuracy_with'] < inflected['accuracy_without']:
+            regressions.append(f"исправление меняет верно написанные запросы: слов {inflected['rewritten']}")
+    for key in ('manual', 'generated'):
+        if key in spelling and key in previous:
+            change = spelling[key]['accuracy_with'] - previous[key]['accuracy_with']
+            print(f"опечатки {key:<22} {spelling[key]['accuracy_with']:.2%} ({change:+.2%})")
+            if change < -accuracy_tolerance:
+                regressions.append(f'точность на опечатках ({key}): {change:+.2%}')
+    profiles, previous = report.get('profiles') or {}, baseline.get('profiles') or {}
+    for name, result in profiles.items():
+        if name in previous:
+            change = result['accuracy_profile'] - previous[name]['accuracy_profile']
+            print(f"профиль {name:<22} {result['accuracy_profile']:.2%} ({change:+.2%})")
+            if change < -accuracy_tolerance:
+                regressions.append(f'точность профиля {name}: {change:+.2%}')
+    cascade, previous = report.get('cascade', {}), baseline.get('cascade', {})
+    if 'agreement_with_full' in cascade and 'agreement_with_full' in previous:
+        change = cascade['agreement_with_full'] - previous['agreement_with_full']
+        print(f"каскад vs полный конвейер     {cascade['agreement_with_full']:.2%} ({change:+.2%})")
+        if change < -accuracy_tolerance:
+            regressions.append(f'совпадение каскада с полным конвейером: {change:+.2%}')
+    for key in ('intent', 'category'):
+        change = report['accuracy'][key] - baseline['accuracy'][key]
+        print(f"точность {key:<22} {report['accuracy'][key]:.2%} ({change:+.2%})")
+        if change < -accuracy_tolerance:
+            regressions.append(f'точность {key}: {change:+.2%}')
+
+    for name, result in report['latency'].items():
+        previous = baseline['latency'].get(name)
+        if not previous:
+            continue
+        change = result['p95_us'] / previous['p95_us'] - 1 if previous['p95_us'] else 0.0
+        print(f'p95 {name:<27} {result["p95_us"]:>9} мкс ({change:+.1%})')
+        if change > tolerance:
+            regressions.append(f'p95 {name}: {change:+.1%}')
+
+    for name, rps in report['throughput'].items():
+        previous = baseline['throughput'].get(name)
+        if not previous:
+            continue
+        change = rps / previous - 1
+        print(f'{name:<31} {rps:>9} req/s ({change:+.1%})')
+        if change < -tolerance:
+            regressions.append(f'{name}: {change:+.1%}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS)
+    parser.add_argument('--typos', default=TYPOS, help='Запросы с опечатками')
+    parser.add_argument('--inflected', default=INFLECTED, help='Верно написанные запросы с формами ключевых слов')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов корпуса при замере задержки')
+    parser.add_argument('--queries', type=int, default=20000, help='Вызовов при замере пропускной способности')
+    parser.add_argument('--output', help='Файл JSON-отчёта')
+    parser.add_argument('--baseline', help='Отчёт для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Допустимое ухудшение скорости (доля)')
+    parser.add_argument('--accuracy-tolerance', type=float, default=0.0, help='Допустимое падение точности')
+    args = parser.parse_args()
+
+    report = run(load_corpus(args.corpus), args.repeat, args.queries, load_corpus(args.typos),
+                 load_corpus(args.inflected))
+
+    for name, result in report['latency'].items():
+        print(f"{name:<12} p50 {result['p50_us']:>8} мкс  p95 {result['p95_us']:>8} мкс  "
+              f"p99 {result['p99_us']:>8} мкс")
+    if 'natasha' not in report['latency']:
+        print('natasha      не установлена, замер пропущен')
+    for name, rps in report['throughput'].items():
+        print(f'{name:<18} {rps:>10} req/s')
+    print(f"память: {report['memory']['python_kb']} КБ Python-объектов, "
+          f"пиковый RSS {report['memory']['max_rss_kb']} КБ")
+    accuracy = report['accuracy']
+    print(f"точность: интент {accuracy['intent']:.1%}, категория {accuracy['category']:.1%}")
+    for error in accuracy['errors']:
+        print(f"  {error['text']!r}: ожидалось {error['expected']}, получено {error['actual']}")
+    cascade = report['cascade']
+    print(f"каскад: в Natasha {cascade['escalation_rate']:.1%} запросов "
+          f"({', '.join(f'{reason} {share:.1%}' for reason, share in cascade['reasons'].items())})")
+    if 'agreement_with_full' in cascade:
+        print(f"каскад vs полный конвейер: совпадение интентов {cascade['agreement_with_full']:.1%}, "
+              f"точность {cascade['cascade_accuracy']:.1%} / {cascade['full_accuracy']:.1%}, "
+              f"p50 {cascade['cascade_latency']['p50_us']} / {cascade['full_latency']['p50_us']} мкс, "
+              f"разница уверенности {cascade['confidence_gap']}")
+    spelling = report['spelling']
+    if spelling:
+        for key, title in (('manual', 'ручные'), ('generated', 'сгенерированные')):
+            result = spelling[key]
+            print(f"опечатки ({title}, {result['queries']}): интент {result['accuracy_without']:.1%} "
+                  f"→ {result['accuracy_with']:.1%} с исправлением")
+        print(f"исправление опечаток: p50 {spelling['latency']['p50_us']} мкс, "
+              f"p95 {spelling['latency']['p95_us']} мкс на запрос, без кэша слов "
+              f"p50 {spelling['latency_uncached']['p50_us']} мкс (словарь {spelling['vocabulary']}); "
+              f"точность без опечаток {spelling['clean_accuracy_without']:.1%} без исправления")
+        inflected = spelling['inflected']
+        print(f"верно написанные запросы ({inflected['queries']}): исправлено слов {inflected['rewritten']}, "
+              f"интент {inflected['accuracy_without']:.1%} → {inflected['accuracy_with']:.1%}")
+    for name, result in report['profiles'].items():
+        print(f"профиль «{name}» ({result['queries']} запросов): интентов {result['intents']} "
+              f"из {result['all_intents']}, оценка ключевых слов p50 {result['scores_profile']['p50_us']} "
+              f"/ {result['scores_all']['p50_us']} мкс, точность {result['accuracy_profile']:.1%} "
+              f"/ {result['accuracy_all']:.1%} (профиль / все правила)")
+    model = report['intent_model']
+    if model:
+        print(f"модель интентов ({model['samples']} примеров): точность {model['accuracy']:.1%}, "
+              f"уверена в {model['coverage']:.1%} запросов, p50 {model['latency']['p50_us']} мкс, "
+              f"пачкой {model['batch_us']} мкс/запрос")
+    else:
+        print('модель интентов не обучена или NumPy не установлен, замер пропущен')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'Отчёт сохранён: {args.output}')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.accuracy_tolerance)
+        if regressions:
+            print('Регрессии:\n  ' + '\n  '.join(regressions))
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк пропускной способности пула NLP-процессов
+Показывает масштабирование NLPExecutor по числу ядер
+
+Запуск:
+    python -m benchmarks.bench_nlp_pool --queries 400 --sizes 0,1,2,4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+QUERIES = [
+    'Как оформить договор аренды квартиры?',
+    'Что нужно для продажи квартиры?',
+    'Как подать на развод?',
+    'Как взыскать алименты на ребенка?',
+    'Как составить исковое заявление в суд?',
+    'Нужна доверенность на представительство в суде',
+    'Как получить налоговый вычет за квартиру?',
+    'Меня хотят уволить с работы, что делать?',
+    'Как оформить наследство по завещанию?',
+    'Хочу написать жалобу на управляющую компанию',
+]
+
+
+def run(app, pool_size, total, concurrency):
+    """
+    Прогон total запросов через NLPExecutor заданного размера.
+
+    Returns:
+        dict: Пропускная способность и доля деградированных ответов
+    """
+    from services.nlp_executor import NLPExecutor
+
+    executor = NLPExecutor(pool_size=pool_size, timeout=60)
+
+    def task(i):
+        with app.app_context():
+            return executor.process_query(QUERIES[i % len(QUERIES)])
+
+    # Прогрев: запуск процессов и загрузка моделей
+    with ThreadPoolExecutor(max_workers=max(pool_size, 1)) as warmup:
+        list(warmup.map(task, range(max(pool_size, 1) * 2)))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(task, range(total)))
+    elapsed = time.perf_counter() - started
+
+    executor.shutdown()
+    return {
+        'pool_size': pool_size,
+        'queries': total,
+        'seconds': round(elapsed, 3),
+        'qps': round(total / elapsed, 1),
+        'degraded': sum(1 for r in results if r.get('degraded')),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cpu = os.cpu_count() or 1
+    default_sizes = sorted({0, 1, 2, max(cpu // 2, 1), cpu})
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--sizes', default=','.join(str(s) for s in default_sizes))
+    parser.add_argument('--concurrency', type=int, default=cpu * 2)
+    args = parser.parse_args()
+
+    Config.DATABASE = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    from app import create_app
+    app = create_app('production')
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        result = run(app, size, args.queries, args.concurrency)
+        results.append(result)
+        print(f"pool_size={size:>3}  {result['qps']:>8} req/s  degraded={result['degraded']}")
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Бенчмарк стоимости отладочной трассировки NLP
+Сравнивает пропускную способность NLPService с трассировкой выключенной,
+выборочной (TRACE_SAMPLE_RATE) и полной (TRACE_LEVEL=DEBUG)
+
+Запуск:
+    python -m benchmarks.bench_trace --queries 2000 --sample-rate 0.01
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from utils.trace import LOG_FORMAT
+from benchmarks.bench_nlp_pool import QUERIES
+
+
+def run(app, nlp, total, concurrency):
+    """
+    Прогон total запросов через NLPService в concurrency потоках.
+
+    Returns:
+        float: Запросов в секунду
+    """
+    def task(i):
+        with app.app_context():
+            return nlp.process_query(QUERIES[i % len(QUERIES)])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(task, range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--sample-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    Config.DATABASE = os.path.join(workdir, 'bench.db')
+    from app import create_app
+    from services.nlp_service import NLPService, tracer
+    app = create_app('production')
+    nlp = NLPService()
+
+    # Трассировка пишется в файл, как в контейнере с перенаправленным логом
+    log_path = os.path.join(workdir, 'trace.log')
+    handler = logging.FileHandler(log_path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger = logging.getLogger('legal_ai')
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    modes = [
+        ('off', 'WARNING', 0.0),
+        ('sampled', 'WARNING', args.sample_rate),
+        ('full', 'DEBUG', 0.0),
+    ]
+    results = []
+    for name, level, rate in modes:
+        tracer.configure(level=level, sample_rate=rate)
+        run(app, nlp, len(QUERIES), 1)  # прогрев
+        size_before = os.path.getsize(log_path)
+        qps = run(app, nlp, args.queries, args.concurrency)
+        handler.flush()
+        results.append({
+            'mode': name,
+            'level': level,
+            'sample_rate': rate,
+            'qps': round(qps, 1),
+            'log_bytes': os.path.getsize(log_path) - size_before,
+        })
+        print(f"{name:<8} {qps:>10.1f} req/s  лог: {results[-1]['log_bytes']} байт")
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Заполнение синтетической БД для бенчмарков
+Пользователи, помощники, сообщения чата, логи и статьи базы знаний
+
+Запуск:
+    python -m benchmarks.seed --db /tmp/bench.db --messages 1000000 --logs 1000000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from config import Config
+from benchmarks.bench_nlp_pool import QUERIES
+
+BENCH_PASSWORD = 'bench123'
+
+INTENTS = [
+    ('договор_аренды', 'гражданское_право'),
+    ('договор_купли_продажи', 'гражданское_право'),
+    ('трудовой_договор', 'трудовое_право'),
+    ('алименты', 'семейное_право'),
+    ('развод', 'семейное_право'),
+    ('наследство', 'наследственное_право'),
+    ('налог', 'налоговое_право'),
+    ('жалоба', 'судебное_право'),
+    ('исковое_заявление', 'судебное_право'),
+    ('общий_вопрос', 'общее_право'),
+]
+
+TOPICS = [
+    'аренды квартиры', 'купли-продажи квартиры', 'трудовой договор', 'брачный договор',
+    'алименты', 'расторжение брака', 'наследство', 'налог', 'жалоба', 'исковое заявление',
+    'доверенность', 'расторжение договора', 'защита прав потребителей', 'ДТП', 'ипотека',
+]
+
+WORDS = ('договор сторона право обязанность срок оплата суд заявление документ требование '
+         'ответственность имущество собственник гражданин работодатель работник ребенок '
+         'налоговый вычет квартира наследник завещание претензия неустойка').split()
+
+LOG_MODULES = ('auth', 'chat', 'admin', 'expert', 'developer', 'api')
+
+
+def _batches(rows, size):
+    """Разбиение генератора строк на пачки для executemany"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, sql, rows, batch_size):
+    """Вставка строк пачками, одна транзакция на пачку"""
+    total = 0
+    for batch in _batches(rows, batch_size):
+        conn.executemany(sql, batch)
+        conn.commit()
+        total += len(batch)
+    return total
+
+
+def _text(rnd, words):
+    """Случайный текст из словаря"""
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def seed_database(path, users=1000, assistants=20, messages=100000, logs=100000,
+                  articles=2000, batch_size=10000, seed=42):
+    """
+    Создание БД со схемой приложения и синтетическими данными.
+
+    Демо-пользователи (admin, developer, expert, client) создаются
+    приложением; синтетические получают пароль BENCH_PASSWORD.
+
+    Args:
+        path (str): Путь к файлу БД (перезаписывается)
+        users, assistants, messages, logs, articles (int): Объёмы данных
+        batch_size (int): Строк в одном executemany
+        seed (int): Зерно генератора (для воспроизводимости)
+
+    Returns:
+        dict: Объёмы созданных данных и время заполнения
+    """
+    from models.user import User
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    # Схема и демо-данные - тем же кодом, что и у приложения
+    Config.DATABASE = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import create_app
+        create_app('production')
+
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+
+    base_time = datetime(2025, 1, 1)
+
+    def timestamp(i, total):
+        return (base_time + timedelta(seconds=int(i * 300 * 24 * 3600 / max(total, 1)))).strftime('%Y-%m-%d %H:%M:%S')
+
+    password_hash = User.hash_password(BENCH_PASSWORD)
+    roles = ['client'] * 90 + ['expert'] * 6 + ['developer'] * 3 + ['admin']
+    counts = {'users': _insert(conn, '''
+        INSERT INTO users (username, email, password_hash, role, created_at, avatar_color)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((f'user{i}', f'user{i}@bench.local', password_hash, rnd.choice(roles),
+               timestamp(i, users), '#6c757d') for i in range(users)), batch_size)}
+
+    counts['assistants'] = _insert(conn, '''
+        INSERT INTO assistants (name, description, specialty, icon, color, created_by)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((f'Помощник {i}', _text(rnd, 8), rnd.choice(INTENTS)[1].replace('_', ' '), '⚖️', '#007bff', 1)
+              for i in range(assistants)), batch_size)
+
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+    assistant_ids = [row[0] for row in conn.execute('SELECT id FROM assistants')]
+
+    counts['knowledge_base'] = _insert(conn, '''
+        INSERT INTO knowledge_base (title, content, category, source, uploaded_by, uploaded_at, is_verified)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ((f'{rnd.choice(TOPICS).capitalize()}: статья {i}', _text(rnd, 120), rnd.choice(INTENTS)[1],
+               'бенчмарк', 3, timestamp(i, articles), rnd.random() < 0.8) for i in range(articles)), batch_size)
+
+    # Ответы повторяются (как шаблоны в реальной БД), поэтому их мало
+    responses = [_text(rnd, 60) for _ in range(200)]
+
+    def message_rows():
+        for i in range(messages):
+            intent, category = rnd.choice(INTENTS)
+            verified = rnd.random() < 0.3
+            yield (rnd.choice(user_ids), rnd.choice(assistant_ids), rnd.choice(QUERIES), rnd.choice(responses),
+                   intent, category, round(rnd.uniform(0.3, 0.95), 2), timestamp(i, messages),
+                   int(verified), 3 if verified else None)
+
+    counts['chat_messages'] = _insert(conn, '''
+        INSERT INTO chat_messages (user_id, assistant_id, message, response, intent, category,
+                                   confidence, created_at, is_verified, verified_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', message_rows(), batch_size)
+
+    levels = ['INFO'] * 90 + ['WARNING'] * 8 + ['ERROR'] * 2
+    counts['logs'] = _insert(conn, '''
+        INSERT INTO logs (level, message, module, user_id, ip_address, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', ((rnd.choice(levels), _text(rnd, 6), rnd.choice(LOG_MODULES), rnd.choice(user_ids),
+               f'10.0.{i % 256}.{i % 200}', timestamp(i, logs)) for i in range(logs)), batch_size)
+
+    conn.execute('ANALYZE')
+    conn.commit()
+    conn.close()
+
+    counts['seconds'] = round(time.perf_counter() - started, 1)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--assistants', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    counts = seed_database(args.db, args.users, args.assistants, args.messages, args.logs,
+                           args.articles, seed=args.seed)
+    print(counts)
+
+
+if __name__ == '__main__':
+    main()
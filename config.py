@@ -3,6 +3,8 @@
 """
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class Config:
     """Базовая конфигурация"""
@@ -19,6 +21,160 @@ class Config:
     # Настройки NLP
     NLP_ENABLED = True
     NLP_CONFIDENCE_THRESHOLD = 0.3
+    NLP_ANALYSIS_CACHE_SIZE = 4096  # результатов анализа в LRU-кэше процесса (0 - без кэша)
+
+    # Каскад: Natasha только если rule-based анализ не нашёл интент,
+    # два интента набрали поровну или запрос длиннее NLP_CASCADE_MAX_LENGTH символов
+    NLP_CASCADE_ENABLED = True
+    NLP_CASCADE_MAX_LENGTH = 160
+
+    # Ключевые слова, категории и запросы к базе знаний правятся в панели
+    # разработчика; процессы сверяют версию правил в БД с этим интервалом
+    NLP_RULES_RELOAD_INTERVAL = 10  # секунд
+
+    # Профили помощников: специализация (assistants.specialty, без учёта регистра) ->
+    # категории и интенты без собственной категории. Помощнику доступны только
+    # интенты этих категорий, а ответы ищутся среди статей этих категорий;
+    # помощники с другой специализацией работают со всеми правилами
+    NLP_ASSISTANT_PROFILES = {
+        'гражданское право': {
+            'categories': ('гражданское_право', 'жилищное_право', 'автомобильное_право',
+                           'наследственное_право', 'судебное_право'),
+            'intents': ('наследство',),
+        },
+        'трудовое право': {
+            'categories': ('трудовое_право',),
+        },
+        'семейное право': {
+            'categories': ('семейное_право',),
+        },
+    }
+
+    # Исправление опечаток (индекс симметричного удаления по основам ключевых слов
+    # и словам статей базы знаний) для запросов без единого ключевого слова
+    NLP_SPELLING_ENABLED = True
+    NLP_SPELLING_MAX_DISTANCE = 2  # для слов короче 8 букв - не больше 1
+    NLP_SPELLING_PREFIX_LENGTH = 7  # индексируемое начало слов статей
+    NLP_SPELLING_MIN_LENGTH = 4  # более короткие слова не исправляются
+    NLP_SPELLING_RELOAD_INTERVAL = 60  # секунд между проверками словаря
+    NLP_SPELLING_VOCABULARY_SIZE = 5000  # самых частых слов статей в индексе исправлений
+
+    # Обученная модель интентов (flask train-intent-model, нужен NumPy):
+    # её ответ принимается, если вероятность не ниже порога, иначе - обычный анализ
+    NLP_INTENT_MODEL_ENABLED = os.environ.get('NLP_INTENT_MODEL', '0') == '1'
+    NLP_INTENT_MODEL_PATH = os.path.join(BASE_DIR, 'data', 'intent_model.npz')
+    NLP_INTENT_MODEL_MIN_CONFIDENCE = 0.5
+    NLP_INTENT_MODEL_FEATURES = 2 ** 14  # размер хешированного пространства признаков
+    NLP_INTENT_MODEL_RELOAD_INTERVAL = 30  # секунд между проверками файла модели
+
+    # Этапы Natasha: eager - загрузка при старте, lazy - при первом обращении,
+    # off - не загружается. Анализу нужны segmenter, morph_vocab и morph_tagger
+    # (embedding загружается как его зависимость)
+    NLP_PIPELINE = {
+        'segmenter': 'eager',
+        'morph_vocab': 'eager',
+        'embedding': 'eager',
+        'morph_tagger': 'eager',
+        'syntax_parser': 'off',
+        'ner_tagger': 'off',
+        'names_extractor': 'lazy',
+    }
+
+    # Пул процессов NLP (0 - обработка в потоке запроса)
+    NLP_POOL_SIZE = int(os.environ.get('NLP_POOL_SIZE', os.cpu_count() or 1))
+    NLP_POOL_TIMEOUT = 5.0  # секунд на одну задачу, затем rule-based ответ
+    NLP_POOL_MAX_PENDING = 64  # при большей очереди отвечаем rule-based
+    NLP_POOL_DEGRADED_MODE = True  # rule-based ответ вместо ошибки при сбое пула
+    NLP_POOL_RETRY_INTERVAL = 30  # секунд до повторного запуска упавшего пула
+    NLP_POOL_START_METHOD = 'spawn'
+
+    # Запуск тестов панели разработчика (отдельные процессы с ограничениями)
+    TEST_RUNNER_WORKERS = min(4, os.cpu_count() or 1)
+    TEST_RUNNER_TIMEOUT = 10  # секунд на один тест
+    TEST_RUNNER_STARTUP_TIMEOUT = 60  # секунд на запуск процесса и загрузку моделей
+    TEST_RUNNER_MEMORY_MB = 2048  # ограничение адресного пространства процесса
+
+    # Шаблоны ответов (файлы + правки экспертов в БД)
+    RESPONSE_TEMPLATES_DIR = os.path.join(BASE_DIR, 'data', 'responses')
+    RESPONSE_TEMPLATES_RELOAD_INTERVAL = 30  # секунд между проверками правок в БД
+
+    # Каталог помощников кэшируется в процессе; после изменения помощников
+    # остальные процессы сверяют версию каталога в БД с этим интервалом
+    ASSISTANT_CATALOG_RELOAD_INTERVAL = 10  # секунд
+
+    # Массовый импорт базы знаний (flask import-knowledge, /expert/knowledge/import)
+    # процессов лемматизации (0 - в текущем; на одном ядре пул только добавляет пересылку статей)
+    KNOWLEDGE_IMPORT_WORKERS = min(4, os.cpu_count() or 1) if (os.cpu_count() or 1) > 1 else 0
+    KNOWLEDGE_IMPORT_BATCH_SIZE = 2000  # статей в одном executemany и одной транзакции
+    # flask import-knowledge удаляет индексы базы знаний и строит их один раз после загрузки
+    # (импорт из панели эксперта идёт при работающем сервере и индексы не трогает)
+    KNOWLEDGE_IMPORT_REBUILD_INDEXES = True
+
+    # Статьи делятся на фрагменты по заголовкам и абзацам (flask build-passages --rebuild
+    # после изменения); ответ помощника - лучший по леммам запроса фрагмент
+    KNOWLEDGE_PASSAGE_MAX_CHARS = 1000
+    KNOWLEDGE_PASSAGE_OVERLAP = 200  # символов (целыми предложениями) из конца предыдущего фрагмента
+
+    # Почти дубликаты (MinHash + LSH): похожая статья при добавлении отмечается (flag),
+    # заменяется новой версией (merge) или не ищется (off); почти одинаковые вопросы
+    # в очереди эксперта объединяются в группы
+    KNOWLEDGE_DUPLICATES = 'flag'
+    DUPLICATE_ARTICLE_THRESHOLD = 0.8  # мера Жаккара по тройкам лемм
+    DUPLICATE_QUESTION_THRESHOLD = 0.6  # мера Жаккара по леммам вопроса
+
+    # История консультаций
+    HISTORY_PAGE_SIZE = 50
+    VERIFICATION_PAGE_SIZE = 20  # групп похожих вопросов на странице очереди эксперта
+    RENDER_CACHE_SIZE = 10000  # хешей отрендеренных ответов в памяти процесса
+
+    # Асинхронный режим чата (ответ через SSE / long-polling)
+    CHAT_ASYNC_MODE = os.environ.get('CHAT_ASYNC_MODE', '0') == '1'
+    CHAT_WORKERS = 4  # фоновых потоков обработки
+    CHAT_QUEUE_SIZE = 1000  # при переполнении отвечаем 503
+    CHAT_POLL_TIMEOUT = 25  # секунд ожидания в long-polling и SSE
+    CHAT_POLL_INTERVAL = 0.5  # секунд между опросами БД
+    CHAT_RECOVER_AFTER = 120  # секунд: сообщение pending/streaming старше - осталось от упавшего процесса
+    CHAT_RECOVER_ATTEMPTS = 1  # повторных постановок в очередь, затем failed
+    CHAT_RECOVER_INTERVAL = 60  # секунд между проверками зависших сообщений
+
+    # Потоковая выдача ответа (SSE через /api/chat/stream)
+    CHAT_STREAM_MODE = os.environ.get('CHAT_STREAM_MODE', '0') == '1'
+    CHAT_STREAM_CHUNK_SIZE = 256  # символов в одном фрагменте
+
+    # Теневой режим: доля запросов дополнительно оценивается кандидатом NLP
+    # в фоновых процессах, результаты пишутся в nlp_shadow_results
+    SHADOW_ENABLED = os.environ.get('SHADOW_MODE', '0') == '1'
+    SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.05))
+    SHADOW_CANDIDATE = os.environ.get('SHADOW_CANDIDATE', 'services.shadow_service:KeywordCandidate')
+    SHADOW_KEYWORDS_FILE = os.path.join(BASE_DIR, 'data', 'shadow_keywords.json')
+    SHADOW_WORKERS = 1  # процессов кандидата (0 - в фоновом потоке)
+    SHADOW_QUEUE_SIZE = 256  # при переполнении запросы не оцениваются
+
+    # Отладочная трассировка NLP (logging вместо print)
+    TRACE_LEVEL = os.environ.get('TRACE_LEVEL', 'WARNING')  # порог для обычных запросов
+    TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0'))  # доля запросов с уровнем DEBUG
+
+    # Метрики Prometheus (/metrics)
+    METRICS_ENABLED = True
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # если задан - нужен Bearer-токен, иначе только localhost
+
+    # Профилировщик SQL (админ-панель: /admin/sql)
+    SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER', '0') == '1'
+    SQL_SLOW_QUERY_MS = 50  # запросы дольше попадают в журнал медленных
+    SQL_SLOW_LOG_SIZE = 50  # самых медленных запросов в журнале
+    SQL_QUERY_BUDGET = 30  # SQL-запросов на один HTTP-запрос
+    SQL_REPEAT_THRESHOLD = 10  # повторов одного запроса за HTTP-запрос (признак N+1)
+    SQL_PROFILER_MAX_STATEMENTS = 2000  # различных запросов в статистике и кэше нормализации
+
+    # Профилирование отдельных HTTP-запросов (админ-панель: /admin/profiler)
+    PROFILER_ENABLED = os.environ.get('REQUEST_PROFILER', '0') == '1'
+    PROFILER_MODE = 'sampling'  # sampling (выборка стека) или cprofile
+    PROFILER_ROUTES = ()  # endpoint'ы, например ('chat.chat', 'admin.admin_panel')
+    PROFILER_USERS = ()  # ID пользователей, чьи запросы профилируются
+    PROFILER_SAMPLE_RATE = 0.0  # доля остальных запросов
+    PROFILER_INTERVAL = 0.002  # секунд между снимками стека
+    PROFILER_DIR = os.path.join(BASE_DIR, 'profiles')
+    PROFILER_MAX_FILES = 200  # профилей хранится, старые удаляются
 
     # Роли пользователей
     ROLES = {
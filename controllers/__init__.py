@@ -8,5 +8,6 @@ from .developer import developer_bp
 from .expert import expert_bp
 from .chat import chat_bp
 from .api import api_bp
+from .monitoring import monitoring_bp
 
-__all__ = ['auth_bp', 'admin_bp', 'developer_bp', 'expert_bp', 'chat_bp', 'api_bp']
\ No newline at end of file
+__all__ = ['auth_bp', 'admin_bp', 'developer_bp', 'expert_bp', 'chat_bp', 'api_bp', 'monitoring_bp']
\ No newline at end of file
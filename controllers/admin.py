@@ -2,11 +2,16 @@
 Контроллер админ-панели
 Управление пользователями, системой и мониторинг
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session,
+                   current_app, send_file, abort)
 from utils.decorators import login_required, role_required
 from utils.database import Database
 from utils.logger import SystemLogger
+from utils.sql_profiler import sql_profiler
+from utils.request_profiler import request_profiler, MODES
 from services.auth_service import AuthService
+from services.assistant_catalog import assistant_catalog
+from services.near_duplicates import refresh_question_groups
 from datetime import datetime
 
 admin_bp = Blueprint('admin', __name__)
@@ -28,8 +33,8 @@ def admin_panel():
                            ORDER BY u.created_at DESC
                            ''')
 
-    # Получаем помощников
-    assistants = db.execute_all('SELECT * FROM assistants')
+    # Помощники из каталога (без запроса к БД)
+    assistants = assistant_catalog.current().assistants
 
     # Статистика
     stats = {
@@ -89,10 +94,17 @@ def delete_user(user_id):
 
     try:
         # Удаляем связанные записи
+        groups = [row['question_group'] for row in db.execute_all('''
+                                                                 SELECT DISTINCT question_group
+                                                                 FROM chat_messages
+                                                                 WHERE user_id = ?
+                                                                   AND question_group IS NOT NULL
+                                                                 ''', (user_id,))]
         db.execute('DELETE FROM chat_messages WHERE user_id = ?', (user_id,))
+        refresh_question_groups(db, groups)
         db.execute('UPDATE assistants SET created_by = NULL WHERE created_by = ?', (user_id,))
         db.execute('DELETE FROM users WHERE id = ?', (user_id,))
-        db.commit()
+        assistant_catalog.invalidate(db)
 
         SystemLogger.info(f'Пользователь {user["username"]} удален', 'admin', session['user_id'])
         flash(f'Пользователь {user["username"]} успешно удален', 'success')
@@ -168,13 +180,103 @@ def admin_logs():
                            role=session['role'])
 
 
+@admin_bp.route('/sql')
+@login_required
+@role_required('admin')
+def sql_profile():
+    """Профилировщик SQL: статистика запросов, медленные запросы, превышения бюджета"""
+    return render_template('admin_sql.html',
+                           profiler=sql_profiler,
+                           statements=sql_profiler.statements(),
+                           slowest=sql_profiler.slowest(),
+                           violations=list(reversed(sql_profiler.violations)),
+                           username=session['username'],
+                           role=session['role'])
+
+
+@admin_bp.route('/sql/toggle', methods=['POST'])
+@login_required
+@role_required('admin')
+def toggle_sql_profiler():
+    """Включение/выключение профилировщика SQL в текущем процессе"""
+    sql_profiler.enabled = not sql_profiler.enabled
+    state = 'включен' if sql_profiler.enabled else 'выключен'
+    SystemLogger.info(f'Профилировщик SQL {state}', 'admin', session['user_id'])
+    flash(f'Профилировщик SQL {state}', 'success')
+    return redirect(url_for('admin.sql_profile'))
+
+
+@admin_bp.route('/sql/reset', methods=['POST'])
+@login_required
+@role_required('admin')
+def reset_sql_profiler():
+    """Сброс статистики профилировщика SQL"""
+    sql_profiler.reset()
+    flash('Статистика SQL сброшена', 'success')
+    return redirect(url_for('admin.sql_profile'))
+
+
+@admin_bp.route('/profiler', methods=['GET', 'POST'])
+@login_required
+@role_required('admin')
+def profiler():
+    """Настройки профилирования запросов и список сохранённых профилей"""
+    if request.method == 'POST':
+        try:
+            user_ids = [int(value) for value in request.form.get('user_ids', '').replace(',', ' ').split()]
+            sample_rate = float(request.form.get('sample_rate') or 0) / 100
+            request_profiler.configure(
+                enabled=bool(request.form.get('enabled')),
+                mode=request.form.get('mode', 'sampling'),
+                routes=request.form.getlist('routes'),
+                user_ids=user_ids,
+                sample_rate=sample_rate
+            )
+        except ValueError as e:
+            flash(f'Некорректные настройки: {e}', 'danger')
+            return redirect(url_for('admin.profiler'))
+
+        SystemLogger.info('Изменены настройки профилирования запросов', 'admin', session['user_id'])
+        flash('Настройки профилирования сохранены', 'success')
+        return redirect(url_for('admin.profiler'))
+
+    endpoints = sorted({rule.endpoint for rule in current_app.url_map.iter_rules() if rule.endpoint != 'static'})
+    return render_template('admin_profiler.html',
+                           profiler=request_profiler,
+                           modes=MODES,
+                           endpoints=endpoints,
+                           profiles=request_profiler.list_profiles(),
+                           username=session['username'],
+                           role=session['role'])
+
+
+@admin_bp.route('/profiler/<profile_id>.<extension>')
+@login_required
+@role_required('admin')
+def download_profile(profile_id, extension):
+    """Скачивание профиля (collapsed stacks или pstats)"""
+    path = request_profiler.path(profile_id, extension)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True, download_name=f'{profile_id}.{extension}')
+
+
+@admin_bp.route('/profiler/clear', methods=['POST'])
+@login_required
+@role_required('admin')
+def clear_profiles():
+    """Удаление всех сохранённых профилей"""
+    for meta in request_profiler.list_profiles():
+        request_profiler.delete(meta['id'])
+    flash('Профили удалены', 'success')
+    return redirect(url_for('admin.profiler'))
+
+
 @admin_bp.route('/create_assistant', methods=['POST'])
 @login_required
 @role_required('admin')
 def create_assistant():
     """Создание нового помощника"""
-    from models.assistant import Assistant
-
     name = request.form.get('name')
     description = request.form.get('description')
     specialty = request.form.get('specialty')
@@ -191,8 +293,8 @@ def create_assistant():
                    INSERT INTO assistants (name, description, specialty, icon, color, created_by)
                    VALUES (?, ?, ?, ?, ?, ?)
                    ''', (name, description, specialty, icon, color, session['user_id']))
+        assistant_catalog.invalidate(db)
 
-        db.commit()
         SystemLogger.info(f'Создан помощник: {name}', 'admin', session['user_id'])
         flash('Помощник успешно создан', 'success')
     except Exception as e:
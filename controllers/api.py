@@ -2,10 +2,12 @@
 API контроллер
 Предоставляет REST API для интеграции с внешними системами
 """
-from flask import Blueprint, jsonify, request, session
-from utils.decorators import login_required
+from flask import Blueprint, jsonify, request, session, current_app
+from utils.decorators import login_required, role_required
+from services.assistant_catalog import assistant_catalog
 from services.knowledge_service import KnowledgeService
-from services.nlp_service import NLPService
+from services.nlp_executor import get_nlp_executor
+from services.nlp_service import NLP_STAGE_LATENCY
 
 api_bp = Blueprint('api', __name__)
 
@@ -23,6 +25,16 @@ def get_template(template_id):
     })
 
 
+@api_bp.route('/assistants')
+@login_required
+def list_assistants():
+    """Активные помощники (готовый JSON из каталога, без запросов к БД; поддерживает ETag)"""
+    catalog = assistant_catalog.current()
+    response = current_app.response_class(catalog.active_json, mimetype='application/json')
+    response.set_etag(catalog.etag)
+    return response.make_conditional(request)
+
+
 @api_bp.route('/knowledge/search', methods=['POST'])
 @login_required
 def search_knowledge():
@@ -49,10 +61,21 @@ def analyze_text():
     if not text:
         return jsonify({'error': 'Текст не предоставлен'}), 400
 
-    nlp = NLPService()
-    result = nlp.process_query(text)
+    result = get_nlp_executor().process_query(text, data.get('assistant_id'))
 
     return jsonify({
         'success': True,
         **result
-    })
\ No newline at end of file
+    })
+
+
+@api_bp.route('/metrics/nlp')
+@login_required
+@role_required('admin', 'developer')
+def nlp_metrics():
+    """Перцентили задержек этапов NLP (по этапам и по интентам)"""
+    return jsonify({
+        'success': True,
+        'stages': NLP_STAGE_LATENCY.summary(by=('stage',)),
+        'by_intent': NLP_STAGE_LATENCY.summary()
+    })
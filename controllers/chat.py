@@ -2,12 +2,17 @@
 Контроллер чата с помощниками
 Основной интерфейс взаимодействия пользователей с системой
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, session, jsonify,
+                   current_app, Response, stream_with_context)
 from utils.decorators import login_required
 from utils.database import Database
-from services.nlp_service import NLPService
+from utils.sse import format_sse, iter_chunks, SSE_HEADERS
+from services.nlp_executor import get_nlp_executor
+from services.shadow_service import shadow_runner
+from services.chat_service import ChatService
+from services.chat_pipeline import chat_pipeline
+from services.assistant_catalog import assistant_catalog
 from models.message import Message
-from models.assistant import Assistant
 from datetime import datetime
 
 chat_bp = Blueprint('chat', __name__)
@@ -35,11 +40,8 @@ def chat():
     """Страница чата с помощником"""
     db = Database()
 
-    # Получаем список помощников
-    assistants_rows = db.execute_all(
-        'SELECT * FROM assistants WHERE is_active = 1'
-    )
-    assistants = [Assistant.from_db_row(row) for row in assistants_rows]
+    # Активные помощники из каталога (без запроса к БД)
+    assistants = assistant_catalog.current().active
 
     # Получаем последние сообщения пользователя
     messages = db.execute_all('''
@@ -58,7 +60,9 @@ def chat():
                            role=session['role'],
                            avatar_color=session.get('avatar_color', '#007bff'),
                            assistants=assistants,
-                           messages=messages)
+                           messages=messages,
+                           async_mode=current_app.config['CHAT_ASYNC_MODE'],
+                           stream_mode=current_app.config['CHAT_STREAM_MODE'])
 
 
 @chat_bp.route('/api/chat/send', methods=['POST'])
@@ -72,28 +76,15 @@ def send_message():
     if not message_text:
         return jsonify({'error': 'Сообщение пустое'}), 400
 
-    # Обработка NLP
-    nlp = NLPService()
-    nlp_result = nlp.process_query(message_text)
+    if data.get('async', current_app.config['CHAT_ASYNC_MODE']):
+        return _send_message_async(message_text, assistant_id)
+
+    # Обработка NLP в пуле процессов
+    nlp_result = get_nlp_executor().process_query(message_text, assistant_id)
 
     # Сохранение в БД
-    db = Database()
-    cursor = db.execute('''
-                        INSERT INTO chat_messages (user_id, assistant_id, message, response, intent, category,
-                                                   confidence)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            session['user_id'],
-                            assistant_id,
-                            message_text,
-                            nlp_result['response'],
-                            nlp_result['intent'],
-                            nlp_result['category'],
-                            nlp_result['confidence']
-                        ))
-
-    db.commit()
-    message_id = cursor.lastrowid
+    message_id = ChatService.save_message(session['user_id'], assistant_id, message_text, nlp_result)
+    shadow_runner.submit(message_id, message_text, nlp_result, assistant_id)
 
     return jsonify({
         'success': True,
@@ -107,23 +98,130 @@ def send_message():
     })
 
 
+def _send_message_async(message_text, assistant_id):
+    """Сохранение сообщения и постановка в очередь фоновой обработки"""
+    if chat_pipeline.is_full():
+        return jsonify({'error': 'Сервер перегружен, повторите запрос позже'}), 503, {'Retry-After': '5'}
+
+    message_id = ChatService.create_pending(session['user_id'], assistant_id, message_text)
+    if not chat_pipeline.submit(message_id, message_text, assistant_id):
+        ChatService.fail_message(message_id)
+        return jsonify({'error': 'Сервер перегружен, повторите запрос позже'}), 503, {'Retry-After': '5'}
+
+    return jsonify({
+        'success': True,
+        'message_id': message_id,
+        'status': 'pending',
+        'poll_url': url_for('chat.poll_message', message_id=message_id),
+        'events_url': url_for('chat.message_events', message_id=message_id)
+    }), 202
+
+
+@chat_bp.route('/api/chat/stream', methods=['POST'])
+@login_required
+def stream_message():
+    """
+    Потоковая отправка ответа через Server-Sent Events.
+
+    События: accepted (ID сообщения) → meta (интент, категория) →
+    chunk (фрагменты ответа) → done. Запись в chat_messages
+    финализируется после генерации полного ответа.
+    """
+    data = request.json
+    message_text = data.get('message', '').strip()
+    assistant_id = data.get('assistant_id')
+
+    if not message_text:
+        return jsonify({'error': 'Сообщение пустое'}), 400
+
+    message_id = ChatService.create_pending(session['user_id'], assistant_id, message_text, status='streaming')
+    chunk_size = current_app.config['CHAT_STREAM_CHUNK_SIZE']
+
+    @stream_with_context
+    def generate():
+        yield format_sse({'message_id': message_id}, event='accepted')
+
+        nlp_result = None
+        try:
+            executor = get_nlp_executor()
+            nlp_result = executor.analyze(message_text, assistant_id)
+            yield format_sse(nlp_result, event='meta')
+
+            nlp_result['response'] = executor.generate_response(message_text, nlp_result)
+            for chunk in iter_chunks(nlp_result['response'], chunk_size):
+                yield format_sse({'text': chunk}, event='chunk')
+        finally:
+            # Ответ сохраняется, даже если клиент отключился во время передачи
+            if nlp_result and 'response' in nlp_result:
+                ChatService.complete_message(message_id, nlp_result)
+                shadow_runner.submit(message_id, message_text, nlp_result, assistant_id)
+            else:
+                ChatService.fail_message(message_id)
+
+        yield format_sse({'message_id': message_id}, event='done', event_id=message_id)
+
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@chat_bp.route('/api/chat/message/<int:message_id>/poll')
+@login_required
+def poll_message(message_id):
+    """Long-polling: ожидание ответа на сообщение"""
+    timeout = min(request.args.get('timeout', current_app.config['CHAT_POLL_TIMEOUT'], type=float),
+                  current_app.config['CHAT_POLL_TIMEOUT'])
+    status = chat_pipeline.wait(message_id, session['user_id'], timeout)
+
+    if status is None:
+        return jsonify({'error': 'Сообщение не найдено'}), 404
+
+    return jsonify({'success': status['status'] == 'done', **status})
+
+
+@chat_bp.route('/api/chat/message/<int:message_id>/events')
+@login_required
+def message_events(message_id):
+    """Server-Sent Events: доставка ответа на сообщение"""
+    user_id = session['user_id']
+    timeout = current_app.config['CHAT_POLL_TIMEOUT']
+
+    @stream_with_context
+    def generate():
+        status = chat_pipeline.wait(message_id, user_id, timeout)
+        if status is None:
+            yield format_sse({'error': 'Сообщение не найдено'}, event='error')
+        elif status['status'] == 'pending':
+            # Клиент переподключится автоматически
+            yield format_sse({'status': 'pending'}, event='pending')
+        else:
+            yield format_sse(status, event='result', event_id=message_id)
+
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
 @chat_bp.route('/history')
 @login_required
 def history():
-    """История консультаций"""
-    db = Database()
-    messages = db.execute_all('''
-                              SELECT cm.*,
-                                     a.name  as assistant_name,
-                                     a.icon  as assistant_icon,
-                                     a.color as assistant_color
-                              FROM chat_messages cm
-                                       LEFT JOIN assistants a ON cm.assistant_id = a.id
-                              WHERE cm.user_id = ?
-                              ORDER BY cm.created_at DESC
-                              ''', (session['user_id'],))
+    """История консультаций (постранично, ответы загружаются по запросу)"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    messages, has_next = ChatService.get_history_page(
+        session['user_id'], page, current_app.config['HISTORY_PAGE_SIZE']
+    )
 
     return render_template('history.html',
                            messages=messages,
+                           page=page,
+                           has_next=has_next,
                            username=session['username'],
-                           role=session['role'])
\ No newline at end of file
+                           role=session['role'])
+
+
+@chat_bp.route('/api/chat/message/<int:message_id>')
+@login_required
+def message_details(message_id):
+    """Детали консультации для окна истории"""
+    details = ChatService.get_details(message_id, session['user_id'])
+
+    if details is None:
+        return jsonify({'error': 'Сообщение не найдено'}), 404
+
+    return jsonify({'success': True, **details})
@@ -2,10 +2,15 @@
 Контроллер панели разработчика
 Создание и тестирование помощников
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from utils.decorators import login_required, role_required
 from utils.database import Database
 from utils.logger import SystemLogger
+from services.response_templates import response_templates
+from services.test_runner import test_run_jobs, is_script
+from services.shadow_service import shadow_runner
+from services.nlp_rules import nlp_rules
+from services.assistant_catalog import assistant_catalog
 
 developer_bp = Blueprint('developer', __name__)
 
@@ -25,8 +30,8 @@ def developer_panel():
                            ORDER BY t.created_at DESC
                            ''')
 
-    # Помощники
-    assistants = db.execute_all('SELECT * FROM assistants')
+    # Помощники из каталога (без запроса к БД)
+    assistants = assistant_catalog.current().assistants
 
     # Статистика тестов
     stats = {
@@ -34,7 +39,7 @@ def developer_panel():
         'passed_tests': db.execute_one("SELECT COUNT(*) as count FROM tests WHERE status = 'passed'")['count'],
         'failed_tests': db.execute_one("SELECT COUNT(*) as count FROM tests WHERE status = 'failed'")['count'],
         'pending_tests': db.execute_one("SELECT COUNT(*) as count FROM tests WHERE status = 'pending'")['count'],
-        'total_assistants': db.execute_one('SELECT COUNT(*) as count FROM assistants')['count'],
+        'total_assistants': len(assistants),
     }
 
     # NLP статистика
@@ -51,6 +56,8 @@ def developer_panel():
                            assistants=assistants,
                            stats=stats,
                            nlp_stats=nlp_stats,
+                           template_stats=response_templates.stats(),
+                           run_status=test_run_jobs.status(),
                            username=session['username'],
                            role=session['role'])
 
@@ -65,17 +72,27 @@ def create_test():
     test_type = request.form.get('test_type')
     code = request.form.get('code')
     expected_output = request.form.get('expected_output')
+    assistant_id = request.form.get('assistant_id', type=int)
 
     if not name:
         flash('Введите название теста', 'danger')
         return redirect(url_for('developer.developer_panel'))
 
+    # Тест - запрос и ожидаемый результат: код тестов не выполняется
+    if code and is_script(code):
+        flash('Укажите текст запроса к NLP: Python-код в тестах не выполняется', 'danger')
+        return redirect(url_for('developer.developer_panel'))
+
+    if assistant_id is not None and assistant_catalog.get(assistant_id) is None:
+        flash('Помощник не найден', 'danger')
+        return redirect(url_for('developer.developer_panel'))
+
     db = Database()
     try:
         db.execute('''
-                   INSERT INTO tests (name, description, test_type, code, expected_output, created_by)
-                   VALUES (?, ?, ?, ?, ?, ?)
-                   ''', (name, description, test_type, code, expected_output, session['user_id']))
+                   INSERT INTO tests (name, description, test_type, code, expected_output, assistant_id, created_by)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ''', (name, description, test_type, code, expected_output, assistant_id, session['user_id']))
 
         db.commit()
         SystemLogger.info(f'Создан тест: {name}', 'developer', session['user_id'])
@@ -90,7 +107,7 @@ def create_test():
 @login_required
 @role_required('developer')
 def run_test(test_id):
-    """Запуск теста"""
+    """Запуск теста (в фоне)"""
     db = Database()
     test = db.execute_one('SELECT * FROM tests WHERE id = ?', (test_id,))
 
@@ -98,25 +115,128 @@ def run_test(test_id):
         flash('Тест не найден', 'danger')
         return redirect(url_for('developer.developer_panel'))
 
-    # Имитация выполнения теста
-    import random
-    result = random.choice(['passed', 'failed'])
-    actual_output = '{"result": "success"}' if result == 'passed' else '{"result": "error"}'
+    if test_run_jobs.start(current_app._get_current_object(), [test], session['user_id']):
+        flash(f'Тест "{test["name"]}" запущен', 'info')
+    else:
+        flash('Предыдущий запуск тестов ещё выполняется', 'warning')
+
+    return redirect(url_for('developer.developer_panel'))
+
+
+@developer_bp.route('/tests/run', methods=['POST'])
+@login_required
+@role_required('developer')
+def run_tests():
+    """Запуск всех тестов или только ожидающих (в фоне)"""
+    db = Database()
+    if request.form.get('scope') == 'all':
+        tests = db.execute_all('SELECT id, code, expected_output, assistant_id FROM tests')
+    else:
+        tests = db.execute_all("SELECT id, code, expected_output, assistant_id FROM tests WHERE status = 'pending'")
 
-    db.execute('''
-               UPDATE tests
-               SET status        = ?,
-                   actual_output = ?,
-                   executed_at   = CURRENT_TIMESTAMP
-               WHERE id = ?
-               ''', (result, actual_output, test_id))
+    if not tests:
+        flash('Нет тестов для запуска', 'info')
+        return redirect(url_for('developer.developer_panel'))
 
-    db.commit()
-    flash(f'Тест "{test["name"]}" выполнен: {result}', 'success' if result == 'passed' else 'warning')
+    if test_run_jobs.start(current_app._get_current_object(), tests, session['user_id']):
+        flash(f'Запущено тестов: {len(tests)}', 'info')
+    else:
+        flash('Предыдущий запуск тестов ещё выполняется', 'warning')
 
     return redirect(url_for('developer.developer_panel'))
 
 
+@developer_bp.route('/tests/status')
+@login_required
+@role_required('developer')
+def run_tests_status():
+    """Состояние последнего запуска тестов"""
+    status = test_run_jobs.status()
+    if status is None:
+        return jsonify({'error': 'Тесты не запускались'}), 404
+    return jsonify({'success': True, **status})
+
+
+@developer_bp.route('/shadow', methods=['GET', 'POST'])
+@login_required
+@role_required('developer')
+def shadow():
+    """Теневой режим NLP: настройки и сравнение с кандидатом"""
+    if request.method == 'POST':
+        try:
+            sample_rate = float(request.form.get('sample_rate', 0)) / 100
+        except ValueError:
+            flash('Некорректная доля запросов', 'danger')
+            return redirect(url_for('developer.shadow'))
+        shadow_runner.enabled = request.form.get('enabled') == '1'
+        shadow_runner.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        SystemLogger.info(f'Теневой режим NLP: {"включен" if shadow_runner.enabled else "выключен"}, '
+                          f'доля {shadow_runner.sample_rate:.1%}', 'developer', session['user_id'])
+        flash('Настройки теневого режима сохранены', 'success')
+        return redirect(url_for('developer.shadow'))
+
+    return render_template('developer_shadow.html',
+                           runner=shadow_runner,
+                           summary=shadow_runner.summary(),
+                           username=session['username'],
+                           role=session['role'])
+
+
+@developer_bp.route('/shadow/clear', methods=['POST'])
+@login_required
+@role_required('developer')
+def clear_shadow():
+    """Удаление результатов теневого режима"""
+    shadow_runner.clear()
+    flash('Результаты теневого режима удалены', 'success')
+    return redirect(url_for('developer.shadow'))
+
+
+@developer_bp.route('/nlp-rules')
+@login_required
+@role_required('developer')
+def nlp_rules_page():
+    """Ключевые слова интентов, категории и запросы к базе знаний"""
+    return render_template('developer_nlp_rules.html',
+                           rules=nlp_rules.all(),
+                           version=nlp_rules.current().version,
+                           username=session['username'],
+                           role=session['role'])
+
+
+@developer_bp.route('/nlp-rules/save', methods=['POST'])
+@login_required
+@role_required('developer')
+def save_nlp_rule():
+    """Сохранение правила интента (новая версия правил для всех процессов)"""
+    intent = request.form.get('intent', '').strip()
+    keywords = request.form.get('keywords', '').split(',')
+    if not intent or not any(kw.strip() for kw in keywords):
+        flash('Укажите интент и хотя бы одно ключевое слово', 'danger')
+        return redirect(url_for('developer.nlp_rules_page'))
+
+    nlp_rules.save(intent, keywords,
+                   category=request.form.get('category', '').strip(),
+                   kb_query=request.form.get('kb_query', '').strip(),
+                   updated_by=session['user_id'])
+    SystemLogger.info(f'Правило NLP изменено: {intent} (версия {nlp_rules.current().version})',
+                      'developer', session['user_id'])
+    flash(f'Правило «{intent}» сохранено', 'success')
+    return redirect(url_for('developer.nlp_rules_page'))
+
+
+@developer_bp.route('/nlp-rules/reset', methods=['POST'])
+@login_required
+@role_required('developer')
+def reset_nlp_rule():
+    """Возврат правила интента к значению по умолчанию"""
+    intent = request.form.get('intent', '')
+    nlp_rules.reset(intent)
+    SystemLogger.info(f'Правило NLP сброшено: {intent}', 'developer', session['user_id'])
+    flash(f'Правило «{intent}» сброшено', 'success')
+    return redirect(url_for('developer.nlp_rules_page'))
+
+
 @developer_bp.route('/assistant/create', methods=['POST'])
 @login_required
 @role_required('developer')
@@ -138,8 +258,8 @@ def create_developer_assistant():
                    INSERT INTO assistants (name, description, specialty, icon, color, created_by)
                    VALUES (?, ?, ?, ?, ?, ?)
                    ''', (name, description, specialty, icon, color, session['user_id']))
+        assistant_catalog.invalidate(db)
 
-        db.commit()
         SystemLogger.info(f'Создан помощник: {name}', 'developer', session['user_id'])
         flash('Помощник создан', 'success')
     except Exception as e:
@@ -2,11 +2,20 @@
 Контроллер панели эксперта
 Верификация ответов и управление базой знаний
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+import os
+import re
+import shutil
+import tempfile
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from utils.decorators import login_required, role_required
 from utils.database import Database
 from utils.logger import SystemLogger
 from services.knowledge_service import KnowledgeService
+from services.knowledge_import import knowledge_import_jobs, TEXT_EXTENSIONS, JSONL_EXTENSIONS
+from services.near_duplicates import get_question_groups, refresh_question_groups
+from services.response_templates import response_templates
+from services.nlp_rules import nlp_rules
 
 expert_bp = Blueprint('expert', __name__)
 
@@ -18,26 +27,24 @@ def expert_panel():
     """Панель эксперта"""
     db = Database()
 
-    # Неверифицированные сообщения
-    unverified_messages = db.execute_all('''
-                                         SELECT cm.*,
-                                                u.username     as user_name,
-                                                u.avatar_color as user_color,
-                                                a.name         as assistant_name,
-                                                a.icon         as assistant_icon
-                                         FROM chat_messages cm
-                                                  JOIN users u ON cm.user_id = u.id
-                                                  LEFT JOIN assistants a ON cm.assistant_id = a.id
-                                         WHERE cm.is_verified = 0
-                                         ORDER BY cm.created_at DESC
-                                         ''')
+    # Почти одинаковые вопросы показываются одной строкой; остальные вопросы
+    # группы со своими ответами видны в окне верификации
+    page = max(request.args.get('page', 1, type=int), 1)
+    groups, has_next = get_question_groups(db, page, current_app.config['VERIFICATION_PAGE_SIZE'])
+    message_groups = [(group, _similar_messages(group)) for group in groups]
 
     # База знаний
     knowledge_items = KnowledgeService.get_all_knowledge()
 
     # Статистика
     stats = {
-        'unverified_count': len(unverified_messages),
+        'unverified_count': db.execute_one('''
+                                           SELECT COUNT(*) as count
+                                           FROM chat_messages
+                                           WHERE is_verified = 0 AND status = 'done'
+                                           ''')['count'],
+        'unverified_groups': db.execute_one(
+            'SELECT COUNT(*) as count FROM chat_messages WHERE question_leader = 1')['count'],
         'knowledge_count': db.execute_one('SELECT COUNT(*) as count FROM knowledge_base')['count'],
         'verified_today': db.execute_one('''
                                          SELECT COUNT(*) as count
@@ -47,44 +54,116 @@ def expert_panel():
     }
 
     return render_template('expert.html',
-                           unverified_messages=unverified_messages,
+                           message_groups=message_groups,
+                           page=page,
+                           has_next=has_next,
                            knowledge_items=knowledge_items,
+                           response_templates=response_templates.all(),
+                           import_status=knowledge_import_jobs.status(),
+                           intents=[rule['intent'] for rule in nlp_rules.all()] + ['общий_вопрос'],
                            stats=stats,
                            username=session['username'],
                            role=session['role'])
 
 
+def _similar_messages(group):
+    """
+    Остальные вопросы группы для окна верификации.
+
+    Returns:
+        list: Словари id, message, response, intent и same_answer - интент
+            и ответ совпадают с первым вопросом группы (только такие
+            вопросы отмечаются для совместной верификации по умолчанию)
+    """
+    leader = group[0]
+    return [{
+        'id': message['id'],
+        'message': message['message'],
+        'response': message['response'],
+        'intent': message['intent'],
+        'same_answer': message['intent'] == leader['intent'] and message['response'] == leader['response'],
+    } for message in group[1:]]
+
+
+def _correct_intent(db, message_id, intent):
+    """
+    Исправление интента одобренного сообщения экспертом. Одобренные
+    сообщения - обучающая выборка модели интентов: без исправлений её метки
+    совпадают с ответом самого конвейера.
+
+    Args:
+        db (Database): Подключение (фиксация - у вызывающего)
+        message_id (int): ID сообщения
+        intent (str): Интент, выбранный экспертом (пустой - без изменений)
+    """
+    if not intent:
+        return
+    db.execute('''
+               UPDATE chat_messages
+               SET intent           = ?,
+                   category         = COALESCE(?, category),
+                   intent_corrected = 1
+               WHERE id = ?
+                 AND intent IS NOT ?
+               ''', (intent, nlp_rules.current().categories.get(intent), message_id, intent))
+
+
 @expert_bp.route('/message/<int:message_id>/verify', methods=['POST'])
 @login_required
 @role_required('expert')
 def verify_message(message_id):
-    """Верификация сообщения"""
+    """Верификация сообщения (и, если отмечено, выбранных похожих из той же группы)"""
     action = request.form.get('action')
     notes = request.form.get('notes', '')
 
+    group_ids = []
+    if request.form.get('apply_to_group'):
+        group_ids = sorted({int(value) for value in request.form.getlist('group_ids')
+                            if value.strip().isdigit() and int(value) != message_id})
+    # Похожие вопросы меняются, только пока их не проверил другой эксперт
+    condition = f"id = ? OR (id IN ({', '.join('?' * len(group_ids))}) AND is_verified = 0)" if group_ids \
+        else 'id = ?'
+
     db = Database()
 
+    count = 0
     if action == 'approve':
-        db.execute('''
-                   UPDATE chat_messages
-                   SET is_verified        = 1,
-                       verified_by        = ?,
-                       verification_notes = ?,
-                       rating             = 5
-                   WHERE id = ?
-                   ''', (session['user_id'], notes, message_id))
-        flash('Ответ одобрен и опубликован', 'success')
+        count = db.execute(f'''
+                           UPDATE chat_messages
+                           SET is_verified        = 1,
+                               verified_by        = ?,
+                               verification_notes = ?,
+                               rating             = 5
+                           WHERE {condition}
+                           ''', (session['user_id'], notes, message_id, *group_ids)).rowcount
+        _correct_intent(db, message_id, request.form.get('intent', '').strip())
+        flash('Ответ одобрен и опубликован' if count <= 1
+              else f'Одобрено ответов: {count}', 'success')
     elif action == 'reject':
-        db.execute('''
-                   UPDATE chat_messages
-                   SET is_verified        = 0,
-                       verification_notes = ?
-                   WHERE id = ?
-                   ''', (notes, message_id))
-        flash('Ответ отправлен на доработку', 'warning')
+        count = db.execute(f'''
+                           UPDATE chat_messages
+                           SET is_verified        = 0,
+                               verification_notes = ?
+                           WHERE {condition}
+                           ''', (notes, message_id, *group_ids)).rowcount
+        flash('Ответ отправлен на доработку' if count <= 1
+              else f'Отправлено на доработку ответов: {count}', 'warning')
+
+    if action == 'approve':
+        groups = db.execute_all(f'''
+                                SELECT DISTINCT question_group
+                                FROM chat_messages
+                                WHERE id IN ({', '.join('?' * (len(group_ids) + 1))})
+                                  AND question_group IS NOT NULL
+                                ''', (message_id, *group_ids))
+        refresh_question_groups(db, [row['question_group'] for row in groups])
 
     db.commit()
-    SystemLogger.info(f'Сообщение {message_id} верифицировано: {action}', 'expert', session['user_id'])
+    if count <= 1:
+        SystemLogger.info(f'Сообщение {message_id} верифицировано: {action}', 'expert', session['user_id'])
+    else:
+        SystemLogger.info(f"Сообщения {', '.join(map(str, [message_id] + group_ids))} верифицированы "
+                          f"({count}): {action}", 'expert', session['user_id'])
 
     return redirect(url_for('expert.expert_panel'))
 
@@ -114,4 +193,86 @@ def add_knowledge():
     except Exception as e:
         flash(f'Ошибка при добавлении материала: {e}', 'danger')
 
+    return redirect(url_for('expert.expert_panel'))
+
+
+@expert_bp.route('/knowledge/import', methods=['POST'])
+@login_required
+@role_required('expert')
+def import_knowledge():
+    """Массовый импорт статей из загруженных файлов JSONL и текстовых файлов (в фоне)"""
+    files = [upload for upload in request.files.getlist('files')
+             if os.path.splitext(upload.filename or '')[1].lower() in TEXT_EXTENSIONS + JSONL_EXTENSIONS]
+    if not files:
+        flash('Выберите файлы .jsonl, .txt или .md', 'danger')
+        return redirect(url_for('expert.expert_panel'))
+
+    # Каждый файл - в своём подкаталоге: имя файла сохраняется как источник статей
+    directory = tempfile.mkdtemp(prefix='knowledge-import-')
+    for number, upload in enumerate(files):
+        stem, extension = os.path.splitext(os.path.basename(upload.filename))
+        stem = re.sub(r'[^\w\- .,]', '', stem).strip(' .') or 'file'
+        os.makedirs(os.path.join(directory, f'{number:04d}'))
+        upload.save(os.path.join(directory, f'{number:04d}', stem[:100] + extension.lower()))
+
+    started = knowledge_import_jobs.start(
+        current_app._get_current_object(), directory,
+        category=request.form.get('category') or None,
+        source=request.form.get('source') or None,
+        uploaded_by=session['user_id'],
+        verified=True
+    )
+    if started:
+        flash(f'Импорт запущен: файлов {len(files)}', 'info')
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
+        flash('Предыдущий импорт ещё выполняется', 'warning')
+    return redirect(url_for('expert.expert_panel'))
+
+
+@expert_bp.route('/knowledge/import/status')
+@login_required
+@role_required('expert')
+def import_knowledge_status():
+    """Состояние последнего импорта: статей, скорость, ошибки"""
+    status = knowledge_import_jobs.status()
+    if status is None:
+        return jsonify({'error': 'Импорт не запускался'}), 404
+    return jsonify({'success': True, **status})
+
+
+@expert_bp.route('/template/<key>')
+@login_required
+@role_required('expert')
+def get_response_template(key):
+    """Получение текста шаблона ответа для редактирования"""
+    template = response_templates.get(key)
+    if template is None:
+        return jsonify({'error': 'Шаблон не найден'}), 404
+    return jsonify({'success': True, **template.to_dict()})
+
+
+@expert_bp.route('/template/<key>', methods=['POST'])
+@login_required
+@role_required('expert')
+def save_response_template(key):
+    """Сохранение шаблона ответа"""
+    body = request.form.get('body', '').strip()
+
+    # Эксперт правит только существующие шаблоны: новый ключ не выбирался бы ни одним интентом
+    if response_templates.get(key) is None:
+        flash(f'Шаблон "{key}" не найден', 'danger')
+        return redirect(url_for('expert.expert_panel'))
+
+    if not body:
+        flash('Текст шаблона не может быть пустым', 'danger')
+        return redirect(url_for('expert.expert_panel'))
+
+    try:
+        response_templates.save(key, body, session['user_id'])
+        SystemLogger.info(f'Изменён шаблон ответа: {key}', 'expert', session['user_id'])
+        flash(f'Шаблон "{key}" сохранён', 'success')
+    except Exception as e:
+        flash(f'Ошибка при сохранении шаблона: {e}', 'danger')
+
     return redirect(url_for('expert.expert_panel'))
\ No newline at end of file
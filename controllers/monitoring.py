@@ -0,0 +1,34 @@
+"""
+Контроллер мониторинга
+Метрики процесса в текстовом формате Prometheus
+"""
+import hmac
+
+from flask import Blueprint, Response, request, abort
+from config import Config
+from utils.metrics import metrics
+
+monitoring_bp = Blueprint('monitoring', __name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Адреса, с которых метрики отдаются без токена
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+@monitoring_bp.route('/metrics')
+def prometheus_metrics():
+    """
+    Метрики HTTP, БД, NLP, кэшей и очередей для Prometheus.
+    Если задан METRICS_TOKEN, требуется заголовок Authorization: Bearer <токен>;
+    без токена метрики отдаются только запросам с локального адреса.
+    """
+    if not Config.METRICS_ENABLED:
+        abort(404)
+    if Config.METRICS_TOKEN:
+        expected = f'Bearer {Config.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            abort(401)
+    elif request.remote_addr not in LOCAL_ADDRESSES:
+        abort(403)
+    return Response(metrics.exposition(), content_type=CONTENT_TYPE)
@@ -5,7 +5,7 @@
 from .user import User
 from .assistant import Assistant
 from .message import Message
-from .knowledge import KnowledgeBase
+from .knowledge import KnowledgeBase, KnowledgePassage
 from .log import Log
 
-__all__ = ['User', 'Assistant', 'Message', 'KnowledgeBase', 'Log']
\ No newline at end of file
+__all__ = ['User', 'Assistant', 'Message', 'KnowledgeBase', 'KnowledgePassage', 'Log']
\ No newline at end of file
@@ -70,4 +70,81 @@ class KnowledgeBase:
         )
 
     def __repr__(self):
-        return f"<KnowledgeBase {self.title}>"
\ No newline at end of file
+        return f"<KnowledgeBase {self.title}>"
+
+
+class KnowledgePassage:
+    """
+    Класс KnowledgePassage представляет фрагмент статьи базы знаний.
+
+    Атрибуты:
+        id (int): Уникальный идентификатор
+        knowledge_id (int): ID статьи
+        position (int): Номер фрагмента в статье
+        heading (str): Заголовок раздела статьи
+        content (str): Текст фрагмента
+        title (str): Название статьи
+        category (str): Категория статьи
+        source (str): Источник статьи
+        icon (str): Иконка статьи
+        score (float): Оценка BM25 при поиске (больше - лучше)
+    """
+
+    def __init__(self, id=None, knowledge_id=None, position=0, heading=None, content='',
+                 title='', category='', source='', icon='📚', score=0):
+        self.id = id
+        self.knowledge_id = knowledge_id
+        self.position = position
+        self.heading = heading
+        self.content = content
+        self.title = title
+        self.category = category
+        self.source = source
+        self.icon = icon
+        self.score = score
+
+    @property
+    def text(self):
+        """Текст фрагмента с заголовком раздела (если фрагмент начинается не с него)"""
+        if self.heading and not self.content.lstrip('# ').startswith(self.heading):
+            return f"{self.heading}\n\n{self.content}"
+        return self.content
+
+    def to_dict(self):
+        """Преобразование в словарь"""
+        return {
+            'id': self.id,
+            'knowledge_id': self.knowledge_id,
+            'position': self.position,
+            'heading': self.heading,
+            'content': self.content,
+            'title': self.title,
+            'category': self.category,
+            'source': self.source,
+            'icon': self.icon,
+            'score': self.score
+        }
+
+    @classmethod
+    def from_db_row(cls, row, score=0):
+        """Создание объекта из строки БД (фрагмент, соединённый со статьёй)"""
+        if not row:
+            return None
+
+        row_dict = dict(row)
+
+        return cls(
+            id=row_dict['id'],
+            knowledge_id=row_dict['knowledge_id'],
+            position=row_dict['position'],
+            heading=row_dict.get('heading'),
+            content=row_dict['content'],
+            title=row_dict.get('title', ''),
+            category=row_dict.get('category', ''),
+            source=row_dict.get('source', ''),
+            icon=row_dict.get('icon', '📚'),
+            score=score
+        )
+
+    def __repr__(self):
+        return f"<KnowledgePassage {self.title} #{self.position}>"
\ No newline at end of file
@@ -3,7 +3,8 @@
 """
 
 from .nlp_service import NLPService
+from .nlp_executor import NLPExecutor, get_nlp_executor
 from .auth_service import AuthService
 from .knowledge_service import KnowledgeService
 
-__all__ = ['NLPService', 'AuthService', 'KnowledgeService']
\ No newline at end of file
+__all__ = ['NLPService', 'NLPExecutor', 'get_nlp_executor', 'AuthService', 'KnowledgeService']
\ No newline at end of file
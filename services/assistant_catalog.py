@@ -0,0 +1,140 @@
+"""
+Каталог помощников
+Кэш таблицы assistants в памяти процесса: страницы чата и панелей
+получают готовые списки помощников без запросов к БД
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+from config import Config
+from models.assistant import Assistant
+from utils.database import Database
+from utils.metrics import CACHE_REQUESTS
+
+
+class AssistantCatalogSnapshot:
+    """
+    Класс AssistantCatalogSnapshot - неизменяемый снимок каталога одной версии.
+
+    Атрибуты:
+        version (int): Версия каталога в БД
+        assistants (tuple): Все помощники (Assistant) в порядке создания
+        active (tuple): Активные помощники
+        by_id (Mapping): ID -> Assistant
+        active_json (bytes): Активные помощники в JSON (ответ /api/assistants)
+        etag (str): Хеш active_json для условных запросов
+    """
+
+    __slots__ = ('version', 'assistants', 'active', 'by_id', 'active_json', 'etag')
+
+    def __init__(self, rows, version=0):
+        """
+        Args:
+            rows (list): Строки таблицы assistants
+            version (int): Версия каталога
+        """
+        self.version = version
+        self.assistants = tuple(Assistant.from_db_row(row) for row in rows)
+        self.active = tuple(assistant for assistant in self.assistants if assistant.is_active)
+        self.by_id = MappingProxyType({assistant.id: assistant for assistant in self.assistants})
+        self.active_json = json.dumps([assistant.to_dict() for assistant in self.active],
+                                      ensure_ascii=False).encode('utf-8')
+        self.etag = hashlib.sha1(self.active_json).hexdigest()[:16]
+
+
+class AssistantCatalog:
+    """
+    Класс AssistantCatalog хранит текущий снимок каталога помощников.
+
+    Снимок загружается при первом обращении и подменяется целиком одним
+    присваиванием, чтение блокировок не берёт. Изменения помощников
+    проходят через invalidate(): версия в assistants_version
+    увеличивается, снимок этого процесса перечитывается сразу, остальные
+    процессы сверяют версию не чаще ASSISTANT_CATALOG_RELOAD_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Текущий снимок каталога.
+
+        Returns:
+            AssistantCatalogSnapshot: Снимок последней загруженной версии
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.load()
+                return self._snapshot
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = time.monotonic() + Config.ASSISTANT_CATALOG_RELOAD_INTERVAL
+                if self._read_version() != snapshot.version:
+                    self.load()
+            finally:
+                self._lock.release()
+        CACHE_REQUESTS.inc(('assistant_catalog', 'hit'))
+        return self._snapshot
+
+    def get(self, assistant_id):
+        """
+        Помощник по ID.
+
+        Args:
+            assistant_id (int): ID помощника
+
+        Returns:
+            Assistant: Помощник или None
+        """
+        return self.current().by_id.get(assistant_id)
+
+    @staticmethod
+    def _read_version():
+        """Версия каталога в БД (0 - ещё не менялся)"""
+        try:
+            row = Database().execute_one('SELECT version FROM assistants_version WHERE id = 1')
+        except sqlite3.OperationalError:
+            return 0
+        return row['version'] if row else 0
+
+    def load(self):
+        """
+        Чтение каталога из БД.
+
+        Returns:
+            AssistantCatalogSnapshot: Новый снимок (уже подменивший старый)
+        """
+        version = self._read_version()
+        rows = Database().execute_all('SELECT * FROM assistants ORDER BY id')
+        self._snapshot = AssistantCatalogSnapshot(rows, version)
+        self._next_check = time.monotonic() + Config.ASSISTANT_CATALOG_RELOAD_INTERVAL
+        CACHE_REQUESTS.inc(('assistant_catalog', 'miss'))
+        return self._snapshot
+
+    def invalidate(self, db):
+        """
+        Новая версия каталога после изменения таблицы assistants: фиксирует
+        транзакцию db, в этом процессе снимок перечитывается сразу.
+
+        Args:
+            db (Database): Подключение, в котором изменены помощники
+        """
+        db.execute('''
+                   INSERT INTO assistants_version (id, version) VALUES (1, 1)
+                   ON CONFLICT(id) DO UPDATE SET version = version + 1
+                   ''')
+        db.commit()
+        with self._lock:
+            self.load()
+
+
+assistant_catalog = AssistantCatalog()
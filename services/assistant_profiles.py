@@ -0,0 +1,107 @@
+"""
+Профили NLP помощников
+Специализация помощника ограничивает интенты, категории и статьи базы знаний,
+среди которых ищется ответ
+"""
+import sqlite3
+
+from config import Config
+from .assistant_catalog import assistant_catalog
+
+
+class AssistantProfile:
+    """
+    Класс AssistantProfile - правила NLP одной специализации.
+
+    Атрибуты:
+        name (str): Специализация (ключ NLP_ASSISTANT_PROFILES)
+        categories (tuple): Категории профиля, первая - категория по умолчанию
+        intents (frozenset): Интенты профиля
+        rules (CompiledRules): Снимок правил только с интентами профиля
+        source (CompiledRules): Полный снимок, из которого собран профиль
+    """
+
+    __slots__ = ('name', 'categories', 'intents', 'rules', 'source')
+
+    def __init__(self, name, categories, intents, source):
+        """
+        Args:
+            name (str): Специализация
+            categories (tuple): Категории профиля
+            intents (iterable): Интенты без собственной категории, входящие в профиль
+            source (CompiledRules): Полный снимок правил
+        """
+        self.name = name
+        self.categories = tuple(categories)
+        extra = set(intents)
+        self.intents = frozenset(intent for intent, _ in source.keywords
+                                 if source.categories.get(intent) in self.categories or intent in extra)
+        self.rules = source.restrict(self.intents)
+        self.source = source
+
+    def category(self, category):
+        """Категория запроса в пределах профиля (чужая заменяется категорией по умолчанию)"""
+        return category if category in self.categories else self.categories[0]
+
+
+class AssistantProfileRegistry:
+    """
+    Класс AssistantProfileRegistry сопоставляет помощникам их профили.
+
+    Специализация помощника берётся из каталога помощников, профили
+    пересобираются при смене снимка правил NLP и подменяются одним
+    присваиванием. Помощник, специализации которого нет
+    в NLP_ASSISTANT_PROFILES, работает со всеми правилами.
+    """
+
+    def __init__(self):
+        self._profiles = {}
+
+    def for_assistant(self, assistant_id, rules):
+        """
+        Профиль помощника.
+
+        Args:
+            assistant_id (int): ID помощника (None - без помощника)
+            rules (CompiledRules): Текущий снимок правил
+
+        Returns:
+            AssistantProfile: Профиль или None
+        """
+        if assistant_id is None:
+            return None
+        try:
+            assistant_id = int(assistant_id)
+        except (TypeError, ValueError):
+            return None
+        try:
+            assistant = assistant_catalog.get(assistant_id)
+        except (RuntimeError, sqlite3.OperationalError):
+            # Нет контекста приложения или таблицы помощников
+            return None
+        if assistant is None:
+            return None
+        return self.get((assistant.specialty or '').strip().lower(), rules)
+
+    def get(self, name, rules):
+        """
+        Профиль по названию специализации.
+
+        Args:
+            name (str): Специализация (None - без профиля)
+            rules (CompiledRules): Текущий снимок правил
+
+        Returns:
+            AssistantProfile: Профиль или None, если специализации нет в конфигурации
+        """
+        settings = Config.NLP_ASSISTANT_PROFILES.get(name) if name else None
+        if settings is None:
+            return None
+        profile = self._profiles.get(name)
+        if profile is None or profile.source is not rules:
+            profile = AssistantProfile(name, settings['categories'], settings.get('intents', ()), rules)
+            self._profiles[name] = profile
+        return profile
+
+
+assistant_profiles = AssistantProfileRegistry()
@@ -0,0 +1,199 @@
+"""
+Асинхронный конвейер обработки сообщений чата
+Запрос сохраняется сразу, ответ готовится фоновыми потоками
+"""
+import queue
+import threading
+import time
+
+from config import Config
+from utils.database import Database
+from utils.metrics import metrics
+from .chat_service import ChatService
+from .nlp_executor import get_nlp_executor
+from .shadow_service import shadow_runner
+
+
+class ChatPipeline:
+    """
+    Класс ChatPipeline принимает сообщения в ограниченную очередь и
+    обрабатывает их фоновыми потоками (NLP, поиск в базе знаний, запись в БД).
+
+    Клиент получает ответ через long-polling или Server-Sent Events:
+    wait() дожидается события в текущем процессе, а для сообщений,
+    принятых другим процессом, опрашивает БД.
+
+    Очередь хранится в памяти процесса: сообщения, принятые упавшим или
+    перезапущенным процессом, остаются в БД со статусом pending/streaming.
+    recover() при запуске и простаивающие потоки раз в
+    CHAT_RECOVER_INTERVAL ставят такие сообщения в очередь повторно
+    (не более CHAT_RECOVER_ATTEMPTS раз) или помечают failed.
+    """
+
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or Config.CHAT_WORKERS
+        self.app = None
+        self._queue = queue.Queue(maxsize=queue_size or Config.CHAT_QUEUE_SIZE)
+        self._events = {}
+        self._events_lock = threading.Lock()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._recover_lock = threading.Lock()
+        self._next_recover = 0.0
+
+    def init_app(self, app):
+        """Привязка к приложению Flask (нужно для контекста в фоновых потоках)"""
+        self.app = app
+        app.extensions['chat_pipeline'] = self
+
+    @property
+    def depth(self):
+        """Текущая длина очереди"""
+        return self._queue.qsize()
+
+    def is_full(self):
+        """Заполнена ли очередь"""
+        return self._queue.full()
+
+    def _ensure_started(self):
+        """Ленивый запуск фоновых потоков при первом сообщении"""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'chat-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, message_id, text, assistant_id=None):
+        """
+        Постановка сообщения в очередь.
+
+        Args:
+            message_id (int): ID сохранённого сообщения
+            text (str): Текст запроса
+            assistant_id (int): ID помощника
+
+        Returns:
+            bool: False, если очередь переполнена
+        """
+        self._ensure_started()
+        with self._events_lock:
+            self._events[message_id] = threading.Event()
+        try:
+            self._queue.put_nowait((message_id, text, assistant_id))
+            return True
+        except queue.Full:
+            with self._events_lock:
+                self._events.pop(message_id, None)
+            return False
+
+    def recover(self):
+        """
+        Повторная обработка сообщений, оставшихся от упавших процессов.
+
+        Сообщение pending старше CHAT_RECOVER_AFTER ставится в очередь
+        повторно; streaming (клиент потокового ответа уже отключён) и
+        исчерпавшие попытки помечаются failed. Если есть более свежие
+        необработанные сообщения, запускаются фоновые потоки: они проверят
+        эти сообщения позже. Вызывается в контексте приложения.
+
+        Returns:
+            tuple: (поставлено в очередь, помечено failed)
+        """
+        with self._recover_lock:
+            self._next_recover = time.monotonic() + Config.CHAT_RECOVER_INTERVAL
+            requeued = failed = 0
+            waiting = False
+            for row in ChatService.get_unfinished():
+                with self._events_lock:
+                    own = row['id'] in self._events
+                if own:
+                    continue  # в очереди этого процесса
+                if row['age'] < Config.CHAT_RECOVER_AFTER:
+                    waiting = True
+                    continue
+                retry = row['status'] == 'pending' and row['attempts'] < Config.CHAT_RECOVER_ATTEMPTS
+                if not ChatService.claim_retry(row['id'], row['attempts']):
+                    continue  # сообщение уже забрал другой процесс
+                if retry and self.submit(row['id'], row['message'], row['assistant_id']):
+                    requeued += 1
+                else:
+                    ChatService.fail_message(row['id'])
+                    failed += 1
+            if waiting:
+                self._ensure_started()
+            return requeued, failed
+
+    def _recover_if_due(self):
+        """Периодическая проверка зависших сообщений из простаивающего потока"""
+        if time.monotonic() < self._next_recover or self._recover_lock.locked():
+            return
+        with self.app.app_context():
+            try:
+                requeued, failed = self.recover()
+                if requeued or failed:
+                    print(f"♻️ Зависшие сообщения: повторно в очереди {requeued}, отмечено failed {failed}")
+            except Exception as e:
+                print(f"⚠️ Ошибка проверки зависших сообщений: {e}")
+            finally:
+                Database().close_connection()
+
+    def _worker(self):
+        """Цикл фонового потока"""
+        while True:
+            try:
+                message_id, text, assistant_id = self._queue.get(timeout=Config.CHAT_RECOVER_INTERVAL)
+            except queue.Empty:
+                self._recover_if_due()
+                continue
+            with self.app.app_context():
+                try:
+                    nlp_result = get_nlp_executor().process_query(text, assistant_id)
+                    ChatService.complete_message(message_id, nlp_result)
+                    shadow_runner.submit(message_id, text, nlp_result, assistant_id)
+                except Exception as e:
+                    print(f"⚠️ Ошибка обработки сообщения {message_id}: {e}")
+                    ChatService.fail_message(message_id)
+                finally:
+                    Database().close_connection()
+                    with self._events_lock:
+                        event = self._events.pop(message_id, None)
+                    if event:
+                        event.set()
+                    self._queue.task_done()
+
+    def wait(self, message_id, user_id, timeout):
+        """
+        Ожидание готовности ответа (long-polling).
+
+        Args:
+            message_id (int): ID сообщения
+            user_id (int): ID владельца сообщения
+            timeout (float): Максимальное время ожидания, секунд
+
+        Returns:
+            dict или None: Результат ChatService.get_status
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            status = ChatService.get_status(message_id, user_id)
+            remaining = deadline - time.monotonic()
+            if status is None or status['status'] != 'pending' or remaining <= 0:
+                return status
+
+            with self._events_lock:
+                event = self._events.get(message_id)
+            if event:
+                event.wait(remaining)
+            else:
+                # Сообщение обрабатывается другим процессом - опрашиваем БД
+                time.sleep(min(Config.CHAT_POLL_INTERVAL, remaining))
+
+
+chat_pipeline = ChatPipeline()
+
+metrics.gauge('chat_queue_depth', 'Сообщений в очереди фоновой обработки чата', (),
+              lambda: chat_pipeline.depth)
@@ -0,0 +1,250 @@
+"""
+Сервис сообщений чата
+Сохранение запросов пользователей и ответов помощников
+"""
+from utils.database import Database
+from utils.metrics import CACHE_REQUESTS
+from .near_duplicates import assign_question_group, question_signature
+from .nlp_service import NLPService
+from .render_service import RenderService
+
+
+class ChatService:
+    """
+    Сервис ChatService управляет записями таблицы chat_messages.
+    Используется синхронным и асинхронным режимами чата.
+    """
+
+    @staticmethod
+    def save_message(user_id, assistant_id, message, nlp_result):
+        """
+        Сохранение обработанного сообщения и его группа похожих вопросов.
+
+        Args:
+            user_id (int): ID пользователя
+            assistant_id (int): ID помощника
+            message (str): Текст запроса
+            nlp_result (dict): Результат NLPService.process_query
+
+        Returns:
+            int: ID созданного сообщения
+        """
+        db = Database()
+        cursor = db.execute('''
+                            INSERT INTO chat_messages (user_id, assistant_id, message, response, intent, category,
+                                                       confidence, response_hash, minhash)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            ''', (
+                                user_id,
+                                assistant_id,
+                                message,
+                                nlp_result['response'],
+                                nlp_result['intent'],
+                                nlp_result['category'],
+                                nlp_result['confidence'],
+                                RenderService.store(nlp_result['response']),
+                                question_signature(message)
+                            ))
+        assign_question_group(db, cursor.lastrowid)
+        db.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def create_pending(user_id, assistant_id, message, status='pending'):
+        """
+        Сохранение сообщения, ответ на которое ещё не готов.
+
+        Args:
+            status (str): pending - в очереди, streaming - ответ передаётся потоком
+
+        Returns:
+            int: ID созданного сообщения
+        """
+        db = Database()
+        cursor = db.execute('''
+                            INSERT INTO chat_messages (user_id, assistant_id, message, status, minhash)
+                            VALUES (?, ?, ?, ?, ?)
+                            ''', (user_id, assistant_id, message, status, question_signature(message)))
+        db.commit()
+        return cursor.lastrowid
+
+    @staticmethod
+    def complete_message(message_id, nlp_result):
+        """
+        Запись готового ответа в сообщение; сообщение попадает в группу похожих вопросов.
+
+        Args:
+            message_id (int): ID сообщения
+            nlp_result (dict): Результат NLPService.process_query
+        """
+        db = Database()
+        db.execute('''
+                   UPDATE chat_messages
+                   SET response      = ?,
+                       intent        = ?,
+                       category      = ?,
+                       confidence    = ?,
+                       response_hash = ?,
+                       status        = 'done'
+                   WHERE id = ?
+                   ''', (
+                       nlp_result['response'],
+                       nlp_result['intent'],
+                       nlp_result['category'],
+                       nlp_result['confidence'],
+                       RenderService.store(nlp_result['response']),
+                       message_id
+                   ))
+        assign_question_group(db, message_id)
+        db.commit()
+
+    @staticmethod
+    def fail_message(message_id):
+        """Пометка сообщения, которое не удалось обработать"""
+        db = Database()
+        db.execute("UPDATE chat_messages SET status = 'failed' WHERE id = ?", (message_id,))
+        db.commit()
+
+    @staticmethod
+    def get_status(message_id, user_id):
+        """
+        Получение состояния сообщения пользователя.
+
+        Args:
+            message_id (int): ID сообщения
+            user_id (int): ID владельца сообщения
+
+        Returns:
+            dict или None: Статус и, если ответ готов, сам ответ
+        """
+        db = Database()
+        row = db.execute_one('''
+                             SELECT id, status, response, intent, category, confidence, created_at
+                             FROM chat_messages
+                             WHERE id = ?
+                               AND user_id = ?
+                             ''', (message_id, user_id))
+        if not row:
+            return None
+
+        result = {'message_id': row['id'], 'status': row['status'] or 'done'}
+        if result['status'] == 'done':
+            result.update({
+                'response': row['response'],
+                'intent': row['intent'],
+                'category': row['category'],
+                'confidence': row['confidence'],
+                'icon': NLPService.get_icon(row['intent']),
+                'timestamp': str(row['created_at'])[11:16]
+            })
+        return result
+
+    @staticmethod
+    def get_unfinished():
+        """
+        Сообщения, ответ на которые ещё не записан (в очереди, передаются
+        потоком или остались от перезапущенного либо упавшего процесса).
+
+        Returns:
+            list: Строки id, message, assistant_id, status, attempts и age -
+                секунд с момента создания или последнего повторного захвата
+        """
+        db = Database()
+        return db.execute_all('''
+                              SELECT id, message, assistant_id, status, COALESCE(attempts, 0) AS attempts,
+                                     (JULIANDAY('now') - JULIANDAY(COALESCE(claimed_at, created_at))) * 86400 AS age
+                              FROM chat_messages
+                              WHERE status IN ('pending', 'streaming')
+                              ORDER BY id
+                              ''')
+
+    @staticmethod
+    def claim_retry(message_id, attempts):
+        """
+        Захват зависшего сообщения для повторной обработки. Счётчик попыток
+        сравнивается с прочитанным, поэтому из нескольких процессов сообщение
+        захватывает только один.
+
+        Args:
+            message_id (int): ID сообщения
+            attempts (int): Число попыток, прочитанное get_unfinished
+
+        Returns:
+            bool: True, если сообщение захвачено этим процессом
+        """
+        db = Database()
+        claimed = db.execute('''
+                             UPDATE chat_messages
+                             SET status     = 'pending',
+                                 attempts   = ?,
+                                 claimed_at = CURRENT_TIMESTAMP
+                             WHERE id = ?
+                               AND status IN ('pending', 'streaming')
+                               AND COALESCE(attempts, 0) = ?
+                             ''', (attempts + 1, message_id, attempts)).rowcount
+        db.commit()
+        return claimed == 1
+
+    @staticmethod
+    def get_history_page(user_id, page=1, page_size=50):
+        """
+        Страница истории консультаций (только краткие сведения, без ответов).
+
+        Args:
+            user_id (int): ID пользователя
+            page (int): Номер страницы, начиная с 1
+            page_size (int): Сообщений на странице
+
+        Returns:
+            tuple: (список строк, есть ли следующая страница)
+        """
+        db = Database()
+        rows = db.execute_all('''
+                              SELECT cm.id,
+                                     cm.created_at,
+                                     substr(cm.message, 1, 300) as message,
+                                     cm.category,
+                                     cm.confidence,
+                                     cm.is_verified,
+                                     cm.status,
+                                     a.name  as assistant_name,
+                                     a.icon  as assistant_icon,
+                                     a.color as assistant_color
+                              FROM chat_messages cm
+                                       LEFT JOIN assistants a ON cm.assistant_id = a.id
+                              WHERE cm.user_id = ?
+                              ORDER BY cm.created_at DESC, cm.id DESC
+                              LIMIT ? OFFSET ?
+                              ''', (user_id, page_size + 1, (page - 1) * page_size))
+        return rows[:page_size], len(rows) > page_size
+
+    @staticmethod
+    def get_details(message_id, user_id):
+        """
+        Полные сведения о сообщении пользователя (для окна деталей истории).
+
+        Returns:
+            dict или None: Вопрос, ответ и HTML ответа
+        """
+        db = Database()
+        row = db.execute_one('''
+                             SELECT cm.id, cm.message, cm.response, cm.intent, cm.category, cm.confidence,
+                                    cm.is_verified, cm.verification_notes, cm.status, cm.created_at,
+                                    ra.html as response_html
+                             FROM chat_messages cm
+                                      LEFT JOIN rendered_answers ra ON ra.hash = cm.response_hash
+                             WHERE cm.id = ?
+                               AND cm.user_id = ?
+                             ''', (message_id, user_id))
+        if not row:
+            return None
+
+        details = dict(row)
+        if details['response_html']:
+            CACHE_REQUESTS.inc(('rendered_html', 'hit'))
+        elif details['response']:
+            # Сообщение ещё не обработано задачей backfill-rendered
+            CACHE_REQUESTS.inc(('rendered_html', 'miss'))
+            details['response_html'] = RenderService.get_html(RenderService.store(details['response'], commit=True))
+        details['is_verified'] = bool(details['is_verified'])
+        return details
@@ -0,0 +1,287 @@
+"""
+Обучаемый классификатор интентов
+Хешированный мешок лемм и линейная модель (softmax) в массивах NumPy,
+обучение на одобренных экспертами сообщениях chat_messages
+"""
+import json
+import os
+import time
+import zlib
+
+from config import Config
+from utils.lemmatizer import lemmas, lemmatizer_name
+from utils.logger import SystemLogger
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+
+class IntentModel:
+    """
+    Класс IntentModel - линейный классификатор интентов.
+
+    Признаки - леммы и пары соседних лемм, хешированные (crc32) в
+    n_features ячеек и нормированные по L2. Модель - матрица весов
+    n_features x классы и вектор смещений; пачка запросов
+    классифицируется одним умножением матриц.
+    """
+
+    def __init__(self, classes, n_features, weights=None, bias=None, meta=None):
+        self.classes = list(classes)
+        self.n_features = n_features
+        self.weights = weights if weights is not None else np.zeros((n_features, len(self.classes)), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(self.classes), np.float32)
+        self.meta = meta or {}
+
+    def features(self, text):
+        """
+        Разреженный вектор признаков текста.
+
+        Returns:
+            tuple: (индексы, значения) - массивы NumPy
+        """
+        words = lemmas(text)
+        grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+        if not grams:
+            return np.zeros(0, np.int64), np.zeros(0, np.float32)
+        hashed = np.fromiter((zlib.crc32(gram.encode('utf-8')) % self.n_features for gram in grams),
+                             np.int64, len(grams))
+        indices, counts = np.unique(hashed, return_counts=True)
+        values = counts.astype(np.float32)
+        return indices, values / np.linalg.norm(values)
+
+    @staticmethod
+    def matrix(rows):
+        """
+        Плотная матрица пачки по признакам, которые в ней встречаются.
+
+        Returns:
+            tuple: (номера признаков, матрица пачки x признаки)
+        """
+        columns = np.unique(np.concatenate([indices for indices, _ in rows]))
+        X = np.zeros((len(rows), len(columns)), np.float32)
+        for i, (indices, values) in enumerate(rows):
+            X[i, np.searchsorted(columns, indices)] = values
+        return columns, X
+
+    def probabilities(self, columns, X):
+        """Softmax-вероятности классов для матрицы признаков"""
+        logits = X @ self.weights[columns] + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def predict(self, texts):
+        """
+        Классификация пачки запросов.
+
+        Args:
+            texts (list): Тексты запросов
+
+        Returns:
+            list: (интент, вероятность) для каждого текста
+        """
+        if not texts:
+            return []
+        probabilities = self.probabilities(*self.matrix([self.features(text) for text in texts]))
+        best = probabilities.argmax(axis=1)
+        return [(self.classes[index], float(probabilities[i, index])) for i, index in enumerate(best)]
+
+    def fit(self, samples, epochs=30, learning_rate=5.0, l2=1e-5, batch_size=256, seed=0):
+        """
+        Обучение мини-пакетным градиентным спуском. Обучение продолжается
+        с текущих весов (дообучение), новые классы добавляются. Шаг
+        обновляет только веса признаков, встретившихся в мини-пакете.
+
+        Args:
+            samples (list): Пары (текст, интент)
+            epochs (int): Проходов по выборке
+            learning_rate (float): Шаг градиентного спуска
+            l2 (float): L2-регуляризация
+            batch_size (int): Размер мини-пакета
+            seed (int): Зерно перемешивания
+        """
+        for intent in sorted({intent for _, intent in samples} - set(self.classes)):
+            self.classes.append(intent)
+            self.weights = np.hstack([self.weights, np.zeros((self.n_features, 1), np.float32)])
+            self.bias = np.append(self.bias, np.float32(0))
+
+        rows = [self.features(text) for text, _ in samples]
+        labels = np.array([self.classes.index(intent) for _, intent in samples])
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(rows))
+            for start in range(0, len(order), batch_size):
+                chunk = order[start:start + batch_size]
+                columns, X = self.matrix([rows[i] for i in chunk])
+                gradient = self.probabilities(columns, X)
+                gradient[np.arange(len(chunk)), labels[chunk]] -= 1
+                gradient /= len(chunk)
+                self.weights[columns] -= learning_rate * (X.T @ gradient + l2 * self.weights[columns])
+                self.bias -= learning_rate * gradient.sum(axis=0)
+
+    def save(self, path):
+        """Сохранение модели (атомарная замена файла)"""
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, weights=self.weights, bias=self.bias,
+                            classes=np.array(self.classes),
+                            meta=np.array(json.dumps({**self.meta, 'n_features': self.n_features,
+                                                      'lemmatizer': lemmatizer_name()}, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Загрузка модели.
+
+        Raises:
+            ValueError: Модель обучена с другим лемматизатором
+        """
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('lemmatizer') != lemmatizer_name():
+                raise ValueError(f"модель обучена с лемматизатором {meta.get('lemmatizer')}, "
+                                 f"доступен {lemmatizer_name()}")
+            return cls([str(c) for c in data['classes']], meta['n_features'],
+                       data['weights'].astype(np.float32), data['bias'].astype(np.float32), meta)
+
+
+class IntentModelTrainer:
+    """
+    Класс IntentModelTrainer обучает IntentModel на сообщениях, одобренных
+    экспертами. Каждое пятое сообщение (по id) откладывается для проверки,
+    чтобы оценка была сравнима между запусками.
+
+    Метка сообщения - интент, сохранённый конвейером NLP, если эксперт
+    не исправил его при верификации (intent_corrected). Неисправленные
+    метки - ответы самих ключевых слов, поэтому сравнение с ключевыми
+    словами на них завышено; отдельно считается точность на исправленных.
+
+    Дообучение берёт только сообщения, одобренные после прошлого обучения,
+    и столько же случайных старых (чтобы модель не забывала прежние примеры).
+    """
+
+    HOLDOUT_MODULUS = 5
+
+    @staticmethod
+    def _rows():
+        """Одобренные сообщения с интентом"""
+        from utils.database import Database
+        return Database().execute_all('''
+                                      SELECT id, message, intent, intent_corrected
+                                      FROM chat_messages
+                                      WHERE is_verified = 1
+                                        AND intent IS NOT NULL
+                                      ORDER BY id
+                                      ''')
+
+    @classmethod
+    def train(cls, path=None, full=False, epochs=30, n_features=None):
+        """
+        Обучение или дообучение модели с сохранением в файл.
+
+        Args:
+            path (str): Файл модели (по умолчанию Config.NLP_INTENT_MODEL_PATH)
+            full (bool): Обучить заново на всех сообщениях
+            epochs (int): Проходов по выборке
+            n_features (int): Размер пространства признаков для новой модели
+
+        Returns:
+            dict: Число примеров, сравнение с ключевыми словами или
+                причина, по которой обучение не выполнялось
+        """
+        if not NUMPY_AVAILABLE:
+            return {'error': 'NumPy не установлен'}
+        path = path or Config.NLP_INTENT_MODEL_PATH
+        model = None
+        if not full and os.path.exists(path):
+            try:
+                model = IntentModel.load(path)
+            except ValueError as e:
+                SystemLogger.warning(f'Модель интентов будет обучена заново: {e}', 'nlp')
+
+        rows = cls._rows()
+        train = [row for row in rows if row['id'] % cls.HOLDOUT_MODULUS]
+        holdout = [row for row in rows if not row['id'] % cls.HOLDOUT_MODULUS]
+        if len({row['intent'] for row in train}) < 2:
+            return {'error': f'недостаточно одобренных сообщений: {len(train)}'}
+
+        if model is None:
+            model = IntentModel([], n_features or Config.NLP_INTENT_MODEL_FEATURES)
+            batch = train
+        else:
+            last_id = model.meta.get('trained_through_id', 0)
+            batch = [row for row in train if row['id'] > last_id]
+            if not batch:
+                return {'up_to_date': True, **cls.evaluate(model, holdout)}
+            old = [row for row in train if row['id'] <= last_id]
+            rng = np.random.default_rng(len(train))
+            if old:
+                batch += [old[i] for i in rng.choice(len(old), min(len(batch), len(old)), replace=False)]
+
+        started = time.perf_counter()
+        model.fit([(row['message'], row['intent']) for row in batch], epochs=epochs)
+        seconds = round(time.perf_counter() - started, 2)
+        model.meta.update({
+            'trained_through_id': max(row['id'] for row in train),
+            'samples': len(train),
+            'trained_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        report = {'trained_on': len(batch), 'samples': len(train), 'seconds': seconds,
+                  **cls.evaluate(model, holdout)}
+        model.meta['holdout'] = {key: report[key] for key in ('holdout', 'model_accuracy', 'keyword_accuracy',
+                                                              'corrected')}
+        model.save(path)
+        return report
+
+    @staticmethod
+    def evaluate(model, rows):
+        """
+        Сравнение модели с ключевыми словами NLPService на отложенных сообщениях.
+        Точность на всех сообщениях для ключевых слов циклична (метки - их же
+        ответы), независимая оценка - на интентах, исправленных экспертами.
+
+        Returns:
+            dict: Точность (всего и на исправленных метках) и задержка
+                (мкс на запрос, по одному и пачкой)
+        """
+        from services.nlp_service import NLPService
+
+        if not rows:
+            return {'holdout': 0, 'model_accuracy': None, 'keyword_accuracy': None, 'corrected': 0}
+        keywords = NLPService(use_natasha=False, cache_size=0)
+        texts = [row['message'] for row in rows]
+        lowered = [text.lower().strip() for text in texts]
+
+        started = time.perf_counter()
+        keyword_intents = [keywords._analyze_rule_based(text)[0] for text in lowered]
+        keyword_us = (time.perf_counter() - started) / len(rows) * 1e6
+
+        started = time.perf_counter()
+        single = [model.predict([text])[0][0] for text in texts]
+        single_us = (time.perf_counter() - started) / len(rows) * 1e6
+
+        started = time.perf_counter()
+        batch = [intent for intent, _ in model.predict(texts)]
+        batch_us = (time.perf_counter() - started) / len(rows) * 1e6
+
+        expected = [row['intent'] for row in rows]
+        corrected = [i for i, row in enumerate(rows) if row['intent_corrected']]
+        return {
+            'holdout': len(rows),
+            'model_accuracy': round(sum(a == b for a, b in zip(batch, expected)) / len(rows), 4),
+            'keyword_accuracy': round(sum(a == b for a, b in zip(keyword_intents, expected)) / len(rows), 4),
+            'corrected': len(corrected),
+            'model_accuracy_corrected': (round(sum(batch[i] == expected[i] for i in corrected) / len(corrected), 4)
+                                         if corrected else None),
+            'keyword_accuracy_corrected': (round(sum(keyword_intents[i] == expected[i] for i in corrected)
+                                                 / len(corrected), 4) if corrected else None),
+            'model_us': round(single_us, 1),
+            'model_batch_us': round(batch_us, 1),
+            'keyword_us': round(keyword_us, 1),
+        }
@@ -0,0 +1,350 @@
+"""
+Массовый импорт базы знаний
+Статьи из JSONL и каталогов текстовых файлов проходят конвейер
+разбор → нормализация → деление на фрагменты и лемматизация (в пуле
+процессов) и вставляются пакетами executemany в больших транзакциях
+"""
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+
+from config import Config
+from utils.database import Database, KNOWLEDGE_INDEXES
+from utils.lemmatizer import lemmas
+from utils.logger import SystemLogger
+from . import knowledge_passages, near_duplicates
+
+# Расширения файлов, которые читает импорт
+TEXT_EXTENSIONS = ('.txt', '.md')
+JSONL_EXTENSIONS = ('.jsonl',)
+
+# Заголовок статьи кодекса: текстовый файл с несколькими такими строками
+# делится на статьи по ним
+ARTICLE_HEADING_RE = re.compile(r'^\s*(Статья\s+\d+(?:\.\d+)*\.?.*)$', re.MULTILINE)
+
+MAX_TITLE_LENGTH = 300
+
+INSERT_SQL = '''
+             INSERT INTO knowledge_base (title, content, category, source, icon, uploaded_by, is_verified, lemmas,
+                                         minhash)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+             '''
+
+
+def normalize_text(text):
+    """
+    Нормализация текста статьи: NFC, переводы строк, мягкие переносы и
+    неразрывные пробелы, пробелы внутри строк, не больше одной пустой строки.
+    """
+    text = unicodedata.normalize('NFC', text).replace('\r\n', '\n').replace('\r', '\n')
+    text = text.replace('\xad', '').replace('\xa0', ' ')
+    lines = [' '.join(line.split()) for line in text.split('\n')]
+    return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip()
+
+
+def lemmatize(title, content):
+    """Леммы названия и содержания через пробел (столбец knowledge_base.lemmas)"""
+    return ' '.join(lemmas(f'{title}\n{content}'))
+
+
+def prepare_article(record):
+    """
+    Нормализация, деление на фрагменты, лемматизация и MinHash-подпись
+    одной статьи (выполняется в пуле процессов).
+
+    Args:
+        record (dict): title, content, category, source, icon
+
+    Returns:
+        tuple: (title, content, category, source, icon, lemmas, passages, minhash) или None,
+            если название или содержание пусты
+    """
+    title = ' '.join(normalize_text(record.get('title') or '').split())[:MAX_TITLE_LENGTH]
+    content = normalize_text(record.get('content') or '')
+    if not title or not content:
+        return None
+    article_lemmas = lemmatize(title, content)
+    return (title, content, record.get('category') or None, record.get('source') or None,
+            record.get('icon') or '📚', article_lemmas, knowledge_passages.prepare_passages(content),
+            near_duplicates.article_signature(article_lemmas))
+
+
+def iter_files(paths):
+    """Файлы JSONL и текстовые файлы по путям (каталоги - рекурсивно, по алфавиту)"""
+    extensions = TEXT_EXTENSIONS + JSONL_EXTENSIONS
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            raise FileNotFoundError(path)
+
+
+def parse_text(text, name):
+    """
+    Статьи текстового файла: по заголовкам «Статья N», если их несколько,
+    иначе весь файл (название - первая непустая строка).
+
+    Args:
+        text (str): Содержимое файла
+        name (str): Имя файла без расширения
+
+    Returns:
+        list: Пары (название, содержание)
+    """
+    headings = list(ARTICLE_HEADING_RE.finditer(text))
+    if len(headings) > 1:
+        bounds = [match.start() for match in headings] + [len(text)]
+        return [(match.group(1), text[match.end():bounds[i + 1]]) for i, match in enumerate(headings)]
+    lines = text.strip().split('\n', 1)
+    if len(lines) == 1:
+        return [(name, lines[0])]
+    return [(lines[0].lstrip('# '), lines[1])]
+
+
+def iter_records(paths, defaults, errors):
+    """
+    Разбор файлов в записи статей (потоково, без чтения всех файлов в память).
+
+    Args:
+        paths (list): Файлы и каталоги
+        defaults (dict): category, source, icon для записей без своих значений
+        errors (list): Сюда добавляются описания пропущенных строк и файлов
+
+    Yields:
+        dict: title, content, category, source, icon
+    """
+    for path in iter_files(paths):
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, encoding='utf-8-sig') as f:
+                if path.lower().endswith(JSONL_EXTENSIONS):
+                    for number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            item = json.loads(line)
+                        except ValueError as e:
+                            errors.append(f'{path}:{number}: {e}')
+                            continue
+                        if not isinstance(item, dict):
+                            errors.append(f'{path}:{number}: ожидался объект JSON')
+                            continue
+                        yield {key: item.get(key) or defaults.get(key)
+                               for key in ('title', 'content', 'category', 'source', 'icon')}
+                else:
+                    for title, content in parse_text(f.read(), name):
+                        yield {'title': title, 'content': content, 'category': defaults.get('category'),
+                               'source': defaults.get('source') or name, 'icon': defaults.get('icon')}
+        except (OSError, UnicodeDecodeError) as e:
+            errors.append(f'{path}: {e}')
+
+
+def _windows(records, size):
+    """Последовательные списки по size записей"""
+    window = []
+    for record in records:
+        window.append(record)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+class KnowledgeImporter:
+    """
+    Класс KnowledgeImporter загружает статьи в базу знаний пакетами.
+
+    Записи читаются потоково окнами по batch_size статей. Пока пул
+    процессов нормализует, делит на фрагменты и лемматизирует следующее
+    окно, текущее вставляется пакетами executemany (статьи, их фрагменты
+    и корзины LSH) и фиксируется одной транзакцией. Почти дубликаты внутри
+    импорта не ищутся: подписи попадают в индекс для последующих добавлений.
+    Для офлайн-загрузки (flask import-knowledge) вторичные индексы базы
+    знаний можно удалить на время загрузки и построить один раз в конце;
+    импорт при работающем сервере их не трогает - запросы чата продолжают
+    пользоваться индексами. В журнал пишется одна запись об импорте.
+    """
+
+    def __init__(self, workers=None, batch_size=None, rebuild_indexes=None):
+        """
+        Args:
+            workers (int): Процессов нормализации и лемматизации
+                (по умолчанию KNOWLEDGE_IMPORT_WORKERS, 0 - в текущем процессе)
+            batch_size (int): Статей в одной транзакции
+            rebuild_indexes (bool): Удалить индексы на время загрузки
+                (только без работающего сервера)
+        """
+        self.workers = Config.KNOWLEDGE_IMPORT_WORKERS if workers is None else workers
+        self.batch_size = batch_size or Config.KNOWLEDGE_IMPORT_BATCH_SIZE
+        self.rebuild_indexes = rebuild_indexes
+
+    def run(self, paths, category=None, source=None, icon=None, uploaded_by=None, verified=True,
+            progress=None):
+        """
+        Импорт статей.
+
+        Args:
+            paths (list): Файлы JSONL, текстовые файлы и каталоги
+            category (str): Категория статей без своей категории
+            source (str): Источник (для текстовых файлов по умолчанию - имя файла)
+            icon (str): Иконка
+            uploaded_by (int): ID загрузившего
+            verified (bool): Отметить статьи как проверенные
+            progress (callable): Вызывается после каждой транзакции со словарём статистики
+
+        Returns:
+            dict: read, inserted, skipped, errors, seconds, rate (статей в секунду)
+        """
+        errors = []
+        stats = {'read': 0, 'inserted': 0, 'skipped': 0, 'errors': errors, 'seconds': 0.0, 'rate': 0.0}
+        records = iter_records(paths, {'category': category, 'source': source, 'icon': icon}, errors)
+        db = Database()
+        started = time.perf_counter()
+
+        def insert(window, prepared):
+            # (title, content, category, source, icon, lemmas, passages, minhash) -> порядок столбцов INSERT_SQL
+            articles = [article for article in prepared if article is not None]
+            rows = [article[:5] + (uploaded_by, verified, article[5], article[7]) for article in articles]
+            if rows:
+                db.execute_many(INSERT_SQL, rows)
+                # В одной транзакции единственного писателя ID статей идут подряд
+                first_id = db.execute_one('SELECT last_insert_rowid() AS id')['id'] - len(rows) + 1
+                db.execute_many(knowledge_passages.INSERT_SQL,
+                                [row for number, article in enumerate(articles)
+                                 for row in knowledge_passages.passage_rows(first_id + number, article[6])])
+                db.execute_many(near_duplicates.LSH_INSERT_SQL,
+                                [row for number, article in enumerate(articles)
+                                 for row in near_duplicates.lsh_rows(first_id + number, article[7])])
+                db.commit()
+            stats['read'] += len(window)
+            stats['inserted'] += len(rows)
+            stats['skipped'] += len(window) - len(rows)
+            stats['seconds'] = round(time.perf_counter() - started, 2)
+            stats['rate'] = round(stats['inserted'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+            if progress is not None:
+                progress(dict(stats, errors=len(errors)))
+
+        if self.rebuild_indexes:
+            self._drop_indexes(db)
+        pool = None
+        try:
+            if self.workers > 0:
+                context = multiprocessing.get_context(Config.NLP_POOL_START_METHOD)
+                pool = context.Pool(self.workers)
+            chunksize = max(1, self.batch_size // (4 * max(self.workers, 1)))
+            pending = None
+            for window in _windows(records, self.batch_size):
+                # Следующее окно готовится в пуле, пока вставляется текущее
+                if pool is not None:
+                    prepared = pool.map_async(prepare_article, window, chunksize)
+                else:
+                    prepared = [prepare_article(record) for record in window]
+                if pending is not None:
+                    insert(pending[0], pending[1].get() if pool is not None else pending[1])
+                pending = (window, prepared)
+            if pending is not None:
+                insert(pending[0], pending[1].get() if pool is not None else pending[1])
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if self.rebuild_indexes:
+                self._create_indexes(db)
+
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        stats['rate'] = round(stats['inserted'] / stats['seconds'], 1) if stats['seconds'] else 0.0
+        SystemLogger.info(f"Импорт базы знаний: {stats['inserted']} статей за {stats['seconds']} с "
+                          f"(пропущено {stats['skipped']}, ошибок {len(errors)})", 'knowledge', uploaded_by)
+        return stats
+
+    @staticmethod
+    def _drop_indexes(db):
+        """Удаление вторичных индексов базы знаний на время загрузки"""
+        for name in KNOWLEDGE_INDEXES:
+            db.execute(f'DROP INDEX IF EXISTS {name}')
+        db.commit()
+
+    @staticmethod
+    def _create_indexes(db):
+        """Построение индексов после загрузки и обновление статистики планировщика"""
+        for index_sql in KNOWLEDGE_INDEXES.values():
+            db.execute(index_sql)
+        db.execute('ANALYZE knowledge_base')
+        db.commit()
+
+
+class KnowledgeImportJobs:
+    """
+    Класс KnowledgeImportJobs выполняет импорт, загруженный через панель
+    эксперта, в фоновом потоке (не больше одного импорта на процесс).
+    Состояние последнего импорта доступно через status().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = None
+
+    def start(self, app, directory, **options):
+        """
+        Запуск импорта файлов каталога.
+
+        Args:
+            app (Flask): Приложение (для контекста фонового потока)
+            directory (str): Каталог загруженных файлов (удаляется после импорта)
+            **options: Аргументы KnowledgeImporter.run
+
+        Returns:
+            bool: False, если предыдущий импорт ещё выполняется
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._status = {'state': 'running', 'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                            'read': 0, 'inserted': 0, 'skipped': 0, 'errors': 0, 'seconds': 0.0, 'rate': 0.0}
+            self._thread = threading.Thread(target=self._run, args=(app, directory, options),
+                                            name='knowledge-import', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, app, directory, options):
+        """Импорт в фоновом потоке"""
+        with app.app_context():
+            try:
+                # Сервер продолжает отвечать в чате: индексы на время импорта не удаляются
+                stats = KnowledgeImporter(rebuild_indexes=False).run([directory], progress=self._status.update,
+                                                                     **options)
+                # Пути к временному каталогу в ответе не нужны
+                error_lines = [os.path.relpath(error, directory) if error.startswith(directory) else error
+                               for error in stats['errors'][:20]]
+                self._status.update(stats, state='done', errors=len(stats['errors']), error_lines=error_lines)
+            except Exception as e:
+                print(f"⚠️ Ошибка импорта базы знаний: {e}")
+                self._status.update(state='failed', error=str(e))
+            finally:
+                Database().close_connection()
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def status(self):
+        """
+        Состояние последнего импорта.
+
+        Returns:
+            dict или None: state (running, done, failed) и статистика
+        """
+        return dict(self._status) if self._status else None
+
+
+knowledge_import_jobs = KnowledgeImportJobs()
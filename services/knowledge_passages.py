@@ -0,0 +1,163 @@
+"""
+Фрагменты статей базы знаний
+Статьи при добавлении делятся на фрагменты по заголовкам и абзацам
+(с перекрытием соседних фрагментов); ответ помощника собирается
+из лучшего фрагмента, а не из всей статьи
+"""
+import re
+
+from config import Config
+from utils.database import Database
+from utils.lemmatizer import lemmas
+
+# Заголовок раздела: строка Markdown с # или «Статья/Глава/Раздел N»
+HEADING_RE = re.compile(r'^(?:#{1,6}\s+\S.*|(?:Статья|Глава|Раздел|Параграф|§)\s*\d+(?:\.\d+)*\.?(?:\s.*)?)$',
+                        re.IGNORECASE)
+MAX_HEADING_LENGTH = 200
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+SENTENCE_RE = re.compile(r'(?<=[.!?…;])\s+')
+
+INSERT_SQL = '''
+             INSERT INTO knowledge_passages (knowledge_id, position, heading, content, lemmas)
+             VALUES (?, ?, ?, ?, ?)
+             '''
+
+
+def _pieces(paragraph, max_chars):
+    """Абзац целиком или, если он длиннее max_chars, по предложениям (длинные - по словам)"""
+    if len(paragraph) <= max_chars:
+        yield paragraph
+        return
+    for sentence in SENTENCE_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            yield sentence
+
+
+def _tail(text, overlap):
+    """Последние целые предложения текста общей длиной не больше overlap символов"""
+    tail = ''
+    for sentence in reversed(SENTENCE_RE.split(text)):
+        candidate = f'{sentence} {tail}' if tail else sentence
+        if len(candidate) > overlap:
+            break
+        tail = candidate
+    return tail
+
+
+def split_passages(content, max_chars=None, overlap=None):
+    """
+    Деление статьи на фрагменты.
+
+    Заголовок начинает новый фрагмент и запоминается для всех фрагментов
+    своего раздела. Абзацы собираются во фрагмент, пока он не длиннее
+    max_chars; следующий фрагмент раздела начинается с последних
+    предложений предыдущего (не больше overlap символов).
+
+    Args:
+        content (str): Содержимое статьи (нормализованное)
+        max_chars (int): Наибольшая длина фрагмента (по умолчанию KNOWLEDGE_PASSAGE_MAX_CHARS)
+        overlap (int): Перекрытие соседних фрагментов (по умолчанию KNOWLEDGE_PASSAGE_OVERLAP)
+
+    Returns:
+        list: Пары (заголовок раздела или None, текст фрагмента)
+    """
+    max_chars = max_chars or Config.KNOWLEDGE_PASSAGE_MAX_CHARS
+    overlap = Config.KNOWLEDGE_PASSAGE_OVERLAP if overlap is None else overlap
+    passages = []
+    heading = None
+    parts = []  # (разделитель, текст) текущего фрагмента
+    size = 0
+    fresh = False  # во фрагменте есть текст помимо заголовка и перекрытия
+
+    def emit():
+        if fresh:
+            passages.append((heading, ''.join(separator + text for separator, text in parts).strip()))
+
+    for paragraph in PARAGRAPH_RE.split(content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if '\n' not in paragraph and len(paragraph) <= MAX_HEADING_LENGTH and HEADING_RE.match(paragraph):
+            emit()
+            heading = paragraph.lstrip('# ')
+            parts, size, fresh = [('', paragraph)], len(paragraph), False
+            continue
+        for number, piece in enumerate(_pieces(paragraph, max_chars)):
+            separator = '\n\n' if number == 0 else ' '
+            if fresh and size + len(separator) + len(piece) > max_chars:
+                emit()
+                tail = _tail(parts[-1][1], overlap) if overlap else ''
+                parts = [('', tail)] if tail else []
+                size = len(tail)
+            parts.append((separator, piece))
+            size += len(separator) + len(piece)
+            fresh = True
+    emit()
+    return passages
+
+
+def prepare_passages(content):
+    """
+    Фрагменты статьи с леммами (для вставки в knowledge_passages).
+
+    Args:
+        content (str): Содержимое статьи
+
+    Returns:
+        list: Кортежи (позиция, заголовок, текст, леммы)
+    """
+    passages = []
+    for position, (heading, text) in enumerate(split_passages(content)):
+        # Заголовок раздела - часть текста продолжений раздела при поиске
+        continued = heading and not text.lstrip('# ').startswith(heading)
+        passages.append((position, heading, text, ' '.join(lemmas(f'{heading}\n{text}' if continued else text))))
+    return passages
+
+
+def passage_rows(knowledge_id, passages):
+    """Строки INSERT_SQL для фрагментов статьи knowledge_id"""
+    return [(knowledge_id,) + passage for passage in passages]
+
+
+def backfill_passages(batch_size=500, rebuild=False):
+    """
+    Фрагменты статей, добавленных без них (БД предыдущих версий,
+    вставка мимо KnowledgeService).
+
+    Args:
+        batch_size (int): Статей в одной транзакции
+        rebuild (bool): Удалить все фрагменты и построить заново
+            (после изменения KNOWLEDGE_PASSAGE_MAX_CHARS или KNOWLEDGE_PASSAGE_OVERLAP)
+
+    Returns:
+        int: Число обработанных статей
+    """
+    db = Database()
+    if rebuild:
+        db.execute('DELETE FROM knowledge_passages')
+        db.commit()
+
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.execute_all('''
+                              SELECT kb.id, kb.content
+                              FROM knowledge_base kb
+                              WHERE kb.id > ?
+                                AND NOT EXISTS (SELECT 1 FROM knowledge_passages p WHERE p.knowledge_id = kb.id)
+                              ORDER BY kb.id
+                              LIMIT ?
+                              ''', (last_id, batch_size))
+        if not rows:
+            return count
+        db.execute_many(INSERT_SQL, [row for article in rows
+                                     for row in passage_rows(article['id'], prepare_passages(article['content']))])
+        db.commit()
+        count += len(rows)
+        last_id = rows[-1]['id']
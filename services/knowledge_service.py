@@ -2,11 +2,37 @@
 Сервис работы с базой знаний
 Представляет подсистему базы знаний
 """
-from models.knowledge import KnowledgeBase
+from config import Config
+from models.knowledge import KnowledgeBase, KnowledgePassage
 from utils.database import Database
+from utils.lemmatizer import TOKEN_RE, lemmas
 from utils.logger import SystemLogger
 
 
+def _match_terms(text, prefix=False):
+    """
+    Термы запроса FTS5 - леммы слов текста (короткие леммы - предлоги,
+    союзы - не учитываются).
+
+    Args:
+        text (str): Текст
+        prefix (bool): Искать термы как начало леммы и добавить сами слова:
+            ключ поиска интента бывает основой слова («наследств»)
+
+    Returns:
+        list: Термы в кавычках, без повторов
+    """
+    words = TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+    terms = list(zip(words, lemmas(text))) if prefix else [(None, lemma) for lemma in lemmas(text)]
+    suffix = '*' if prefix else ''
+    result = []
+    for word, lemma in terms:
+        for term in (lemma, word):
+            if term and len(term) > 2 and f'"{term}"{suffix}' not in result:
+                result.append(f'"{term}"{suffix}')
+    return result
+
+
 class KnowledgeService:
     """
     Сервис KnowledgeService обеспечивает работу с базой юридических знаний.
@@ -15,9 +41,12 @@ class KnowledgeService:
 
     @staticmethod
     def add_knowledge(title, content, category, source, icon='📚',
-                      uploaded_by=None, is_verified=False):
+                      uploaded_by=None, is_verified=False, duplicates=None):
         """
-        Добавление материала в базу знаний.
+        Добавление материала в базу знаний (вместе с его фрагментами).
+        Почти дубликат уже добавленной статьи (MinHash + LSH) отмечается
+        ссылкой на неё (duplicates='flag') или заменяет её содержимое ('merge');
+        заменённая статья сохраняет свою отметку верификации.
 
         Args:
             title (str): Название
@@ -26,24 +55,59 @@ class KnowledgeService:
             source (str): Источник
             icon (str): Иконка
             uploaded_by (int): ID загрузившего
-            is_verified (bool): Верифицирован ли
+            is_verified (bool): Верифицирован ли (только для новой статьи)
+            duplicates (str): flag, merge или off (по умолчанию KNOWLEDGE_DUPLICATES)
 
         Returns:
-            int: ID созданной записи
+            int: ID созданной записи (при объединении - ID заменённой)
         """
+        from .knowledge_import import lemmatize
+        from .knowledge_passages import INSERT_SQL, passage_rows, prepare_passages
+        from . import near_duplicates
+
+        duplicates = duplicates or Config.KNOWLEDGE_DUPLICATES
         db = Database()
 
-        cursor = db.execute('''
-                            INSERT INTO knowledge_base (title, content, category, source, icon,
-                                                        uploaded_by, is_verified)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (title, content, category, source, icon, uploaded_by, is_verified))
+        lemmas = lemmatize(title, content)
+        minhash = near_duplicates.article_signature(lemmas)
+        similar = near_duplicates.find_similar_articles(lemmas) if duplicates != 'off' else []
+        duplicate, score = similar[0] if similar else (None, None)
+
+        if duplicate is not None and duplicates == 'merge':
+            knowledge_id = duplicate['id']
+            db.execute('''
+                       UPDATE knowledge_base
+                       SET title       = ?,
+                           content     = ?,
+                           category    = COALESCE(?, category),
+                           source      = COALESCE(?, source),
+                           icon        = ?,
+                           lemmas      = ?,
+                           minhash     = ?
+                       WHERE id = ?
+                       ''', (title, content, category or None, source or None, icon, lemmas, minhash, knowledge_id))
+            db.execute('DELETE FROM knowledge_passages WHERE knowledge_id = ?', (knowledge_id,))
+            db.execute('DELETE FROM knowledge_lsh WHERE knowledge_id = ?', (knowledge_id,))
+            message = f'Материал объединён с похожим #{knowledge_id} (сходство {score:.0%}): {title}'
+        else:
+            cursor = db.execute('''
+                                INSERT INTO knowledge_base (title, content, category, source, icon, uploaded_by,
+                                                            is_verified, lemmas, minhash, duplicate_of,
+                                                            duplicate_score)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                                ''', (title, content, category, source, icon, uploaded_by, is_verified, lemmas,
+                                      minhash, duplicate['id'] if duplicate is not None else None, score))
+            knowledge_id = cursor.lastrowid
+            message = f'Добавлен материал в базу знаний: {title}'
+            if duplicate is not None:
+                message += f' (похож на #{duplicate["id"]} «{duplicate["title"]}», сходство {score:.0%})'
+        db.execute_many(INSERT_SQL, passage_rows(knowledge_id, prepare_passages(content)))
+        db.execute_many(near_duplicates.LSH_INSERT_SQL, near_duplicates.lsh_rows(knowledge_id, minhash))
 
         db.commit()
-        knowledge_id = cursor.lastrowid
 
         SystemLogger.info(
-            f'Добавлен материал в базу знаний: {title}',
+            message,
             'knowledge',
             uploaded_by
         )
@@ -51,13 +115,15 @@ class KnowledgeService:
         return knowledge_id
 
     @staticmethod
-    def search_knowledge(query, category=None):
+    def search_knowledge(query, category=None, categories=None):
         """
         Поиск в базе знаний.
 
         Args:
             query (str): Поисковый запрос
             category (str): Категория для фильтрации
+            categories (tuple): Категории профиля помощника, если category не задана
+                (None - поиск по всем категориям)
 
         Returns:
             list: Список найденных записей
@@ -74,6 +140,17 @@ class KnowledgeService:
                   ORDER BY uploaded_at DESC \
                   '''
             params = (f'%{query}%', f'%{query}%', category)
+        elif categories:
+            placeholders = ', '.join('?' * len(categories))
+            sql = f'''
+                  SELECT * \
+                  FROM knowledge_base
+                  WHERE (title LIKE ? OR content LIKE ?)
+                    AND category IN ({placeholders})
+                    AND is_verified = 1
+                  ORDER BY uploaded_at DESC \
+                  '''
+            params = (f'%{query}%', f'%{query}%', *categories)
         else:
             sql = '''
                   SELECT * \
@@ -87,6 +164,56 @@ class KnowledgeService:
         rows = db.execute_all(sql, params)
         return [KnowledgeBase.from_db_row(row) for row in rows]
 
+    @staticmethod
+    def search_passages(query, text=None, category=None, categories=None, limit=1):
+        """
+        Поиск фрагментов статей.
+
+        Фрагменты проверенных статей ищутся по полнотекстовому индексу лемм
+        (knowledge_passages_fts): нужна хотя бы одна лемма query (или слово
+        query как начало леммы), ранжирование - BM25 по леммам query и text
+        в самом SQLite, до ограничения числа результатов.
+
+        Args:
+            query (str): Поисковый запрос
+            text (str): Текст вопроса для ранжирования
+            category (str): Категория для фильтрации
+            categories (tuple): Категории профиля помощника, если category не задана
+
+        Returns:
+            list: Не больше limit фрагментов (KnowledgePassage), лучшие первыми
+        """
+        required = _match_terms(query, prefix=True)
+        if not required:
+            return []
+        # Каждый фрагмент уже содержит лемму query: термы text влияют только на ранжирование
+        optional = _match_terms(text or '')
+        match = f"({' OR '.join(required)}) AND ({' OR '.join(required + optional)})"
+
+        db = Database()
+        conditions = ['knowledge_passages_fts MATCH ?', 'kb.is_verified = 1']
+        params = [match]
+        if category:
+            conditions.append('kb.category = ?')
+            params.append(category)
+        elif categories:
+            conditions.append(f"kb.category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        params.append(limit)
+
+        rows = db.execute_all(f'''
+                              SELECT p.id, p.knowledge_id, p.position, p.heading, p.content,
+                                     kb.title, kb.category, kb.source, kb.icon,
+                                     -bm25(knowledge_passages_fts) AS score
+                              FROM knowledge_passages_fts
+                                       JOIN knowledge_passages p ON p.id = knowledge_passages_fts.rowid
+                                       JOIN knowledge_base kb ON kb.id = p.knowledge_id
+                              WHERE {' AND '.join(conditions)}
+                              ORDER BY bm25(knowledge_passages_fts), p.position
+                              LIMIT ?
+                              ''', params)
+        return [KnowledgePassage.from_db_row(row, round(row['score'], 4)) for row in rows]
+
     @staticmethod
     def get_all_knowledge():
         """
@@ -97,9 +224,10 @@ class KnowledgeService:
         """
         db = Database()
         rows = db.execute_all('''
-                              SELECT kb.*, u.username as uploader_name
+                              SELECT kb.*, u.username as uploader_name, d.title as duplicate_title
                               FROM knowledge_base kb
                                        LEFT JOIN users u ON kb.uploaded_by = u.id
+                                       LEFT JOIN knowledge_base d ON kb.duplicate_of = d.id
                               ORDER BY kb.uploaded_at DESC
                               ''')
         return rows
@@ -0,0 +1,148 @@
+"""
+Загрузка компонентов Natasha по этапам
+Набор этапов задаётся в Config.NLP_PIPELINE: неиспользуемые не загружаются,
+необязательные загружаются при первом обращении
+"""
+import os
+import threading
+import time
+
+from config import Config
+
+# Режимы этапа: eager - при создании NLPService, lazy - при первом обращении,
+# off - не загружается никогда
+MODES = ('eager', 'lazy', 'off')
+
+# Этапы, без которых анализ Natasha невозможен (иначе - rule-based)
+ANALYSIS_STAGES = ('segmenter', 'morph_vocab', 'morph_tagger')
+
+
+def _factories():
+    """Этап -> (зависимости, функция создания)"""
+    import natasha
+
+    return {
+        'segmenter': ((), lambda deps: natasha.Segmenter()),
+        'morph_vocab': ((), lambda deps: natasha.MorphVocab()),
+        'embedding': ((), lambda deps: natasha.NewsEmbedding()),
+        'morph_tagger': (('embedding',), lambda deps: natasha.NewsMorphTagger(deps['embedding'])),
+        'syntax_parser': (('embedding',), lambda deps: natasha.NewsSyntaxParser(deps['embedding'])),
+        'ner_tagger': (('embedding',), lambda deps: natasha.NewsNERTagger(deps['embedding'])),
+        'names_extractor': (('morph_vocab',), lambda deps: natasha.NamesExtractor(deps['morph_vocab'])),
+    }
+
+
+def _rss_kb():
+    """Текущий RSS процесса в КБ (без /proc - пиковый RSS, на Windows - None)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageDisabled(LookupError):
+    """Этап выключен в Config.NLP_PIPELINE"""
+
+
+class NatashaPipeline:
+    """
+    Класс NatashaPipeline создаёт компоненты Natasha по конфигурации этапов.
+
+    Зависимости (например, embedding для morph_tagger) загружаются вместе
+    с этапом, даже если сами выключены. Для каждого загруженного компонента
+    запоминаются время загрузки и прирост RSS процесса.
+    """
+
+    def __init__(self, stages=None):
+        """
+        Args:
+            stages (dict): Этап -> режим (по умолчанию Config.NLP_PIPELINE)
+        """
+        self.factories = _factories()
+        self.modes = dict(stages if stages is not None else Config.NLP_PIPELINE)
+        unknown = set(self.modes) - set(self.factories)
+        if unknown:
+            raise ValueError(f'Неизвестные этапы NLP_PIPELINE: {", ".join(sorted(unknown))}')
+        for stage, mode in self.modes.items():
+            if mode not in MODES:
+                raise ValueError(f'Неизвестный режим этапа {stage}: {mode}')
+
+        self._components = {}
+        self._stats = {}
+        self._lock = threading.RLock()
+
+        for stage, mode in self.modes.items():
+            if mode == 'eager':
+                self.get(stage)
+
+    @property
+    def analysis_ready(self):
+        """Включены ли этапы, нужные для анализа запросов"""
+        return all(self.modes.get(stage, 'off') != 'off' for stage in ANALYSIS_STAGES)
+
+    def get(self, stage):
+        """
+        Компонент этапа (загружается при первом обращении).
+
+        Raises:
+            StageDisabled: Этап выключен в конфигурации
+        """
+        component = self._components.get(stage)
+        if component is not None:
+            return component
+        if self.modes.get(stage, 'off') == 'off':
+            raise StageDisabled(f'Этап NLP {stage} выключен в Config.NLP_PIPELINE')
+        return self.load(stage)
+
+    def load(self, stage):
+        """
+        Загрузка этапа и его зависимостей с замером времени и памяти
+        независимо от режима (в том числе выключенного - для сравнения
+        в flask nlp-pipeline --all).
+
+        Returns:
+            object: Компонент этапа
+        """
+        with self._lock:
+            if stage in self._components:
+                return self._components[stage]
+            dependencies, factory = self.factories[stage]
+            deps = {name: self._components.get(name) or self.load(name) for name in dependencies}
+
+            rss_before = _rss_kb()
+            started = time.perf_counter()
+            component = factory(deps)
+            rss_after = _rss_kb()
+            self._stats[stage] = {
+                'seconds': round(time.perf_counter() - started, 3),
+                'rss_kb': max(rss_after - rss_before, 0) if rss_before is not None else None,
+            }
+            self._components[stage] = component
+            return component
+
+    def report(self):
+        """
+        Состояние этапов.
+
+        Returns:
+            list: Этап, режим, загружен ли (выключенный этап может быть
+                загружен как зависимость), время загрузки и прирост памяти
+                (None, если память процесса не измеряется)
+        """
+        report = []
+        for stage in self.factories:
+            stats = self._stats.get(stage, {})
+            report.append({
+                'stage': stage,
+                'mode': self.modes.get(stage, 'off'),
+                'loaded': stage in self._components,
+                'seconds': stats.get('seconds'),
+                'rss_kb': stats.get('rss_kb'),
+            })
+        return report
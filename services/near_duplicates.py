@@ -0,0 +1,389 @@
+"""
+Поиск почти дубликатов
+MinHash-подписи статей базы знаний и вопросов клиентов и LSH-индекс
+по полосам подписи: похожие тексты находятся по общим корзинам, без
+попарного сравнения, а кандидаты проверяются точной мерой Жаккара
+"""
+import struct
+import zlib
+
+from config import Config
+from utils.database import Database
+from utils.lemmatizer import lemmas
+
+# Подпись - одна перестановка (хеш шингла) на SIGNATURE_SIZE корзин:
+# старшие 6 бит хеша выбирают корзину, младшие 26 - значение
+SIGNATURE_SIZE = 64
+VALUE_BITS = 26
+EMPTY = 1 << VALUE_BITS
+SIGNATURE_FORMAT = f'<{SIGNATURE_SIZE}I'
+_MIX = 0x9E3779B1
+
+# Шинглы: статьи - тройки лемм (порядок слов важен), вопросы - отдельные леммы
+ARTICLE_SHINGLE_SIZE = 3
+QUESTION_SHINGLE_SIZE = 1
+
+# Строк подписи в полосе LSH: 16 полос по 4 для статей (порог ~0.8),
+# 32 полосы по 2 для коротких вопросов (порог ~0.6)
+ARTICLE_BAND_ROWS = 4
+QUESTION_BAND_ROWS = 2
+
+# Кандидатов из LSH-индекса, проверяемых точно
+MAX_ARTICLE_CANDIDATES = 20
+MAX_QUESTION_CANDIDATES = 8
+
+# Вопросов группы в очереди эксперта (решение по группе применяется только к показанным)
+MAX_GROUP_MEMBERS = 50
+
+LSH_INSERT_SQL = 'INSERT INTO knowledge_lsh (bucket, knowledge_id) VALUES (?, ?)'
+QUESTION_LSH_INSERT_SQL = 'INSERT INTO question_lsh (bucket, group_id) VALUES (?, ?)'
+
+
+def shingles(tokens, size):
+    """
+    Хеши шинглов последовательности лемм (леммы короче 3 букв - предлоги,
+    союзы - пропускаются).
+
+    Args:
+        tokens (list): Леммы
+        size (int): Лемм в шингле
+
+    Returns:
+        set: 32-битные хеши шинглов
+    """
+    tokens = [token for token in tokens if len(token) > 2]
+    if len(tokens) < size:
+        grams = [' '.join(tokens)] if tokens else []
+    else:
+        grams = [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return {(zlib.crc32(gram.encode('utf-8')) * _MIX) & 0xFFFFFFFF for gram in grams}
+
+
+def signature(hashes):
+    """
+    MinHash-подпись с одной перестановкой: минимум хешей в каждой корзине,
+    пустые корзины заполняются значением ближайшей непустой справа
+    (со сдвигом на расстояние, чтобы не совпадать с настоящими значениями).
+
+    Args:
+        hashes (set): Хеши шинглов
+
+    Returns:
+        tuple: SIGNATURE_SIZE чисел или None для пустого текста
+    """
+    if not hashes:
+        return None
+    bins = [EMPTY] * SIGNATURE_SIZE
+    mask = EMPTY - 1
+    for value in hashes:
+        number = value >> VALUE_BITS
+        if value & mask < bins[number]:
+            bins[number] = value & mask
+    result = list(bins)
+    nearest, distance = None, 0
+    for i in range(2 * SIGNATURE_SIZE - 1, -1, -1):
+        number = i % SIGNATURE_SIZE
+        if bins[number] != EMPTY:
+            nearest, distance = bins[number], 0
+        else:
+            distance += 1
+            if i < SIGNATURE_SIZE:
+                result[number] = nearest + distance * EMPTY
+    return tuple(result)
+
+
+def pack(sig):
+    """Подпись в BLOB для БД"""
+    return struct.pack(SIGNATURE_FORMAT, *sig) if sig is not None else None
+
+
+def unpack(blob):
+    """Подпись из BLOB"""
+    return struct.unpack(SIGNATURE_FORMAT, blob) if blob else None
+
+
+def band_keys(sig, rows):
+    """
+    Корзины LSH подписи: по одной на полосу из rows значений
+    (номер полосы - в старших битах, полосы не пересекаются).
+    """
+    return [(band << 32) | zlib.crc32(struct.pack(f'<{rows}I', *sig[start:start + rows]))
+            for band, start in enumerate(range(0, SIGNATURE_SIZE, rows))]
+
+
+def jaccard(first, second):
+    """Мера Жаккара двух множеств шинглов"""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def article_shingles(article_lemmas):
+    """Шинглы статьи по столбцу knowledge_base.lemmas"""
+    return shingles((article_lemmas or '').split(), ARTICLE_SHINGLE_SIZE)
+
+
+def article_signature(article_lemmas):
+    """Подпись статьи (BLOB) по её леммам; у статьи без шинглов - пустая"""
+    return pack(signature(article_shingles(article_lemmas))) or b''
+
+
+def question_signature(text):
+    """Подпись вопроса клиента (BLOB для chat_messages.minhash)"""
+    return pack(signature(shingles(lemmas(text), QUESTION_SHINGLE_SIZE)))
+
+
+def lsh_rows(knowledge_id, blob):
+    """Строки LSH_INSERT_SQL для статьи с подписью blob"""
+    sig = unpack(blob)
+    if sig is None:
+        return []
+    return [(key, knowledge_id) for key in band_keys(sig, ARTICLE_BAND_ROWS)]
+
+
+def find_similar_articles(article_lemmas, threshold=None, exclude_id=None):
+    """
+    Почти дубликаты статьи в базе знаний.
+
+    Кандидаты - статьи с общими корзинами LSH (больше общих полос - раньше),
+    их сходство считается точно по шинглам лемм.
+
+    Args:
+        article_lemmas (str): Леммы статьи (как в knowledge_base.lemmas)
+        threshold (float): Наименьшая мера Жаккара (по умолчанию DUPLICATE_ARTICLE_THRESHOLD)
+        exclude_id (int): Не считать дубликатом эту статью
+
+    Returns:
+        list: Пары (строка статьи: id, title, is_verified; сходство), самые похожие первыми
+    """
+    threshold = Config.DUPLICATE_ARTICLE_THRESHOLD if threshold is None else threshold
+    hashes = article_shingles(article_lemmas)
+    sig = signature(hashes)
+    if sig is None:
+        return []
+    keys = band_keys(sig, ARTICLE_BAND_ROWS)
+
+    db = Database()
+    rows = db.execute_all(f'''
+                          SELECT kb.id, kb.title, kb.is_verified, kb.lemmas
+                          FROM (SELECT knowledge_id, COUNT(*) AS bands
+                                FROM knowledge_lsh
+                                WHERE bucket IN ({', '.join('?' * len(keys))})
+                                GROUP BY knowledge_id
+                                ORDER BY bands DESC
+                                LIMIT ?) candidates
+                                   JOIN knowledge_base kb ON kb.id = candidates.knowledge_id
+                          ''', (*keys, MAX_ARTICLE_CANDIDATES))
+
+    similar = []
+    for row in rows:
+        if row['id'] == exclude_id:
+            continue
+        score = jaccard(hashes, article_shingles(row['lemmas']))
+        if score >= threshold:
+            similar.append((row, score))
+    similar.sort(key=lambda item: -item[1])
+    return similar
+
+
+def question_rows(group_id, sig):
+    """Строки QUESTION_LSH_INSERT_SQL для группы вопросов с подписью лидера sig"""
+    return [(key, group_id) for key in band_keys(sig, QUESTION_BAND_ROWS)]
+
+
+def assign_question_group(db, message_id, threshold=None):
+    """
+    Группа почти одинаковых вопросов для готового сообщения (очередь
+    верификации эксперта).
+
+    Кандидаты - группы с общими корзинами LSH первого вопроса группы
+    (больше общих полос - раньше), их сходство проверяется точно по леммам.
+    Похожего сообщения нет - оно открывает новую группу, и полосы его
+    подписи попадают в индекс question_lsh. Сообщение становится
+    представителем группы в очереди (самым новым её вопросом).
+
+    Args:
+        db (Database): Подключение (фиксация - у вызывающего)
+        message_id (int): ID сообщения
+        threshold (float): Наименьшая мера Жаккара (по умолчанию DUPLICATE_QUESTION_THRESHOLD)
+    """
+    threshold = Config.DUPLICATE_QUESTION_THRESHOLD if threshold is None else threshold
+    message = db.execute_one('SELECT message, minhash, question_group FROM chat_messages WHERE id = ?',
+                             (message_id,))
+    if message is None or message['question_group'] is not None:
+        return
+    hashes = shingles(lemmas(message['message'] or ''), QUESTION_SHINGLE_SIZE)
+    sig = unpack(message['minhash']) or signature(hashes)
+
+    group = None
+    if sig is not None:
+        keys = band_keys(sig, QUESTION_BAND_ROWS)
+        candidates = db.execute_all(f'''
+                                    SELECT cm.id, cm.message
+                                    FROM (SELECT group_id, COUNT(*) AS bands
+                                          FROM question_lsh
+                                          WHERE bucket IN ({', '.join('?' * len(keys))})
+                                          GROUP BY group_id
+                                          ORDER BY bands DESC
+                                          LIMIT ?) candidates
+                                             JOIN chat_messages cm ON cm.id = candidates.group_id
+                                    ORDER BY candidates.bands DESC
+                                    ''', (*keys, MAX_QUESTION_CANDIDATES))
+        for candidate in candidates:
+            if jaccard(hashes, shingles(lemmas(candidate['message'] or ''), QUESTION_SHINGLE_SIZE)) >= threshold:
+                group = candidate['id']
+                break
+
+    if group is None:
+        group = message_id
+        if sig is not None:
+            db.execute_many(QUESTION_LSH_INSERT_SQL, question_rows(group, sig))
+    else:
+        db.execute('UPDATE chat_messages SET question_leader = 0 WHERE question_group = ? AND question_leader = 1',
+                   (group,))
+    db.execute('UPDATE chat_messages SET question_group = ?, question_leader = 1 WHERE id = ?', (group, message_id))
+
+
+def refresh_question_groups(db, groups):
+    """
+    Представители групп вопросов после верификации или удаления сообщений:
+    самый новый ещё не проверенный вопрос группы. Группа без таких вопросов
+    уходит из LSH-индекса - новые вопросы к ней не присоединяются.
+
+    Args:
+        db (Database): Подключение (фиксация - у вызывающего)
+        groups (iterable): ID групп (question_group)
+    """
+    for group in groups:
+        newest = db.execute_one('''
+                                SELECT id
+                                FROM chat_messages
+                                WHERE question_group = ?
+                                  AND is_verified = 0
+                                  AND status = 'done'
+                                ORDER BY id DESC
+                                LIMIT 1
+                                ''', (group,))
+        newest_id = newest['id'] if newest is not None else None
+        db.execute('''
+                   UPDATE chat_messages
+                   SET question_leader = 0
+                   WHERE question_group = ?
+                     AND question_leader = 1
+                     AND id IS NOT ?
+                   ''', (group, newest_id))
+        if newest_id is not None:
+            db.execute('UPDATE chat_messages SET question_leader = 1 WHERE id = ?', (newest_id,))
+        else:
+            db.execute('DELETE FROM question_lsh WHERE group_id = ?', (group,))
+
+
+def get_question_groups(db, page=1, page_size=20, members=MAX_GROUP_MEMBERS):
+    """
+    Страница очереди верификации: группы почти одинаковых вопросов,
+    группа с самым новым сообщением первой.
+
+    Args:
+        db (Database): Подключение
+        page (int): Номер страницы, начиная с 1
+        page_size (int): Групп на странице
+        members (int): Наибольшее число сообщений группы на странице
+
+    Returns:
+        tuple: (группы - списки строк chat_messages с user_name, user_color,
+            assistant_name, assistant_icon, новые первыми; есть ли следующая страница)
+    """
+    leaders = db.execute_all('''
+                             SELECT question_group
+                             FROM chat_messages
+                             WHERE question_leader = 1
+                             ORDER BY id DESC
+                             LIMIT ? OFFSET ?
+                             ''', (page_size + 1, (page - 1) * page_size))
+    groups = []
+    for leader in leaders[:page_size]:
+        groups.append(db.execute_all('''
+                                     SELECT cm.*,
+                                            u.username     as user_name,
+                                            u.avatar_color as user_color,
+                                            a.name         as assistant_name,
+                                            a.icon         as assistant_icon
+                                     FROM chat_messages cm
+                                              JOIN users u ON cm.user_id = u.id
+                                              LEFT JOIN assistants a ON cm.assistant_id = a.id
+                                     WHERE cm.question_group = ?
+                                       AND cm.is_verified = 0
+                                       AND cm.status = 'done'
+                                     ORDER BY cm.id DESC
+                                     LIMIT ?
+                                     ''', (leader['question_group'], members)))
+    return [group for group in groups if group], len(leaders) > page_size
+
+
+def backfill_question_groups(batch_size=500):
+    """
+    Группы непроверенных вопросов, сохранённых без них (БД предыдущих
+    версий, вставка мимо ChatService).
+
+    Returns:
+        int: Число обработанных сообщений
+    """
+    db = Database()
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.execute_all('''
+                              SELECT id
+                              FROM chat_messages
+                              WHERE id > ?
+                                AND question_group IS NULL
+                                AND is_verified = 0
+                                AND status = 'done'
+                              ORDER BY id
+                              LIMIT ?
+                              ''', (last_id, batch_size))
+        if not rows:
+            return count
+        for row in rows:
+            assign_question_group(db, row['id'])
+        db.commit()
+        count += len(rows)
+        last_id = rows[-1]['id']
+
+
+def backfill_signatures(batch_size=500):
+    """
+    Подписи и LSH-индекс статей, добавленных без них (БД предыдущих
+    версий, вставка мимо KnowledgeService).
+
+    Returns:
+        int: Число обработанных статей
+    """
+    from .knowledge_import import lemmatize
+
+    db = Database()
+    count = 0
+    last_id = 0
+    while True:
+        rows = db.execute_all('''
+                              SELECT id, title, content, lemmas
+                              FROM knowledge_base
+                              WHERE id > ?
+                                AND minhash IS NULL
+                              ORDER BY id
+                              LIMIT ?
+                              ''', (last_id, batch_size))
+        if not rows:
+            return count
+        updates = []
+        index = []
+        for row in rows:
+            article_lemmas = row['lemmas'] if row['lemmas'] is not None else lemmatize(row['title'], row['content'])
+            blob = article_signature(article_lemmas)
+            updates.append((article_lemmas, blob, row['id']))
+            index.extend(lsh_rows(row['id'], blob))
+        db.execute_many('UPDATE knowledge_base SET lemmas = ?, minhash = ? WHERE id = ?', updates)
+        db.execute_many(LSH_INSERT_SQL, index)
+        db.commit()
+        count += len(rows)
+        last_id = rows[-1]['id']
@@ -0,0 +1,272 @@
+"""
+Пул процессов для NLP обработки
+Выносит анализ Natasha из потоков обработки HTTP-запросов
+"""
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import Flask
+from config import Config
+from utils.database import Database
+from utils.metrics import metrics, StageTimer
+from .nlp_service import NLPService, record_timings
+
+# Состояние рабочего процесса: у каждого процесса своя загруженная модель
+_worker_nlp = None
+_worker_app = None
+
+
+def _init_worker(database):
+    """
+    Инициализация рабочего процесса пула.
+    Загружает NLPService один раз на процесс.
+
+    Args:
+        database (str): Путь к файлу БД родительского процесса
+    """
+    global _worker_nlp, _worker_app
+    Config.DATABASE = database
+    _worker_app = Flask(__name__)
+    _worker_nlp = NLPService()
+
+
+def _run_query(text, assistant_id=None):
+    """Обработка запроса внутри рабочего процесса"""
+    with _worker_app.app_context():
+        try:
+            return _worker_nlp.process_query(text, assistant_id)
+        finally:
+            Database().close_connection()
+
+
+def _run_analyze(text, assistant_id=None):
+    """Определение интента и категории внутри рабочего процесса"""
+    with _worker_app.app_context():
+        try:
+            return _worker_nlp.analyze(text, assistant_id=assistant_id)
+        finally:
+            Database().close_connection()
+
+
+class NLPExecutor:
+    """
+    Класс NLPExecutor распределяет NLP-запросы по пулу процессов.
+
+    Каждый процесс держит собственный экземпляр NLPService, поэтому
+    разбор Natasha не блокирует GIL процесса веб-сервера. Если задача
+    не уложилась в таймаут, очередь переполнена или пул упал, запрос
+    обрабатывается rule-based анализом в текущем потоке (режим деградации).
+
+    Задача, не уложившаяся в таймаут, продолжает выполняться в рабочем
+    процессе (отменить можно только ещё не начатую), поэтому она
+    учитывается в pending, пока процесс её не завершит.
+    """
+
+    def __init__(self, pool_size=None, timeout=None, max_pending=None,
+                 degraded_mode=None, retry_interval=None):
+        self.pool_size = Config.NLP_POOL_SIZE if pool_size is None else pool_size
+        self.timeout = timeout or Config.NLP_POOL_TIMEOUT
+        self.max_pending = max_pending or Config.NLP_POOL_MAX_PENDING
+        self.degraded_mode = Config.NLP_POOL_DEGRADED_MODE if degraded_mode is None else degraded_mode
+        self.retry_interval = retry_interval or Config.NLP_POOL_RETRY_INTERVAL
+
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._futures = set()
+        self._broken_at = None
+        self._inline_nlp = None
+        self._fallback_nlp = NLPService(use_natasha=False)
+
+        self.stats = {'pool': 0, 'inline': 0, 'timeouts': 0, 'overloaded': 0, 'failures': 0}
+
+    @property
+    def pending(self):
+        """Количество задач в пуле, включая продолжающие выполняться после таймаута"""
+        return len(self._futures)
+
+    def _task_done(self, future):
+        """Задача пула завершена, отменена или пул упал"""
+        with self._pending_lock:
+            self._futures.discard(future)
+
+    def _cancel_pending(self):
+        """Отмена ещё не начатых задач пула (cancel_futures появился только в Python 3.9)"""
+        with self._pending_lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    def _get_pool(self):
+        """Ленивый запуск пула (повторный запуск после сбоя - не чаще retry_interval)"""
+        with self._lock:
+            if self._pool is None:
+                if self._broken_at and time.monotonic() - self._broken_at < self.retry_interval:
+                    return None
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context(Config.NLP_POOL_START_METHOD),
+                    initializer=_init_worker,
+                    initargs=(Config.DATABASE,)
+                )
+                self._broken_at = None
+            return self._pool
+
+    def _mark_broken(self):
+        """Остановка упавшего пула"""
+        with self._lock:
+            if self._pool is not None:
+                self._cancel_pending()
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            self._broken_at = time.monotonic()
+
+    def _fallback(self, method, text, reason, assistant_id=None):
+        """Rule-based ответ в текущем потоке"""
+        self.stats[reason] += 1
+        if not self.degraded_mode:
+            raise RuntimeError(f'NLP пул недоступен: {reason}')
+
+        result = getattr(self._fallback_nlp, method)(text, assistant_id=assistant_id)
+        result['degraded'] = True
+        return result
+
+    def _process_inline(self, method, text, assistant_id=None):
+        """Обработка без пула (NLP_POOL_SIZE = 0)"""
+        with self._lock:
+            if self._inline_nlp is None:
+                self._inline_nlp = NLPService()
+        self.stats['inline'] += 1
+        return getattr(self._inline_nlp, method)(text, assistant_id=assistant_id)
+
+    def _call(self, method, task, text, assistant_id=None):
+        """
+        Выполнение метода NLPService с записью замеров этапов в метрики процесса
+        (замеры из рабочих процессов возвращаются вместе с результатом).
+        """
+        result = self._dispatch(method, task, text, assistant_id)
+        record_timings(result.pop('timings', ()), result['intent'], total=(method == 'process_query'),
+                       profile=result.get('profile'))
+        return result
+
+    def _dispatch(self, method, task, text, assistant_id=None):
+        """Выполнение метода NLPService в пуле с таймаутом и деградацией"""
+        if self.pool_size <= 0:
+            return self._process_inline(method, text, assistant_id)
+
+        if self.pending >= self.max_pending:
+            return self._fallback(method, text, 'overloaded', assistant_id)
+
+        pool = self._get_pool()
+        if pool is None:
+            return self._fallback(method, text, 'failures', assistant_id)
+
+        try:
+            future = pool.submit(task, text, assistant_id)
+        except BrokenProcessPool:
+            self._mark_broken()
+            return self._fallback(method, text, 'failures', assistant_id)
+        except RuntimeError:
+            # Пул остановлен другим потоком (_mark_broken, shutdown) после _get_pool
+            return self._fallback(method, text, 'failures', assistant_id)
+
+        try:
+            with self._pending_lock:
+                self._futures.add(future)
+            future.add_done_callback(self._task_done)
+            result = future.result(timeout=self.timeout)
+            self.stats['pool'] += 1
+            return result
+        except FutureTimeoutError:
+            future.cancel()
+            return self._fallback(method, text, 'timeouts', assistant_id)
+        except BrokenProcessPool:
+            self._mark_broken()
+            return self._fallback(method, text, 'failures', assistant_id)
+
+    def process_query(self, text, assistant_id=None):
+        """
+        Обработка запроса в пуле процессов.
+
+        Args:
+            text (str): Текст запроса
+            assistant_id (int): ID помощника (определяет профиль правил)
+
+        Returns:
+            dict: Результат NLPService.process_query
+        """
+        return self._call('process_query', _run_query, text, assistant_id)
+
+    def analyze(self, text, assistant_id=None):
+        """
+        Определение интента и категории в пуле процессов (без ответа).
+
+        Args:
+            text (str): Текст запроса
+            assistant_id (int): ID помощника (определяет профиль правил)
+
+        Returns:
+            dict: Результат NLPService.analyze
+        """
+        return self._call('analyze', _run_analyze, text, assistant_id)
+
+    def generate_response(self, text, analysis):
+        """
+        Генерация ответа по готовому анализу в текущем потоке.
+        Шаг не требует моделей Natasha (поиск в БД и шаблоны ответов).
+
+        Args:
+            text (str): Текст запроса
+            analysis (dict): Результат analyze()
+
+        Returns:
+            str: Текст ответа
+        """
+        timer = StageTimer()
+        response = self._fallback_nlp.generate_response(text, analysis, timer)
+        record_timings(timer.timings, analysis['intent'], total=False)
+        return response
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        with self._lock:
+            if self._pool is not None:
+                self._cancel_pending()
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_nlp_executor():
+    """
+    Получение общего для процесса экземпляра NLPExecutor.
+
+    Returns:
+        NLPExecutor: Пул NLP-процессов
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = NLPExecutor()
+                atexit.register(_executor.shutdown)
+    return _executor
+
+
+def _executor_stats():
+    """Счётчики исходов NLPExecutor (пока он не создан - пусто)"""
+    stats = _executor.stats if _executor is not None else {}
+    return {(outcome,): count for outcome, count in stats.items()}
+
+
+metrics.gauge('nlp_pool_pending', 'Задач NLP, ожидающих результата пула', (),
+              lambda: _executor.pending if _executor is not None else 0)
+metrics.gauge('nlp_executor_requests', 'Запросы NLPExecutor по исходу (pool, inline, timeouts, ...)',
+              ('outcome',), _executor_stats, kind='counter')
@@ -0,0 +1,273 @@
+"""
+Таблицы правил NLP: ключевые слова интентов, категории и запросы к базе знаний
+Значения по умолчанию переопределяются разработчиками в БД и подхватываются
+рабочими процессами без перезапуска
+"""
+import json
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+
+from config import Config
+from utils.database import Database
+
+# Правила по умолчанию: интент -> ключевые слова, категория (None - по тексту
+# запроса) и запрос к базе знаний
+DEFAULT_RULES = {
+    'договор_аренды': {
+        'keywords': ['аренд', 'снять', 'арендова', 'найм', 'сдач'],
+        'category': 'гражданское_право',
+        'kb_query': 'аренды квартиры',
+    },
+    'договор_купли_продажи': {
+        'keywords': ['купл', 'продаж', 'приобрет', 'покуп', 'сделк'],
+        'category': 'гражданское_право',
+        'kb_query': 'купли-продажи квартиры',
+    },
+    'трудовой_договор': {
+        'keywords': ['трудов', 'работ', 'устро', 'прием', 'увольн'],
+        'category': 'трудовое_право',
+        'kb_query': 'трудовой договор',
+    },
+    'брачный_договор': {
+        'keywords': ['брачн', 'супруг', 'брак', 'семейн'],
+        'category': 'семейное_право',
+        'kb_query': 'брачный договор',
+    },
+    'алименты': {
+        'keywords': ['алимент', 'содержан', 'ребенок', 'дет'],
+        'category': 'семейное_право',
+        'kb_query': 'алименты',
+    },
+    'развод': {
+        'keywords': ['развод', 'развест', 'расторжен'],
+        'category': 'семейное_право',
+        'kb_query': 'расторжение брака',
+    },
+    'наследство': {
+        'keywords': ['наследств', 'завещан', 'наследник'],
+        'category': None,
+        'kb_query': 'наследство',
+    },
+    'налог': {
+        'keywords': ['налог', 'налогов', 'вычет', 'декларац'],
+        'category': 'налоговое_право',
+        'kb_query': 'налог',
+    },
+    'жалоба': {
+        'keywords': ['жалоб', 'претенз', 'недовол'],
+        'category': 'судебное_право',
+        'kb_query': 'жалоба',
+    },
+    'исковое_заявление': {
+        'keywords': ['исков', 'суд', 'иск', 'заявлен'],
+        'category': 'судебное_право',
+        'kb_query': 'исковое заявление',
+    },
+    'доверенность': {
+        'keywords': ['доверен', 'представительств'],
+        'category': 'гражданское_право',
+        'kb_query': 'доверенность',
+    },
+    'расторжение_договора': {
+        'keywords': ['расторжен', 'прекращен', 'аннулирован'],
+        'category': 'гражданское_право',
+        'kb_query': 'расторжение договора',
+    },
+}
+
+
+class CompiledRules:
+    """
+    Класс CompiledRules - неизменяемый снимок таблиц правил одной версии.
+
+    Атрибуты:
+        version (int): Версия правил в БД (0 - только значения по умолчанию)
+        keywords (tuple): Пары (интент, кортеж ключевых слов) в порядке интентов
+        categories (Mapping): Интент -> категория
+        queries (Mapping): Интент -> запрос к базе знаний
+        sources (Mapping): Интент -> default или db
+    """
+
+    __slots__ = ('version', 'keywords', 'categories', 'queries', 'sources')
+
+    def __init__(self, rules, version=0, sources=None):
+        """
+        Args:
+            rules (dict): Интент -> {keywords, category, kb_query}
+            version (int): Версия правил
+            sources (dict): Интент -> источник правила
+        """
+        self.version = version
+        self.keywords = tuple((intent, tuple(rule['keywords'])) for intent, rule in rules.items()
+                              if rule['keywords'])
+        self.categories = MappingProxyType({intent: rule['category'] for intent, rule in rules.items()
+                                            if rule.get('category')})
+        self.queries = MappingProxyType({intent: rule['kb_query'] for intent, rule in rules.items()
+                                         if rule.get('kb_query')})
+        self.sources = MappingProxyType(dict(sources or {}))
+
+    def _rules(self):
+        """Правила снимка в виде словаря интент -> {keywords, category, kb_query}"""
+        return {intent: {'keywords': keywords, 'category': self.categories.get(intent),
+                         'kb_query': self.queries.get(intent)} for intent, keywords in self.keywords}
+
+    def with_keywords(self, overrides):
+        """
+        Копия с заменёнными или добавленными ключевыми словами интентов
+        (например, для кандидата теневого режима).
+
+        Args:
+            overrides (dict): Интент -> список ключевых слов
+        """
+        rules = self._rules()
+        for intent, keywords in overrides.items():
+            rule = rules.setdefault(intent, {'category': self.categories.get(intent),
+                                             'kb_query': self.queries.get(intent)})
+            rule['keywords'] = keywords
+        return CompiledRules(rules, self.version, self.sources)
+
+    def restrict(self, intents):
+        """
+        Копия только с указанными интентами (профиль помощника).
+
+        Args:
+            intents (iterable): Оставляемые интенты
+
+        Returns:
+            CompiledRules: Снимок той же версии с частью интентов
+        """
+        intents = set(intents)
+        rules = {intent: rule for intent, rule in self._rules().items() if intent in intents}
+        return CompiledRules(rules, self.version, {intent: source for intent, source in self.sources.items()
+                                                   if intent in intents})
+
+
+class NLPRulesRegistry:
+    """
+    Класс NLPRulesRegistry хранит текущий снимок CompiledRules.
+
+    Чтение (current) не берёт блокировок: снимок неизменяем и подменяется
+    целиком одним присваиванием. Не чаще NLP_RULES_RELOAD_INTERVAL секунд
+    проверяется версия в nlp_rules_version; при её увеличении (правка из
+    любого процесса) правила перечитываются. Пока один поток перечитывает
+    правила, остальные продолжают работать со старым снимком.
+    """
+
+    def __init__(self):
+        self._rules = CompiledRules(DEFAULT_RULES)
+        self._loaded = False
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Текущий снимок правил.
+
+        Returns:
+            CompiledRules: Правила последней загруженной версии
+        """
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = time.monotonic() + Config.NLP_RULES_RELOAD_INTERVAL
+                version = self._read_version()
+                if version is not None and (not self._loaded or version != self._rules.version):
+                    self.load()
+            finally:
+                self._lock.release()
+        return self._rules
+
+    @staticmethod
+    def _read_version():
+        """Версия правил в БД (None - нет контекста приложения или таблицы)"""
+        try:
+            row = Database().execute_one('SELECT version FROM nlp_rules_version WHERE id = 1')
+        except (RuntimeError, sqlite3.OperationalError):
+            return None
+        return row['version'] if row else 0
+
+    def load(self):
+        """
+        Сборка нового снимка из значений по умолчанию и правок в БД.
+
+        Returns:
+            CompiledRules: Новый снимок (уже подменивший старый)
+        """
+        db = Database()
+        version = self._read_version() or 0
+        rows = db.execute_all('SELECT intent, keywords, category, kb_query FROM nlp_rules')
+        rules = {intent: dict(rule) for intent, rule in DEFAULT_RULES.items()}
+        sources = {intent: 'default' for intent in rules}
+        for row in rows:
+            rules[row['intent']] = {
+                'keywords': json.loads(row['keywords']),
+                'category': row['category'],
+                'kb_query': row['kb_query'],
+            }
+            sources[row['intent']] = 'db'
+        self._rules = CompiledRules(rules, version, sources)
+        self._loaded = True
+        return self._rules
+
+    def all(self):
+        """
+        Правила для редактирования.
+
+        Returns:
+            list: Словари intent, keywords, category, kb_query, source
+        """
+        rules = self.current()
+        intents = list(DEFAULT_RULES) + sorted(set(rules.sources) - set(DEFAULT_RULES))
+        keywords = dict(rules.keywords)
+        return [{
+            'intent': intent,
+            'keywords': list(keywords.get(intent, ())),
+            'category': rules.categories.get(intent),
+            'kb_query': rules.queries.get(intent),
+            'source': rules.sources.get(intent, 'default'),
+        } for intent in intents]
+
+    def save(self, intent, keywords, category=None, kb_query=None, updated_by=None):
+        """
+        Сохранение правила интента и увеличение версии.
+
+        Args:
+            intent (str): Интент
+            keywords (list): Ключевые слова (части слов в нижнем регистре)
+            category (str): Категория (None - определяется по тексту запроса)
+            kb_query (str): Запрос к базе знаний
+            updated_by (int): ID разработчика
+        """
+        keywords = [kw.strip().lower() for kw in keywords if kw.strip()]
+        db = Database()
+        db.execute('''
+                   INSERT INTO nlp_rules (intent, keywords, category, kb_query, updated_by, updated_at)
+                   VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(intent) DO UPDATE SET keywords   = excluded.keywords,
+                                                     category   = excluded.category,
+                                                     kb_query   = excluded.kb_query,
+                                                     updated_by = excluded.updated_by,
+                                                     updated_at = excluded.updated_at
+                   ''', (intent, json.dumps(keywords, ensure_ascii=False), category or None,
+                         kb_query or None, updated_by))
+        self._bump_version(db)
+
+    def reset(self, intent):
+        """Удаление правки интента (возврат к значению по умолчанию) и увеличение версии"""
+        db = Database()
+        db.execute('DELETE FROM nlp_rules WHERE intent = ?', (intent,))
+        self._bump_version(db)
+
+    def _bump_version(self, db):
+        """Новая версия правил: в этом процессе - сразу, в остальных - при проверке"""
+        db.execute('''
+                   INSERT INTO nlp_rules_version (id, version) VALUES (1, 1)
+                   ON CONFLICT(id) DO UPDATE SET version = version + 1
+                   ''')
+        db.commit()
+        with self._lock:
+            self.load()
+
+
+nlp_rules = NLPRulesRegistry()
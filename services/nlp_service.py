@@ -2,14 +2,25 @@
 Сервис обработки естественного языка
 Представляет подсистему NLP и интерфейса
 """
+import os
+import threading
+import time
+from collections import OrderedDict
+from time import perf_counter_ns
+
+from config import Config
+from utils.metrics import metrics, StageTimer, NULL_TIMER, CACHE_REQUESTS
+from utils.trace import Tracer, Lazy
+from .assistant_profiles import assistant_profiles
+from .intent_model import IntentModel, NUMPY_AVAILABLE
 from .knowledge_service import KnowledgeService
+from .nlp_rules import nlp_rules
+from .spelling import spelling
+from .response_templates import response_templates
 
 try:
-    from natasha import (
-        Segmenter, MorphVocab, NewsEmbedding,
-        NewsMorphTagger, NewsSyntaxParser, NewsNERTagger,
-        NamesExtractor, Doc
-    )
+    from natasha import Doc
+    from .natasha_pipeline import NatashaPipeline
 
     NATASHA_AVAILABLE = True
 except ImportError:
@@ -18,165 +29,552 @@ except ImportError:
 
 from datetime import datetime
 
+# Задержки этапов обработки запроса (stage: spelling, segment, morph, lemmatize,
+# cascade, intent, category, cache, kb_search, response, total)
+NLP_STAGE_LATENCY = metrics.histogram(
+    'nlp_stage_latency', 'Длительность этапов NLP-обработки', ('stage', 'intent')
+)
+
+# Полное время обработки запроса по профилю помощника (profile - специализация
+# из NLP_ASSISTANT_PROFILES, general - помощник без профиля или запрос без помощника)
+NLP_PROFILE_LATENCY = metrics.histogram(
+    'nlp_assistant_latency', 'Время NLP-обработки запроса по профилю помощника', ('profile',)
+)
+
+# Каскад: path=rule_based (Natasha не понадобилась) или natasha,
+# reason - причина решения (confident, no_match, tie, long_text)
+NLP_CASCADE_DECISIONS = metrics.counter(
+    'nlp_cascade_decisions', 'Решения каскадного классификатора интентов', ('path', 'reason')
+)
+# Оценка сэкономленного времени: средняя длительность анализа Natasha
+# в процессе минус длительность rule-based проверки
+NLP_CASCADE_SAVED = metrics.counter(
+    'nlp_cascade_saved_seconds', 'Оценка времени, сэкономленного пропуском Natasha'
+)
+
+# Вес ключевого слова в оценке Natasha: совпадение с леммой (2) и со словоформой (1)
+NATASHA_KEYWORD_WEIGHT = 3
+
+# Исправление опечаток: corrected - исправлено хотя бы одно слово,
+# unchanged - в запросе без ключевых слов исправлять нечего
+NLP_SPELLING_CORRECTIONS = metrics.counter(
+    'nlp_spelling_corrections', 'Проверки запросов на опечатки', ('result',)
+)
+
+# Обученная модель интентов: accepted - её ответ принят,
+# rejected - вероятность ниже NLP_INTENT_MODEL_MIN_CONFIDENCE
+NLP_INTENT_MODEL_DECISIONS = metrics.counter(
+    'nlp_intent_model_decisions', 'Решения обученной модели интентов', ('result',)
+)
+
+# Трассировка обработки запросов (TRACE_LEVEL, TRACE_SAMPLE_RATE)
+tracer = Tracer('nlp')
+
+
+def record_timings(timings, intent, total=True, profile=None):
+    """
+    Запись замеров этапов в гистограммы процесса.
+
+    Args:
+        timings (list): Пары (этап, длительность в нс)
+        intent (str): Определённый интент
+        total (bool): Записать также суммарное время как этап total
+            и как время обработки запроса профилем помощника
+        profile (str): Профиль помощника (None - general)
+    """
+    elapsed = 0
+    for stage, duration in timings:
+        NLP_STAGE_LATENCY.observe((stage, intent), duration)
+        elapsed += duration
+    if total:
+        NLP_STAGE_LATENCY.observe(('total', intent), elapsed)
+        NLP_PROFILE_LATENCY.observe((profile or 'general',), elapsed)
+
 
 class NLPService:
     """
     Сервис NLPService обеспечивает анализ текстовых запросов пользователей.
     Определяет намерения (intent), извлекает сущности и генерирует ответы.
+
+    Ключевые слова интентов, категории и запросы к базе знаний берутся
+    из текущего снимка правил nlp_rules (правятся в панели разработчика).
+    Запросы к помощнику с профилем (NLP_ASSISTANT_PROFILES) оцениваются
+    только по интентам и категориям его специализации.
     """
 
-    # Ключевые слова для определения интентов
-    INTENT_KEYWORDS = {
-        'договор_аренды': ['аренд', 'снять', 'арендова', 'найм', 'сдач'],
-        'договор_купли_продажи': ['купл', 'продаж', 'приобрет', 'покуп', 'сделк'],
-        'трудовой_договор': ['трудов', 'работ', 'устро', 'прием', 'увольн'],
-        'брачный_договор': ['брачн', 'супруг', 'брак', 'семейн'],
-        'алименты': ['алимент', 'содержан', 'ребенок', 'дет'],
-        'развод': ['развод', 'развест', 'расторжен'],
-        'наследство': ['наследств', 'завещан', 'наследник'],
-        'налог': ['налог', 'налогов', 'вычет', 'декларац'],
-        'жалоба': ['жалоб', 'претенз', 'недовол'],
-        'исковое_заявление': ['исков', 'суд', 'иск', 'заявлен'],
-        'доверенность': ['доверен', 'представительств'],
-        'расторжение_договора': ['расторжен', 'прекращен', 'аннулирован'],
-    }
-
-    def __init__(self):
-        """Инициализация NLP компонентов"""
-        if NATASHA_AVAILABLE:
-            self.segmenter = Segmenter()
-            self.morph_vocab = MorphVocab()
-            self.emb = NewsEmbedding()
-            self.morph_tagger = NewsMorphTagger(self.emb)
-            self.syntax_parser = NewsSyntaxParser(self.emb)
-            self.ner_tagger = NewsNERTagger(self.emb)
-            self.names_extractor = NamesExtractor(self.morph_vocab)
-            print("✅ NLP модель Natasha загружена успешно")
-        else:
-            self.segmenter = None
+    def __init__(self, use_natasha=True, cache_size=None, cascade=None, intent_model=None, spelling_correction=None):
+        """
+        Инициализация NLP компонентов.
 
-    def process_query(self, text):
+        Args:
+            use_natasha (bool): Загружать ли модели Natasha. При False сервис
+                работает только в rule-based режиме (используется как
+                быстрый запасной вариант пулом NLP-процессов).
+            cache_size (int): Размер LRU-кэша результатов анализа
+                (по умолчанию Config.NLP_ANALYSIS_CACHE_SIZE, 0 - без кэша)
+            cascade (bool): Пропускать Natasha, если rule-based анализ
+                однозначен (по умолчанию Config.NLP_CASCADE_ENABLED)
+            intent_model (bool): Использовать обученную модель интентов
+                (по умолчанию Config.NLP_INTENT_MODEL_ENABLED)
+            spelling_correction (bool): Исправлять опечатки в запросах без
+                ключевых слов (по умолчанию Config.NLP_SPELLING_ENABLED)
+        """
+        self.spelling_correction = (Config.NLP_SPELLING_ENABLED if spelling_correction is None
+                                    else spelling_correction)
+        self.use_intent_model = (Config.NLP_INTENT_MODEL_ENABLED if intent_model is None
+                                 else intent_model) and NUMPY_AVAILABLE
+        self.intent_model = None
+        self._intent_model_mtime = None
+        self._intent_model_checked = 0.0
+        self.cascade = Config.NLP_CASCADE_ENABLED if cascade is None else cascade
+        self._natasha_avg_ns = None
+        self.cache_size = Config.NLP_ANALYSIS_CACHE_SIZE if cache_size is None else cache_size
+        self._cache = OrderedDict()
+        self._rules_version = None
+        self._cache_lock = threading.Lock()
+
+        # Компоненты Natasha загружаются по этапам из Config.NLP_PIPELINE
+        self.pipeline = None
+        if NATASHA_AVAILABLE and use_natasha:
+            self.pipeline = NatashaPipeline()
+            loaded = [item['stage'] for item in self.pipeline.report() if item['loaded']]
+            print(f"✅ NLP модель Natasha загружена успешно ({', '.join(loaded)})")
+
+    def process_query(self, text, assistant_id=None):
         """
         Обработка текстового запроса пользователя.
 
         Args:
             text (str): Текст запроса
+            assistant_id (int): ID помощника (определяет профиль правил)
 
         Returns:
             dict: Результат анализа с интентом, категорией, ответом
+                и замерами этапов (timings)
         """
-        print(f"🔍 Анализ запроса: '{text}'")
-        text_lower = text.lower().strip()
+        timer = StageTimer()
+        trace = tracer.begin()
+        result = self.analyze(text, timer, trace, assistant_id=assistant_id)
+        result['response'] = self.generate_response(text, result, timer, trace)
+        return result
 
-        # 1. сначала модель (Natasha), при её отсутствии – rule-based
-        intent = 'общий_вопрос'
-        confidence = 0.3
-
-        if NATASHA_AVAILABLE and self.segmenter:
-            intent, confidence = self._analyze_with_natasha(text_lower)
-        else:
-            intent, confidence = self._analyze_rule_based(text_lower)
+    def analyze(self, text, timer=None, trace=None, prediction=None, assistant_id=None):
+        """
+        Определение интента и категории запроса без генерации ответа.
 
-        print(f"  Определен интент: {intent} (уверенность: {confidence:.2f})")
+        Args:
+            text (str): Текст запроса
+            timer (StageTimer): Таймер этапов (по умолчанию - новый)
+            trace (Trace): Трассировка запроса (по умолчанию - новая)
+            prediction (tuple): Готовый ответ модели интентов
+                (интент, вероятность), если он уже посчитан пачкой
+            assistant_id (int): ID помощника (определяет профиль правил)
 
-        # 2. категория
-        category = self._detect_category(intent, text_lower)
-        print(f"  Категория: {category}")
+        Returns:
+            dict: Интент, категория, уверенность, иконка, время, профиль
+                помощника (profile) и замеры этапов (timings)
+        """
+        timer = timer or StageTimer()
+        trace = trace or tracer.begin()
+        trace.debug("Анализ запроса: '%s'", text)
+        timer.skip()
+        text_lower = text.lower().strip()
 
-        # 3. генерация ответа (приоритет: база знаний → rule-based)
-        response = self._generate_smart_response(intent, category, text_lower, confidence)
+        # Кэш относится к одной версии правил
+        rules = self.rules()
+        if rules.version != self._rules_version:
+            self.clear_cache()
+            self._rules_version = rules.version
+
+        profile = assistant_profiles.for_assistant(assistant_id, rules)
+        profile_name = profile.name if profile is not None else None
+        key = (profile_name, text_lower)
+        cached = self._cache_get(key)
+        if cached is not None:
+            intent, confidence, category = cached
+            timer.mark('cache')
+            trace.debug('Результат из кэша: %s / %s', intent, category)
+        else:
+            intent, confidence, category = self._classify(text_lower, timer, trace, prediction, rules, profile)
+            self._cache_put(key, (intent, confidence, category))
 
         return {
             'intent': intent,
             'category': category,
             'confidence': confidence,
-            'response': response,
+            'profile': profile_name,
             'timestamp': datetime.now().strftime('%H:%M'),
-            'icon': self._get_icon(intent)
+            'icon': self.get_icon(intent),
+            'timings': timer.timings
         }
 
-    def _generate_smart_response(self, intent, category, text, confidence):
+    def analyze_batch(self, texts, assistant_ids=None):
+        """
+        Анализ пачки запросов (например, при переобработке истории).
+        Одинаковые запросы анализируются один раз, модель интентов
+        классифицирует все новые запросы одним умножением матриц.
+
+        Args:
+            texts (list): Тексты запросов
+            assistant_ids (list): ID помощников тех же запросов
+                (профиль правил каждого запроса; по умолчанию - без помощника)
+
+        Returns:
+            list: Результаты analyze() в том же порядке
+        """
+        assistant_ids = assistant_ids or [None] * len(texts)
+        predictions = {}
+        model = self._current_intent_model()
+        if model is not None:
+            with self._cache_lock:
+                keys = list(dict.fromkeys(key for key in (text.lower().strip() for text in texts)
+                                          if (None, key) not in self._cache))
+            predictions = dict(zip(keys, model.predict(keys)))
+
+        results = {}
+        analyses = []
+        for text, assistant_id in zip(texts, assistant_ids):
+            key = text.lower().strip()
+            result = results.get((assistant_id, key))
+            if result is None:
+                result = results[(assistant_id, key)] = self.analyze(text, prediction=predictions.get(key),
+                                                                     assistant_id=assistant_id)
+            analyses.append(dict(result))
+        return analyses
+
+    def _classify(self, text_lower, timer, trace, prediction=None, rules=None, profile=None):
+        """
+        Определение интента, уверенности и категории.
+
+        Args:
+            rules (CompiledRules): Снимок правил (по умолчанию - текущий)
+            profile (AssistantProfile): Профиль помощника: интенты и категории
+                ограничены его специализацией
+
+        Returns:
+            tuple: (интент, уверенность, категория)
+        """
+        rules = rules or self.rules()
+        if profile is not None:
+            rules = profile.rules
+
+        # 0. исправление опечаток, если ни одно ключевое слово не найдено
+        # (оценки ключевых слов считаются один раз и передаются дальше)
+        scores = None
+        if self.spelling_correction:
+            scores = self._rule_based_scores(text_lower, rules)
+            if not scores:
+                corrected = self.correct_spelling(text_lower, trace)
+                timer.mark('spelling')
+                if corrected != text_lower:
+                    # Ответ модели, посчитанный пачкой, относится к тексту с опечатками
+                    text_lower, prediction = corrected, None
+                    scores = self._rule_based_scores(text_lower, rules)
+
+        model = self._current_intent_model()
+        if model is not None and prediction is None:
+            prediction = model.predict([text_lower])[0]
+
+        # 1. обученная модель, если уверена (и интент есть в профиле); иначе
+        # Natasha, если rule-based анализ неоднозначен; без неё – rule-based
+        if (prediction is not None and prediction[1] >= Config.NLP_INTENT_MODEL_MIN_CONFIDENCE
+                and (profile is None or prediction[0] in profile.intents)):
+            intent, confidence = prediction[0], round(prediction[1], 4)
+            NLP_INTENT_MODEL_DECISIONS.inc(('accepted',))
+            timer.mark('intent')
+        elif self.pipeline is not None and self.pipeline.analysis_ready:
+            if prediction is not None:
+                NLP_INTENT_MODEL_DECISIONS.inc(('rejected',))
+            intent, confidence = self._analyze_cascade(text_lower, timer, trace, scores, rules)
+        else:
+            if prediction is not None:
+                NLP_INTENT_MODEL_DECISIONS.inc(('rejected',))
+            intent, confidence = self._analyze_rule_based(text_lower, scores, rules)
+            timer.mark('intent')
+
+        trace.debug('Определен интент: %s (уверенность: %.2f)', intent, confidence)
+        timer.skip()
+
+        # 2. категория
+        category = self._detect_category(intent, text_lower, rules, profile)
+        timer.mark('category')
+        trace.debug('Категория: %s', category)
+        timer.skip()
+        return intent, confidence, category
+
+    def correct_spelling(self, text, trace=None):
+        """
+        Исправление опечаток по индексу основ ключевых слов и словаря базы знаний.
+
+        Args:
+            text (str): Текст в нижнем регистре
+            trace (Trace): Трассировка запроса
+
+        Returns:
+            str: Исправленный текст (или исходный, если исправлять нечего)
+        """
+        corrected, corrections = spelling.current().correct(text)
+        NLP_SPELLING_CORRECTIONS.inc(('corrected' if corrections else 'unchanged',))
+        if corrections and trace is not None:
+            trace.debug('Исправлены опечатки: %s', corrections)
+        return corrected
+
+    def rules(self):
+        """
+        Текущие правила классификации.
+
+        Returns:
+            CompiledRules: Неизменяемый снимок ключевых слов, категорий и запросов
+        """
+        return nlp_rules.current()
+
+    def _current_intent_model(self):
         """
-        1) Пытаемся найти ответ в базе знаний (по категории и ключевому слову)
+        Обученная модель интентов. Файл модели проверяется не чаще раза
+        в NLP_INTENT_MODEL_RELOAD_INTERVAL секунд и перечитывается после
+        переобучения без перезапуска процесса.
+
+        Returns:
+            IntentModel: Модель или None (выключена или ещё не обучена)
+        """
+        if not self.use_intent_model:
+            return None
+        now = time.monotonic()
+        if now - self._intent_model_checked < Config.NLP_INTENT_MODEL_RELOAD_INTERVAL:
+            return self.intent_model
+        self._intent_model_checked = now
+        try:
+            mtime = os.path.getmtime(Config.NLP_INTENT_MODEL_PATH)
+        except OSError:
+            return self.intent_model
+        if mtime != self._intent_model_mtime:
+            self._intent_model_mtime = mtime
+            try:
+                self.intent_model = IntentModel.load(Config.NLP_INTENT_MODEL_PATH)
+                self.clear_cache()
+                print(f"✅ Модель интентов загружена ({len(self.intent_model.classes)} интентов, "
+                      f"{self.intent_model.meta.get('samples')} примеров)")
+            except Exception as e:
+                print(f"⚠️ Модель интентов не загружена: {e}")
+        return self.intent_model
+
+    def _cache_get(self, key):
+        """Результат анализа из LRU-кэша"""
+        if not self.cache_size:
+            return None
+        with self._cache_lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+        CACHE_REQUESTS.inc(('nlp_analysis', 'miss' if value is None else 'hit'))
+        return value
+
+    def _cache_put(self, key, value):
+        """Сохранение результата анализа в LRU-кэш"""
+        if not self.cache_size:
+            return
+        with self._cache_lock:
+            self._cache[key] = value
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        """Очистка кэша анализа (после изменения правил классификации)"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def generate_response(self, text, analysis, timer=NULL_TIMER, trace=None):
+        """
+        Генерация ответа (приоритет: база знаний → rule-based).
+
+        Args:
+            text (str): Текст запроса
+            analysis (dict): Результат analyze()
+            timer (StageTimer): Таймер этапов kb_search и response
+            trace (Trace): Трассировка запроса (по умолчанию - новая)
+
+        Returns:
+            str: Текст ответа
+        """
+        trace = trace or tracer.begin()
+        timer.skip()
+        profile = assistant_profiles.get(analysis.get('profile'), self.rules())
+        return self._generate_smart_response(analysis['intent'], analysis['category'],
+                                             text.lower().strip(), analysis['confidence'], timer, trace,
+                                             profile)
+
+    def _generate_smart_response(self, intent, category, text, confidence, timer, trace, profile=None):
+        """
+        1) Пытаемся найти ответ в базе знаний (по категории и ключевому слову;
+           для помощника с профилем - только среди статей его категорий):
+           ответ - лучший по леммам вопроса фрагмент статьи
         2) Если ничего нет или уверенность модели низкая – используем rule-based
         """
         if confidence < 0.4 and intent == 'общий_вопрос':
-            return self._generate_response(intent, category, text)
+            response = self._generate_response(intent, category, text)
+            timer.mark('response')
+            return response
 
         # Подбираем ключ для поиска по базе
-        intent_to_query = {
-            'договор_купли_продажи': 'купли-продажи квартиры',
-            'договор_аренды': 'аренды квартиры',
-            'трудовой_договор': 'трудовой договор',
-            'брачный_договор': 'брачный договор',
-            'алименты': 'алименты',
-            'развод': 'расторжение брака',
-            'наследство': 'наследство',
-            'налог': 'налог',
-            'жалоба': 'жалоба',
-            'исковое_заявление': 'исковое заявление',
-            'доверенность': 'оверенность',
-            'расторжение_договора': 'расторжение договора',
-        }
-
-        query_text = intent_to_query.get(intent, text)
-        print("INTENT:", intent, "QUERY_TEXT:", query_text, "CATEGORY:", category)
+        query_text = self.rules().queries.get(intent, text)
+        trace.debug('Поиск в базе знаний: intent=%s query=%s category=%s', intent, query_text, category)
+        timer.skip()
 
         try:
-            kb_results = KnowledgeService.search_knowledge(
+            kb_results = KnowledgeService.search_passages(
                 query=query_text,
-                category=category if category != 'общее_право' else None
+                text=text,
+                category=category if category != 'общее_право' else None,
+                categories=profile.categories if profile is not None else None
             )
-            print("KB RESULTS:", kb_results)
+            timer.mark('kb_search')
+            trace.debug('Найдено фрагментов: %d %s', len(kb_results),
+                        Lazy(lambda: [(passage.title, passage.position, passage.score) for passage in kb_results]))
+            timer.skip()
 
             if kb_results:
                 top = kb_results[0]
-                return f"{top.title}\n\n{top.content}"
+                response = f"{top.title}\n\n{top.text}"
+                timer.mark('response')
+                return response
 
         except Exception as e:
-            print(f"⚠️ Ошибка поиска в базе знаний: {e}")
+            trace.warning('Ошибка поиска в базе знаний: %s', e)
+            timer.skip()
 
-        return self._generate_response(intent, category, text)
+        response = self._generate_response(intent, category, text)
+        timer.mark('response')
+        return response
 
-    def _analyze_with_natasha(self, text):
-        """Анализ с использованием Natasha"""
+    def _analyze_with_natasha(self, text, timer, trace, rules=None):
+        """Анализ с использованием Natasha (rules - снимок правил, по умолчанию текущий)"""
         try:
             doc = Doc(text)
-            doc.segment(self.segmenter)
-            doc.tag_morph(self.morph_tagger)
+            doc.segment(self.pipeline.get('segmenter'))
+            timer.mark('segment')
+            doc.tag_morph(self.pipeline.get('morph_tagger'))
+            timer.mark('morph')
 
+            morph_vocab = self.pipeline.get('morph_vocab')
             lemmas = []
             for token in doc.tokens:
-                token.lemmatize(self.morph_vocab)
+                token.lemmatize(morph_vocab)
                 lemmas.append(token.lemma)
 
             lemmatized_text = ' '.join(lemmas).lower()
+            timer.mark('lemmatize')
 
             # Определение интента по леммам
             intent_scores = {}
-            for intent_name, keywords in self.INTENT_KEYWORDS.items():
+            for intent_name, keywords in (rules or self.rules()).keywords:
                 score = sum(2 if kw in lemmatized_text else 0 for kw in keywords)
                 score += sum(1 if kw in text else 0 for kw in keywords)
                 if score > 0:
                     intent_scores[intent_name] = score
 
+            timer.mark('intent')
             if intent_scores:
                 best_intent = max(intent_scores.items(), key=lambda x: x[1])
-                return best_intent[0], min(best_intent[1] / 10, 0.95)
+                return best_intent[0], self._natasha_confidence(best_intent[1])
 
             return 'общий_вопрос', 0.3
 
         except Exception as e:
-            print(f" Ошибка Natasha: {e}")
-            return self._analyze_rule_based(text)
+            trace.warning('Ошибка Natasha: %s', e)
+            timer.skip()
+            result = self._analyze_rule_based(text, rules=rules)
+            timer.mark('intent')
+            return result
+
+    def _analyze_cascade(self, text, timer, trace, scores=None, rules=None):
+        """
+        Каскадный анализ: однозначный rule-based результат принимается сразу,
+        иначе запрос передаётся в Natasha.
+
+        Args:
+            scores (dict): Уже посчитанные оценки ключевых слов
+            rules (CompiledRules): Снимок правил (по умолчанию - текущий)
+
+        Returns:
+            tuple: (интент, уверенность)
+        """
+        if not self.cascade:
+            return self._analyze_with_natasha(text, timer, trace, rules)
+
+        started = perf_counter_ns()
+        intent, confidence, reason = self.cascade_decision(text, scores, rules)
+        rule_ns = perf_counter_ns() - started
+        if reason == 'confident':
+            timer.mark('intent')
+            NLP_CASCADE_DECISIONS.inc(('rule_based', reason))
+            if self._natasha_avg_ns is not None:
+                NLP_CASCADE_SAVED.inc((), max(self._natasha_avg_ns - rule_ns, 0) / 1e9)
+            trace.debug('Каскад: rule-based результат однозначен')
+            return intent, confidence
+
+        timer.mark('cascade')
+        NLP_CASCADE_DECISIONS.inc(('natasha', reason))
+        trace.debug('Каскад: анализ Natasha (%s)', reason)
+        started = perf_counter_ns()
+        result = self._analyze_with_natasha(text, timer, trace, rules)
+        elapsed = perf_counter_ns() - started
+        # Скользящее среднее длительности Natasha для оценки экономии
+        average = self._natasha_avg_ns
+        self._natasha_avg_ns = elapsed if average is None else average + (elapsed - average) * 0.05
+        return result
+
+    def cascade_decision(self, text, scores=None, rules=None):
+        """
+        Решение каскада по rule-based оценкам.
+
+        Args:
+            text (str): Текст запроса в нижнем регистре
+            scores (dict): Уже посчитанные оценки ключевых слов
+            rules (CompiledRules): Снимок правил (по умолчанию - текущий)
 
-    def _analyze_rule_based(self, text):
-        """Простой rule-based анализ"""
+        Returns:
+            tuple: (интент, уверенность, причина): confident - результат
+                принимается; no_match, tie, long_text - нужна Natasha.
+                Уверенность - по шкале Natasha: ключевые слова - основы
+                слов, совпавшая основа совпала бы и с леммой
+        """
+        if len(text) > Config.NLP_CASCADE_MAX_LENGTH:
+            return None, None, 'long_text'
+        intent_scores = self._rule_based_scores(text, rules) if scores is None else scores
+        if not intent_scores:
+            return None, None, 'no_match'
+        ranked = sorted(intent_scores.values(), reverse=True)
+        if len(ranked) > 1 and ranked[0] == ranked[1]:
+            return None, None, 'tie'
+        best_intent = max(intent_scores.items(), key=lambda x: x[1])
+        return best_intent[0], self._natasha_confidence(best_intent[1] * NATASHA_KEYWORD_WEIGHT), 'confident'
+
+    @staticmethod
+    def _natasha_confidence(score):
+        """
+        Уверенность анализа Natasha (и принятого каскадом rule-based
+        результата, чтобы она не зависела от пути каскада).
+
+        Args:
+            score (int): Взвешенная оценка ключевых слов (см. NATASHA_KEYWORD_WEIGHT)
+
+        Returns:
+            float: Уверенность от 0 до 0.95
+        """
+        return min(score / 10, 0.95)
+
+    def _rule_based_scores(self, text, rules=None):
+        """Число совпавших ключевых слов по интентам (rules - снимок правил, по умолчанию текущий)"""
         intent_scores = {}
-        for intent_name, keywords in self.INTENT_KEYWORDS.items():
+        for intent_name, keywords in (rules or self.rules()).keywords:
             score = sum(1 for kw in keywords if kw in text)
             if score > 0:
                 intent_scores[intent_name] = score
+        return intent_scores
+
+    def _analyze_rule_based(self, text, scores=None, rules=None):
+        """Простой rule-based анализ (scores - уже посчитанные оценки ключевых слов)"""
+        intent_scores = self._rule_based_scores(text, rules) if scores is None else scores
 
         if intent_scores:
             best_intent = max(intent_scores.items(), key=lambda x: x[1])
@@ -184,550 +582,27 @@ class NLPService:
 
         return 'общий_вопрос', 0.3
 
-    def _detect_category(self, intent, text):
-        """Определение категории вопроса"""
-        categories = {
-            'гражданское_право': ['договор_аренды', 'договор_купли_продажи',
-                                  'доверенность', 'расторжение_договора'],
-            'трудовое_право': ['трудовой_договор'],
-            'семейное_право': ['брачный_договор', 'алименты', 'развод'],
-            'налоговое_право': ['налог'],
-            'судебное_право': ['жалоба', 'исковое_заявление'],
-        }
-
-        for category, intents in categories.items():
-            if intent in intents:
-                return category
-
-        if 'квартир' in text or 'дом' in text:
-            return 'жилищное_право'
-        elif 'автомобиль' in text or 'машина' in text:
-            return 'автомобильное_право'
-        elif 'наследств' in text:
-            return 'наследственное_право'
-
-        return 'общее_право'
+    def _detect_category(self, intent, text, rules=None, profile=None):
+        """Определение категории вопроса (в пределах категорий профиля помощника)"""
+        category = (rules or self.rules()).categories.get(intent)
+        if not category:
+            if 'квартир' in text or 'дом' in text:
+                category = 'жилищное_право'
+            elif 'автомобиль' in text or 'машина' in text:
+                category = 'автомобильное_право'
+            elif 'наследств' in text:
+                category = 'наследственное_право'
+            else:
+                category = 'общее_право'
+
+        return profile.category(category) if profile is not None else category
 
     def _generate_response(self, intent, category, text):
-        """Генерация ответа на основе интента"""
-        # Здесь можно подключить более сложную логику генерации
-        responses = {
-            'договор_аренды': self._response_rental(),
-            'договор_купли_продажи': self._response_sale(),
-            'трудовой_договор': self._response_labor(),
-            'брачный_договор': self._response_marriage(),
-            'алименты': self._response_alimony(),
-            'развод': self._response_divorce(),
-            'налог': self._response_tax(),
-            'жалоба': self._response_complaint(),
-            'расторжение_договора': self._response_termination(),
-            'исковое_заявление': self._response_lawsuit(),
-            'доверенность': self._response_power_of_attorney(),
-            'наследство': self._response_inheritance(),
-        }
-
-        return responses.get(intent, self._response_general(text))
-
-    def _response_rental(self):
-        """Ответ про договор аренды"""
-        return """🏠 **Договор аренды квартиры**
-
-Для оформления договора аренды необходимо:
-
-1. **Стороны договора:**
-   - Наниматель (арендатор) - физическое/юридическое лицо
-   - Наймодатель (арендодатель) - собственник или уполномоченное лицо
-
-2. **Обязательные условия:**
-   - Предмет договора (адрес, площадь, характеристика жилья)
-   - Срок действия договора
-   - Размер и порядок оплаты арендной платы
-   - Права и обязанности сторон
-
-3. **Регистрация договора:**
-   - Договор аренды на срок более 1 года подлежит регистрации
-   - Регистрация в исполкоме по месту нахождения жилья
-
-4. **Налогообложение:**
-   - Доходы от аренды облагаются подоходным налогом (13%)
-   - Налоговая декларация подается до 1 марта следующего года
-
-📚 **Нормативная база:**
-- Гражданский кодекс РБ (глава 34)
-- Жилищный кодекс РБ
-- Налоговый кодекс РБ
-
-
-📄 *Для составления договора обратитесь к юристу*"""
-
-    def _response_sale(self):
-        """Ответ про договор купли-продажи"""
-        return """💰 **Договор купли-продажи квартиры**
-
-📋 **Этапы сделки:**
-
-1. **Подготовительный этап:**
-   - Проверка документов продавца
-   - Проверка обременений (ипотека, арест)
-   - Получение выписки из ЕГРН (Единый государственный регистр недвижимости)
-
-2. **Основные документы продавца:**
-   - Паспорт (для физлиц) / учредительные документы (для юрлиц)
-   - Правоустанавливающие документы
-   - Технический паспорт БТИ
-   - Справка о составе семьи
-   - Согласие супруга (если имущество совместное)
-
-3. **Существенные условия договора:**
-   - Предмет договора с подробным описанием
-   - Цена недвижимости
-   - Порядок расчетов
-   - Срок передачи имущества
-
-4. **Регистрация перехода права:**
-   - Договор регистрируется в ЕГРН
-   - Срок регистрации - 5 рабочих дней
-   - Госпошлина - 5 базовых величин
-
-📚 **Нормативная база:**
-- Гражданский кодекс РБ (глава 30)
-- Указ Президента РБ №150 "О государственной регистрации недвижимого имущества"
-
-⚠️ **Важно:** Приобретение недвижимости у близких родственников требует уплаты подоходного налога.
-
-📄 *Для составления договора обратитесь к юристу*"""
-
-    def _response_labor(self):
-        """Ответ про трудовой договор"""
-        return """👨‍💼 **Трудовой договор**
-
-📋 **Обязательные условия трудового договора:**
-
-1. **Сведения о сторонах:**
-   - Полное наименование нанимателя
-   - ФИО работника, место жительства, паспортные данные
-
-2. **Существенные условия:**
-   - Место работы с указанием структурного подразделения
-   - Трудовая функция (должность, профессия, специальность)
-   - Дата начала работы
-   - Срок действия договора (для срочных договоров)
-
-3. **Дополнительные условия:**
-   - Режим рабочего времени и времени отдыха
-   - Условия оплаты труда
-   - Гарантии и компенсации
-   - Условия труда на рабочем месте
-
-4. **Виды трудовых договоров:**
-   - Бессрочный (на неопределенный срок)
-   - Срочный (на определенный срок до 5 лет)
-   - Контракт (до 5 лет с дополнительными условиями)
-
-📋 **Документы при приеме на работу:**
-1. Паспорт
-2. Трудовая книжка (кроме первого места работы)
-3. Документы об образовании
-4. Медицинская справка (для определенных профессий)
-
-📚 **Нормативная база:**
-- Трудовой кодекс Республики Беларусь
-- Закон "О занятости населения""
-
-💡 **Помощь:** При нарушении трудовых прав обращайтесь в Федерацию профсоюзов Беларуси."""
-
-    def _response_marriage(self):
-        """Ответ про брачный договор"""
-        return """💍 **Брачный договор**
-
-🤝 **Брачный договор** - соглашение лиц, вступающих в брак, или супругов, определяющее их имущественные права и обязанности.
-
-📋 **Что можно определить в договоре:**
-
-1. **Режим собственности:**
-   - Совместная собственность
-   - Долевая собственность
-   - Раздельная собственность
-   - Смешанный режим для разных видов имущества
-
-2. **Права и обязанности:**
-   - Порядок несения семейных расходов
-   - Способы участия в доходах друг друга
-   - Порядок раздела имущества при расторжении брака
-   - Права и обязанности по взаимному содержанию
-
-3. **Ограничения:**
-   - Нельзя регулировать личные неимущественные отношения
-   - Нельзя ограничивать правоспособность и дееспособность
-   - Нельзя определять права и обязанности в отношении детей
-
-4. **Форма договора:**
-   - Требуется нотариальное удостоверение
-   - Договор вступает в силу с момента регистрации брака
-   - Может быть заключен как до брака, так и в период брака
-
-📚 **Нормативная база:**
-- Брачно-семейный кодекс Республики Беларусь (глава 6)
-- Гражданский кодекс РБ
-
-💡 **Важно:** Брачный договор может быть изменен или расторгнут по соглашению сторон или в судебном порядке."""
-
-    def _response_alimony(self):
-        """Ответ про алименты"""
-        return """👶 **Алименты на ребенка**
-
-💰 **Размер алиментов:**
-1. **На одного ребенка** - 25% заработка и/или иного дохода
-2. **На двух детей** - 33% заработка и/или иного дохода  
-3. **На трех и более детей** - 50% заработка и/или иного дохода
-
-📋 **Способы взыскания алиментов:**
-
-1. **Добровольное соглашение:**
-   - Нотариально удостоверенное соглашение об уплате алиментов
-   - Определяется размер, порядок и сроки выплат
-
-2. **Судебный порядок:**
-   - Исковое заявление в суд по месту жительства ответчика
-   - Можно взыскивать в твердой денежной сумме или в долях
-
-3. **Упрощенный порядок:**
-   - Судебный приказ (если нет спора об отцовстве и размере алиментов)
-   - Выдается мировым судьей в течение 5 дней
-
-📅 **Сроки обращения:**
-- Можно обратиться в любой момент до совершеннолетия ребенка
-- За прошедший период - не более чем за 3 года
-
-🎓 **Алименты на студентов:**
-- Выплачиваются до 23 лет при очном обучении
-- Размер определяется соглашением сторон или судом
-
-📚 **Нормативная база:**
-- Брачно-семейный кодекс РБ (глава 15)
-- Гражданский процессуальный кодекс РБ
-
-⚠️ **Важно:** Уклонение от уплаты алиментов влечет административную и уголовную ответственность."""
-
-    def _response_divorce(self):
-        """Ответ про развод"""
-        return """💔 **Расторжение брака (развод)**
-
-📋 **Порядок расторжения брака:**
-
-1. **Через органы ЗАГС (упрощенный порядок):**
-   - При взаимном согласии супругов
-   - При отсутствии несовершеннолетних детей
-   - Госпошлина - 4 базовые величины
-
-2. **Через суд:**
-   - При наличии несовершеннолетних детей
-   - При отсутствии согласия одного из супругов
-   - Если один из супругов уклоняется от расторжения брака в ЗАГСе
-
-📋 **Документы для развода через ЗАГС:**
-1. Совместное заявление супругов
-2. Паспорта супругов
-3. Свидетельство о браке
-4. Квитанция об уплате госпошлины
-
-⚖️ **Раздел имущества при разводе:**
-- Общее совместное имущество делится поровну
-- Можно заключить соглашение о разделе имущества
-- При споре - раздел через суд
-
-👶 **Вопросы детей при разводе:**
-- Определение места жительства детей
-- Порядок общения с детьми отдельно проживающего родителя
-- Взыскание алиментов
-
-📚 **Нормативная база:**
-- Брачно-семейный кодекс РБ (глава 4)
-- Гражданский процессуальный кодекс РБ
-
-💡 **Совет:** Перед подачей на развод рекомендуется проконсультироваться с юристом по семейному праву."""
-
-
-    def _response_tax(self):
-        """Ответ про налоги"""
-        return """📊 **Налоговые вопросы**
-
-Помощь с:
-1. Налоговыми вычетами
-2. Декларацией 3-НДФЛ
-3. Налогами при продаже имущества
-
-Уточните конкретный вопрос?"""
-
-    def _response_complaint(self):
-        """Ответ про жалобу"""
-        return """📝 **Жалоба/претензия**
-
-🏛️ **Куда можно подать жалобу:**
-
-1. **В местные исполнительные органы:**
-   - Областные, городские, районные исполкомы
-   - Администрации районов в городах
-
-2. **В контролирующие органы:**
-   - Комитет государственного контроля
-   - Министерство по налогам и сборам
-   - Министерство внутренних дел
-
-3. **В судебные органы:**
-   - Экономические суды (для споров с организациями)
-   - Общие суды (для споров с физлицами)
-
-📋 **Структура жалобы:**
-
-1. **Шапка:**
-   - Кому адресована (наименование органа, должностного лица)
-   - От кого (ФИО, адрес, контакты)
-
-2. **Описательная часть:**
-   - Суть нарушения (что, когда, где произошло)
-   - Какие права нарушены
-   - Доказательства (документы, фото, видео)
-
-3. **Требовательная часть:**
-   - Конкретные требования (принять меры, устранить нарушения и т.д.)
-   - Способ получения ответа (почта, электронно)
-
-4. **Приложения:**
-   - Копии документов, подтверждающих изложенное
-   - Список прилагаемых документов
-
-📅 **Сроки рассмотрения:**
-- До 15 дней - в государственных органах
-- До 1 месяца - в особо сложных случаях
-
-📚 **Нормативная база:**
-- Закон РБ "Об обращениях граждан и юридических лиц"
-- Административный процедурно-процессуальный кодекс
-
-⚠️ **Важно:** Жалоба должна быть обоснованной и содержать конкретные факты."""
-
-    def _response_termination(self):
-        """Ответ про расторжение договора"""
-        return """📄 **Расторжение договора**
-
-📋 **Основания расторжения договора:**
-
-1. **По соглашению сторон:**
-   - Заключается соглашение о расторжении
-   - Форма должна соответствовать форме основного договора
-
-2. **По требованию одной стороны:**
-   - Существенное нарушение договора другой стороной
-   - В случаях, предусмотренных законом или договором
-
-3. **Через суд:**
-   - При существенном изменении обстоятельств
-   - В иных случаях, предусмотренных законом или договором
-
-📝 **Порядок расторжения:**
-
-1. **Направление уведомления:**
-   - В письменной форме
-   - С указанием оснований расторжения
-   - С предложением расторгнуть договор
-
-2. **Ответ на уведомление:**
-   - В течение 30 дней (если иной срок не установлен договором)
-   - Отказ или согласие на расторжение
-
-3. **Последствия расторжения:**
-   - Прекращение обязательств на будущее время
-   - Возмещение убытков, причиненных расторжением договора
-   - Возврат исполненного по договору
-
-📅 **Сроки:**
-- Претензия направляется до обращения в суд
-- Срок ответа на претензию - 30 дней
-- Исковая давность - 3 года
-
-📚 **Нормативная база:**
-- Гражданский кодекс РБ (статьи 420-422)
-- Хозяйственный процессуальный кодекс РБ
-
-💡 **Рекомендация:** Перед расторжением договора проконсультируйтесь с юристом."""
-
-    def _response_lawsuit(self):
-        """Ответ про исковое заявление"""
-        return """⚖️ **Исковое заявление**
-
-📋 **Подсудность споров:**
-
-1. **Общие суды:**
-   - Споры между физическими лицами
-   - Споры с участием ИП
-   - Споры о недвижимости, семейные, трудовые споры
-
-2. **Экономические суды:**
-   - Споры между юридическими лицами
-   - Споры с участием индивидуальных предпринимателей в сфере предпринимательства
-   - Банкротные дела
-
-📝 **Структура искового заявления:**
-
-1. **Вводная часть:**
-   - Наименование суда
-   - Сведения об истце и ответчике (ФИО, адреса, контакты)
-   - Цена иска (если иск подлежит оценке)
-
-2. **Описательная часть:**
-   - Обстоятельства дела (что, когда, где произошло)
-   - Доказательства, подтверждающие эти обстоятельства
-   - Нормативное обоснование требований
-
-3. **Просительная часть:**
-   - Конкретные требования к ответчику
-   - Расчет взыскиваемых сумм
-   - Перечень прилагаемых документов
-
-4. **Приложения:**
-   - Копии искового заявления для ответчика
-   - Документы, подтверждающие обстоятельства
-   - Квитанция об уплате госпошлины
-
-💰 **Государственная пошлина:**
-- Зависит от цены иска
-- Минимальный размер - 5 базовых величин
-- Освобождение от уплаты для отдельных категорий дел
-
-📅 **Сроки:**
-- Срок рассмотрения дела: до 2 месяцев
-- Срок кассационного обжалования: 1 месяц
-- Исковая давность: 3 года
-
-📚 **Нормативная база:**
-- Гражданский процессуальный кодекс РБ
-- Хозяйственный процессуальный кодекс РБ
-
-💡 **Совет:** Для составления иска рекомендуется обратиться к юристу."""
-
-    def _response_power_of_attorney(self):
-        """Ответ про доверенность"""
-        return """📃 **Доверенность**
-
-📋 **Виды доверенностей:**
-
-1. **Разовая доверенность:**
-   - На совершение одного конкретного действия
-   - Например: получение документов, подписание договора
-
-2. **Специальная доверенность:**
-   - На совершение однородных действий в течение определенного времени
-   - Например: представление интересов в суде, управление имуществом
-
-3. **Генеральная доверенность:**
-   - На совершение широкого круга действий с имуществом
-   - Требует нотариального удостоверения
-
-📝 **Форма доверенности:**
-
-1. **Простая письменная форма:**
-   - Для сделок, которые могут быть совершены устно
-   - Для получения заработной платы, корреспонденции
-
-2. **Нотариальная форма:**
-   - Для сделок, требующих нотариальной формы
-   - Для действий, связанных с государственной регистрацией
-   - Для представительства за границей
-
-3. **Приравненные к нотариальным:**
-   - Доверенности военнослужащих - удостоверяются командирами
-   - Доверенности лиц в местах лишения свободы - удостоверяются начальниками учреждений
-
-📅 **Срок действия доверенности:**
-- Максимальный срок - 3 года
-- Если срок не указан - действует 1 год
-- Передоверие возможно только при наличии такого права в доверенности
-
-🚫 **Прекращение доверенности:**
-- Истечение срока
-- Отмена доверенности лицом, выдавшим ее
-- Отказ представителя
-- Смерть или признание недееспособным одной из сторон
-
-📚 **Нормативная база:**
-- Гражданский кодекс РБ (статьи 186-189)
-- Закон "О нотариате и нотариальной деятельности"
-
-⚠️ **Важно:** Доверенность, выданная на совершение сделки, требующей нотариальной формы, должна быть нотариально удостоверена."""
-
-    def _response_inheritance(self):
-        """Ответ про наследство"""
-        return """📜 **Наследство**
-
-📋 **Виды наследования:**
-
-1. **По завещанию:**
-   - Наследодатель сам определяет наследников
-   - Завещание должно быть нотариально удостоверено
-   - Можно лишить наследства законных наследников (кроме обязательной доли)
-
-2. **По закону (8 очередей):**
-   - 1-я очередь: дети, супруг, родители
-   - 2-я очередь: братья, сестры, дедушки, бабушки
-   - 3-я очередь: дяди, тети
-   - Последующие очереди: более дальние родственники
-
-3. **Обязательная доля:**
-   - Нетрудоспособные или несовершеннолетние дети
-   - Нетрудоспособные супруг и родители
-   - Не менее 1/2 доли, которая причиталась бы при наследовании по закону
-
-📅 **Срок принятия наследства:**
-- 6 месяцев со дня открытия наследства
-- Принятие осуществляется подачей заявления нотариусу
-- Фактическое принятие (проживание в квартире, оплата коммунальных услуг и т.д.)
-
-📝 **Документы для оформления наследства:**
-
-1. **Основные:**
-   - Свидетельство о смерти наследодателя
-   - Паспорт наследника
-   - Документы, подтверждающие родство
-   - Завещание (при наличии)
-
-2. **Дополнительные:**
-   - Правоустанавливающие документы на имущество
-   - Оценка имущества на день смерти наследодателя
-   - Справка о последнем месте жительства наследодателя
-
-💰 **Налоги и пошлины:**
-- Государственная пошлина за выдачу свидетельства о праве на наследство
-- Зависит от степени родства и стоимости наследства
-- Освобождение от уплаты для отдельных категорий наследников
-
-📚 **Нормативная база:**
-- Гражданский кодекс РБ (раздел VI)
-- Налоговый кодекс РБ
-
-💡 **Совет:** Для оформления наследства рекомендуется обратиться к нотариусу по месту открытия наследства."""
-
-    def _response_general(self, text):
-        """Общий ответ"""
-        if 'квартир' in text:
-            return "🏠 **Вопрос по недвижимости**\n\nЯ помогу с вопросами:\n1. Покупка/продажа квартиры\n2. Аренда жилья\n3. Оформление документов\n4. Коммунальные вопросы\n\nУточните, что именно вас интересует?"
-        elif 'договор' in text:
-            return "📝 **Вопрос по договорам**\n\nЯ помогу с:\n1. Составлением договоров\n2. Расторжением договоров\n3. Изменением условий\n4. Ответственностью сторон\n\nУточните тип договора?"
-        else:
-            return """🤖 **Юридический помощник**
-
-Я проанализировал ваш запрос. Для более точной консультации уточните:
-1. Конкретную правовую ситуацию
-2. Участников отношений
-3. Имеющиеся документы
-
-📋 **Популярные запросы:**
-• 'Как оформить договор аренды квартиры?'
-• 'Что нужно для продажи квартиры?'
-• 'Как подать на развод?'
-• 'Как взыскать алименты?'"""
+        """Генерация ответа по шаблону интента"""
+        return response_templates.render(intent, text)
 
-    def _get_icon(self, intent):
+    @staticmethod
+    def get_icon(intent):
         """Получение иконки для интента"""
         icons = {
             'договор_аренды': '🏠',
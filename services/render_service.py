@@ -0,0 +1,122 @@
+"""
+Кэш HTML-представлений ответов помощника
+Ответ рендерится один раз и хранится по хешу содержимого
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from config import Config
+from utils.database import Database
+from utils.markdown import render_markdown
+from utils.metrics import metrics, CACHE_REQUESTS
+
+
+class RenderService:
+    """
+    Сервис RenderService хранит HTML ответов в таблице rendered_answers.
+
+    Одинаковые ответы (шаблоны, статьи базы знаний) повторяются постоянно,
+    поэтому HTML хранится один раз на хеш содержимого, а сообщения
+    ссылаются на него через chat_messages.response_hash. Хеши, уже
+    записанные в БД, запоминаются в процессе, чтобы не рендерить повторно.
+    """
+
+    _known = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(text):
+        """Хеш содержимого ответа"""
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _remember(cls, answer_hash):
+        """Запоминание хеша в ограниченном LRU-кэше процесса"""
+        with cls._lock:
+            cls._known[answer_hash] = True
+            cls._known.move_to_end(answer_hash)
+            while len(cls._known) > Config.RENDER_CACHE_SIZE:
+                cls._known.popitem(last=False)
+
+    @classmethod
+    def store(cls, markdown, commit=False):
+        """
+        Сохранение HTML ответа (если его ещё нет).
+
+        Args:
+            markdown (str): Ответ в markdown
+            commit (bool): Зафиксировать транзакцию
+
+        Returns:
+            str или None: Хеш ответа
+        """
+        if not markdown:
+            return None
+
+        answer_hash = cls.content_hash(markdown)
+        if answer_hash in cls._known:
+            CACHE_REQUESTS.inc(('render', 'hit'))
+            return answer_hash
+        CACHE_REQUESTS.inc(('render', 'miss'))
+
+        db = Database()
+        exists = db.execute_one('SELECT 1 FROM rendered_answers WHERE hash = ?', (answer_hash,))
+        if not exists:
+            db.execute('INSERT OR IGNORE INTO rendered_answers (hash, html) VALUES (?, ?)',
+                       (answer_hash, render_markdown(markdown)))
+            if commit:
+                db.commit()
+
+        cls._remember(answer_hash)
+        return answer_hash
+
+    @staticmethod
+    def get_html(answer_hash):
+        """
+        Получение HTML по хешу.
+
+        Returns:
+            str или None: HTML ответа
+        """
+        if not answer_hash:
+            return None
+        row = Database().execute_one('SELECT html FROM rendered_answers WHERE hash = ?', (answer_hash,))
+        return row['html'] if row else None
+
+    @classmethod
+    def backfill(cls, batch_size=500):
+        """
+        Рендеринг ответов для сообщений, сохранённых до появления кэша.
+
+        Args:
+            batch_size (int): Сообщений в одной транзакции
+
+        Returns:
+            int: Число обработанных сообщений
+        """
+        db = Database()
+        total = 0
+        while True:
+            rows = db.execute_all('''
+                                  SELECT id, response
+                                  FROM chat_messages
+                                  WHERE response IS NOT NULL
+                                    AND response != ''
+                                    AND response_hash IS NULL
+                                  LIMIT ?
+                                  ''', (batch_size,))
+            if not rows:
+                break
+
+            for row in rows:
+                answer_hash = cls.store(row['response'])
+                db.execute('UPDATE chat_messages SET response_hash = ? WHERE id = ?', (answer_hash, row['id']))
+            db.commit()
+            total += len(rows)
+
+        return total
+
+
+metrics.gauge('render_cache_entries', 'Хешей отрендеренных ответов в памяти процесса', (),
+              lambda: len(RenderService._known))
@@ -0,0 +1,210 @@
+"""
+Повторный прогон истории чатов через текущий NLP-конвейер
+Сравнение интентов и категорий с сохранёнными и одобренными экспертами
+"""
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Flask
+
+from config import Config
+from utils.database import Database
+from .nlp_rules import nlp_rules
+from .nlp_service import NLPService
+
+# Сколько расхождений сохраняется в отчёте
+DIFF_SAMPLE_SIZE = 50
+
+# Экземпляр NLPService рабочего процесса и приложение Flask для чтения
+# каталога помощников (профили правил) из БД
+_worker_nlp = None
+_worker_app = None
+
+
+def _init_worker(database):
+    """
+    Загрузка NLPService и правил NLP один раз на рабочий процесс
+    (весь прогон выполняется с одной версией правил).
+
+    Args:
+        database (str): Путь к файлу БД родительского процесса
+    """
+    global _worker_nlp, _worker_app
+    Config.DATABASE = database
+    _worker_app = Flask(__name__)
+    with _worker_app.app_context():
+        try:
+            nlp_rules.load()
+        finally:
+            Database().close_connection()
+    _worker_nlp = NLPService()
+
+
+def _analyze_batch(texts, assistant_ids):
+    """
+    Анализ пачки сообщений в рабочем процессе (с профилями помощников,
+    которым сообщения были отправлены).
+
+    Returns:
+        list: (интент, категория, уверенность) для каждого текста
+    """
+    with _worker_app.app_context():
+        try:
+            return [(a['intent'], a['category'], a['confidence'])
+                    for a in _worker_nlp.analyze_batch(texts, assistant_ids)]
+        finally:
+            Database().close_connection()
+
+
+class ReplayService:
+    """
+    Класс ReplayService прогоняет сохранённые сообщения chat_messages
+    через текущий NLPService и сравнивает результат с записанными
+    интентом и категорией. Каждое сообщение анализируется с профилем
+    своего помощника, как при ответе. Сообщения, одобренные экспертом (is_verified),
+    считаются эталоном; для остальных считается совпадение с прежней
+    версией конвейера.
+
+    Сообщения читаются пачками по id (без загрузки всей таблицы),
+    пачки обрабатываются в пуле процессов.
+    """
+
+    @staticmethod
+    def _batches(verified_only, since, limit, batch_size):
+        """Пачки сообщений в порядке id"""
+        db = Database()
+        last_id = 0
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            rows = db.execute_all(f'''
+                                  SELECT id, assistant_id, message, intent, category, is_verified
+                                  FROM chat_messages
+                                  WHERE id > ?
+                                    AND intent IS NOT NULL
+                                    AND created_at >= ?
+                                    {'AND is_verified = 1' if verified_only else ''}
+                                  ORDER BY id
+                                  LIMIT ?
+                                  ''', (last_id, since or '', size))
+            if not rows:
+                return
+            last_id = rows[-1]['id']
+            if remaining is not None:
+                remaining -= len(rows)
+            yield rows
+
+    @classmethod
+    def replay(cls, workers=None, batch_size=500, verified_only=False, since=None, limit=None):
+        """
+        Прогон истории сообщений.
+
+        Args:
+            workers (int): Число процессов (0 - в текущем процессе,
+                по умолчанию NLP_POOL_SIZE)
+            batch_size (int): Сообщений в одной пачке
+            verified_only (bool): Только одобренные экспертами сообщения
+            since (str): Сообщения начиная с даты (YYYY-MM-DD)
+            limit (int): Максимум сообщений
+
+        Returns:
+            dict: Точность по одобренным и всем сообщениям, пропускная
+                способность, частые замены интентов и примеры расхождений
+        """
+        workers = Config.NLP_POOL_SIZE if workers is None else workers
+        batches = cls._batches(verified_only, since, limit, batch_size)
+        report = _Report()
+        started = time.perf_counter()
+
+        if workers <= 0:
+            nlp = NLPService()
+            for rows in batches:
+                report.add(rows, [(a['intent'], a['category'], a['confidence'])
+                                  for a in nlp.analyze_batch([row['message'] for row in rows],
+                                                             [row['assistant_id'] for row in rows])])
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(Config.NLP_POOL_START_METHOD),
+                initializer=_init_worker,
+                initargs=(Config.DATABASE,)
+            ) as pool:
+                # Не больше двух пачек на процесс в очереди - память не растёт с размером истории
+                pending = []
+                for rows in batches:
+                    pending.append((rows, pool.submit(_analyze_batch, [row['message'] for row in rows],
+                                                      [row['assistant_id'] for row in rows])))
+                    if len(pending) >= workers * 2:
+                        rows, future = pending.pop(0)
+                        report.add(rows, future.result())
+                for rows, future in pending:
+                    report.add(rows, future.result())
+
+        return report.summary(time.perf_counter() - started, workers)
+
+
+class _Report:
+    """Накопление результатов повторного прогона"""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.per_intent = {}
+        self.changes = Counter()
+        self.diffs = []
+
+    def add(self, rows, results):
+        """Сравнение пачки результатов с сохранёнными значениями"""
+        for row, (intent, category, confidence) in zip(rows, results):
+            scope = 'verified' if row['is_verified'] else 'unverified'
+            intent_ok = intent == row['intent']
+            category_ok = category == row['category']
+            self.counts[scope] += 1
+            self.counts[scope + '_intent'] += intent_ok
+            self.counts[scope + '_category'] += category_ok
+
+            hits, total = self.per_intent.get(row['intent'], (0, 0))
+            self.per_intent[row['intent']] = (hits + intent_ok, total + 1)
+
+            if not (intent_ok and category_ok):
+                self.changes[(row['intent'], intent)] += not intent_ok
+                if len(self.diffs) < DIFF_SAMPLE_SIZE:
+                    self.diffs.append({
+                        'id': row['id'],
+                        'message': row['message'][:200],
+                        'verified': bool(row['is_verified']),
+                        'stored': f"{row['intent']} / {row['category']}",
+                        'replayed': f'{intent} / {category}',
+                        'confidence': confidence,
+                    })
+
+    def _accuracy(self, scope):
+        """Доли совпадений интента и категории для verified, unverified или всех"""
+        scopes = ('verified', 'unverified') if scope == 'all' else (scope,)
+        total = sum(self.counts[s] for s in scopes)
+        if not total:
+            return {'messages': 0, 'intent': None, 'category': None}
+        return {
+            'messages': total,
+            'intent': round(sum(self.counts[s + '_intent'] for s in scopes) / total, 4),
+            'category': round(sum(self.counts[s + '_category'] for s in scopes) / total, 4),
+        }
+
+    def summary(self, elapsed, workers):
+        """Итоговый отчёт"""
+        total = self.counts['verified'] + self.counts['unverified']
+        return {
+            'messages': total,
+            'workers': workers,
+            'seconds': round(elapsed, 2),
+            'messages_per_second': round(total / elapsed, 1) if elapsed else 0.0,
+            'verified': self._accuracy('verified'),
+            'unverified': self._accuracy('unverified'),
+            'all': self._accuracy('all'),
+            'per_intent': {intent: round(hits / count, 4)
+                           for intent, (hits, count) in sorted(self.per_intent.items())},
+            'intent_changes': [{'stored': old, 'replayed': new, 'count': count}
+                               for (old, new), count in self.changes.most_common(20) if count],
+            'diffs': self.diffs,
+        }
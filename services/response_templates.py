@@ -0,0 +1,245 @@
+"""
+Реестр шаблонов ответов помощника
+Шаблоны хранятся в файлах data/responses и могут переопределяться экспертами в БД
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from config import Config
+from utils.database import Database
+
+
+class ResponseTemplate:
+    """
+    Класс ResponseTemplate представляет шаблон ответа для одного интента.
+
+    Атрибуты:
+        key (str): Интент (или интент с уточнением, например общий_вопрос.договор)
+        body (str): Текст ответа в markdown
+        source (str): Откуда загружен шаблон (file или db)
+    """
+
+    __slots__ = ('key', 'body', 'source')
+
+    def __init__(self, key, body, source='file'):
+        self.key = key
+        self.body = body
+        self.source = source
+
+    def to_dict(self):
+        """Преобразование в словарь"""
+        return {'key': self.key, 'body': self.body, 'source': self.source}
+
+
+class ResponseTemplateRegistry:
+    """
+    Класс ResponseTemplateRegistry загружает шаблоны ответов один раз и
+    индексирует их по интенту. Генерация ответа сводится к поиску в словаре.
+
+    Для каждого интента ведётся статистика: число обращений и время выдачи.
+    Правки экспертов из других процессов обнаруживаются по версии шаблонов
+    в БД (response_templates_version), как у правил NLP.
+    """
+
+    GENERAL_INTENT = 'общий_вопрос'
+
+    # Уточнения общего ответа по словам запроса (первое совпадение)
+    GENERAL_VARIANTS = (
+        ('квартир', 'общий_вопрос.квартира'),
+        ('договор', 'общий_вопрос.договор'),
+    )
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.RESPONSE_TEMPLATES_DIR
+        self._templates = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._db_version = None
+        self._next_check = 0.0
+
+    def _load_files(self):
+        """Загрузка шаблонов из каталога"""
+        templates = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.md'):
+                continue
+            with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                templates[filename[:-3]] = f.read().rstrip('\n')
+        return templates
+
+    @staticmethod
+    def _load_db():
+        """Загрузка шаблонов, отредактированных экспертами"""
+        try:
+            rows = Database().execute_all('SELECT intent, body FROM response_templates')
+        except (RuntimeError, sqlite3.OperationalError):
+            # Нет контекста приложения или таблица ещё не создана
+            return {}
+        return {row['intent']: row['body'] for row in rows}
+
+    @staticmethod
+    def _read_db_version():
+        """Версия шаблонов в БД (None - нет контекста приложения или таблицы)"""
+        try:
+            row = Database().execute_one('SELECT version FROM response_templates_version WHERE id = 1')
+        except (RuntimeError, sqlite3.OperationalError):
+            return None
+        return row['version'] if row else 0
+
+    def load(self):
+        """
+        (Пере)загрузка всех шаблонов.
+        Новый индекс собирается целиком и подменяет старый одной операцией.
+        """
+        # Версия читается до шаблонов: правка между чтениями вызовет ещё одну перезагрузку
+        version = self._read_db_version()
+        sources = {key: (body, 'file') for key, body in self._load_files().items()}
+        sources.update({key: (body, 'db') for key, body in self._load_db().items()})
+        templates = {key: ResponseTemplate(key, body, source) for key, (body, source) in sources.items()}
+
+        self._templates = templates
+        self._db_version = version
+        self._next_check = time.monotonic() + Config.RESPONSE_TEMPLATES_RELOAD_INTERVAL
+        return templates
+
+    def _ensure_loaded(self):
+        """
+        Ленивая загрузка при первом обращении.
+        Не чаще RESPONSE_TEMPLATES_RELOAD_INTERVAL проверяет, не изменились ли
+        шаблоны в БД другим процессом, и при необходимости перезагружает их.
+        """
+        templates = self._templates
+        if templates is None:
+            with self._lock:
+                templates = self._templates or self.load()
+        elif time.monotonic() >= self._next_check:
+            with self._lock:
+                self._next_check = time.monotonic() + Config.RESPONSE_TEMPLATES_RELOAD_INTERVAL
+                version = self._read_db_version()
+                if version is not None and version != self._db_version:
+                    templates = self.load()
+        return templates
+
+    def _stat(self, key):
+        """Статистика шаблона"""
+        stat = self._stats.get(key)
+        if stat is None:
+            stat = self._stats.setdefault(key, {'count': 0, 'total_ns': 0, 'max_ns': 0})
+        return stat
+
+    def resolve(self, intent, text=''):
+        """
+        Выбор шаблона для интента.
+
+        Args:
+            intent (str): Интент
+            text (str): Текст запроса в нижнем регистре (для общего ответа)
+
+        Returns:
+            ResponseTemplate: Найденный шаблон
+        """
+        templates = self._ensure_loaded()
+        if intent != self.GENERAL_INTENT and intent in templates:
+            return templates[intent]
+
+        for word, key in self.GENERAL_VARIANTS:
+            if word in text and key in templates:
+                return templates[key]
+        return templates[self.GENERAL_INTENT]
+
+    def render(self, intent, text=''):
+        """
+        Получение текста ответа для интента (markdown; HTML ответов
+        хранится в rendered_answers, общий для одинаковых ответов).
+
+        Args:
+            intent (str): Интент
+            text (str): Текст запроса в нижнем регистре
+
+        Returns:
+            str: Ответ
+        """
+        self._ensure_loaded()
+        started = time.perf_counter_ns()
+        template = self.resolve(intent, text)
+        result = template.body
+
+        elapsed = time.perf_counter_ns() - started
+        stat = self._stat(template.key)
+        stat['count'] += 1
+        stat['total_ns'] += elapsed
+        if elapsed > stat['max_ns']:
+            stat['max_ns'] = elapsed
+        return result
+
+    def all(self):
+        """
+        Список всех шаблонов (для редактирования).
+
+        Returns:
+            list: Шаблоны, отсортированные по ключу
+        """
+        templates = self._ensure_loaded()
+        return [templates[key] for key in sorted(templates)]
+
+    def get(self, key):
+        """
+        Шаблон по ключу.
+
+        Returns:
+            ResponseTemplate или None: None, если такого шаблона нет
+        """
+        return self._ensure_loaded().get(key)
+
+    def save(self, intent, body, updated_by=None):
+        """
+        Сохранение шаблона, отредактированного экспертом, и перезагрузка реестра.
+
+        Args:
+            intent (str): Ключ шаблона
+            body (str): Новый текст в markdown
+            updated_by (int): ID эксперта
+
+        Raises:
+            KeyError: Шаблона с таким ключом нет (эксперт правит только существующие)
+        """
+        if self.get(intent) is None:
+            raise KeyError(intent)
+        db = Database()
+        db.execute('''
+                   INSERT INTO response_templates (intent, body, updated_by, updated_at)
+                   VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(intent) DO UPDATE SET body       = excluded.body,
+                                                     updated_by = excluded.updated_by,
+                                                     updated_at = excluded.updated_at
+                   ''', (intent, body.replace('\r\n', '\n').rstrip('\n'), updated_by))
+        db.execute('''
+                   INSERT INTO response_templates_version (id, version) VALUES (1, 1)
+                   ON CONFLICT(id) DO UPDATE SET version = version + 1
+                   ''')
+        db.commit()
+        with self._lock:
+            self.load()
+
+    def stats(self):
+        """
+        Стоимость выдачи ответов по интентам.
+
+        Returns:
+            list: Словари с числом обращений, средним и максимальным временем (мкс)
+        """
+        report = []
+        for key, stat in sorted(self._stats.items()):
+            count = stat['count']
+            report.append({
+                'key': key,
+                'count': count,
+                'avg_us': round(stat['total_ns'] / count / 1000, 2) if count else 0.0,
+                'max_us': round(stat['max_ns'] / 1000, 2),
+            })
+        return report
+
+
+response_templates = ResponseTemplateRegistry()
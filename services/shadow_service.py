@@ -0,0 +1,298 @@
+"""
+Теневой режим NLP
+Доля живых запросов дополнительно оценивается кандидатной версией NLP
+в фоновых процессах; пользователь получает ответ основной версии
+"""
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import Flask
+
+from config import Config
+from utils.database import Database
+from utils.metrics import metrics
+from .nlp_service import NLPService
+
+# Теневые оценки по результату: agreed, disagreed, dropped (очередь полна), failed
+SHADOW_EVALUATIONS = metrics.counter(
+    'nlp_shadow_evaluations', 'Оценки запросов кандидатом NLP в теневом режиме', ('result',)
+)
+
+
+class KeywordCandidate(NLPService):
+    """
+    Кандидат по умолчанию: основной NLPService с ключевыми словами
+    интентов из SHADOW_KEYWORDS_FILE ({"интент": ["ключ", ...]}).
+    Интенты из файла заменяют или дополняют текущие правила nlp_rules.
+    """
+
+    def __init__(self, keywords_file=None):
+        super().__init__(cache_size=0)
+        path = keywords_file or Config.SHADOW_KEYWORDS_FILE
+        overrides = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                overrides = json.load(f)
+        self.overrides = overrides
+        self._rules = None
+        digest = hashlib.sha1(json.dumps(overrides, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+        self.name = f'keywords:{digest}'
+
+    def rules(self):
+        """Текущие правила с ключевыми словами из файла (пересобираются при смене версии)"""
+        current = super().rules()
+        if self._rules is None or self._rules.version != current.version:
+            self._rules = current.with_keywords(self.overrides)
+        return self._rules
+
+
+def load_candidate(path):
+    """
+    Создание кандидата по пути вида module:callable.
+
+    Returns:
+        object: Объект с методом analyze(text, assistant_id=None) и атрибутом name
+    """
+    module_name, _, attr = path.partition(':')
+    candidate = getattr(importlib.import_module(module_name), attr)()
+    if not getattr(candidate, 'name', None):
+        candidate.name = path
+    return candidate
+
+
+# Состояние рабочего процесса: основной NLP без кэша и кандидат,
+# приложение Flask для чтения правил NLP из БД
+_worker = None
+_worker_app = None
+
+
+def _init_worker(candidate_path, database):
+    """Загрузка основной и кандидатной версии NLP в рабочем процессе"""
+    global _worker, _worker_app
+    Config.DATABASE = database
+    _worker_app = Flask(__name__)
+    _worker = (NLPService(cache_size=0), load_candidate(candidate_path))
+
+
+def _timed_analyze(nlp, text, assistant_id):
+    """Анализ с замером времени в миллисекундах"""
+    started = time.perf_counter()
+    analysis = nlp.analyze(text, assistant_id=assistant_id)
+    return analysis, round((time.perf_counter() - started) * 1000, 3)
+
+
+def _evaluate(text, assistant_id=None):
+    """
+    Оценка запроса основной и кандидатной версией в одном процессе
+    (задержки сравнимы: одинаковая нагрузка, без кэша и очереди пула).
+    Обе версии получают помощника запроса: интенты ограничены его профилем,
+    как и у сохранённого ответа.
+
+    Returns:
+        dict: Имя кандидата, его результат и задержки обеих версий
+    """
+    with _worker_app.app_context():
+        try:
+            # Правила загружаются до замера, чтобы их перечитывание не попало в задержку
+            primary, candidate = _worker
+            primary.rules()
+            return _compare(primary, candidate, text, assistant_id)
+        finally:
+            Database().close_connection()
+
+
+def _compare(primary, candidate, text, assistant_id=None):
+    """Анализ запроса обеими версиями со сравнимыми замерами времени"""
+    # Порядок случайный: первый вызов не должен систематически платить за прогрев
+    if random.random() < 0.5:
+        _, primary_ms = _timed_analyze(primary, text, assistant_id)
+        analysis, candidate_ms = _timed_analyze(candidate, text, assistant_id)
+    else:
+        analysis, candidate_ms = _timed_analyze(candidate, text, assistant_id)
+        _, primary_ms = _timed_analyze(primary, text, assistant_id)
+    return {
+        'candidate': candidate.name,
+        'intent': analysis['intent'],
+        'category': analysis['category'],
+        'confidence': analysis['confidence'],
+        'primary_ms': primary_ms,
+        'candidate_ms': candidate_ms,
+    }
+
+
+class ShadowRunner:
+    """
+    Класс ShadowRunner отбирает SHADOW_SAMPLE_RATE запросов и отправляет
+    их на оценку кандидату в фоновые процессы.
+
+    submit() только кладёт задачу в ограниченную очередь: если очередь
+    полна или кандидат упал, запрос просто не оценивается. Фоновые потоки
+    передают задачи в пул процессов и записывают сравнение в nlp_shadow_results.
+    """
+
+    def __init__(self):
+        self.enabled = Config.SHADOW_ENABLED
+        self.sample_rate = Config.SHADOW_SAMPLE_RATE
+        self.app = None
+        self._queue = queue.Queue(maxsize=Config.SHADOW_QUEUE_SIZE)
+        self._pool = None
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Привязка к приложению Flask (нужно для записи в БД из фоновых потоков)"""
+        self.app = app
+        app.extensions['shadow_runner'] = self
+
+    def _ensure_started(self):
+        """Ленивый запуск пула и фоновых потоков при первой оценке"""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            workers = Config.SHADOW_WORKERS
+            if workers > 0:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context(Config.NLP_POOL_START_METHOD),
+                    initializer=_init_worker,
+                    initargs=(Config.SHADOW_CANDIDATE, Config.DATABASE)
+                )
+            else:
+                _init_worker(Config.SHADOW_CANDIDATE, Config.DATABASE)
+            for i in range(max(workers, 1)):
+                thread = threading.Thread(target=self._worker, name=f'nlp-shadow-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, message_id, text, primary, assistant_id=None):
+        """
+        Постановка запроса на теневую оценку (не блокирует).
+
+        Args:
+            message_id (int): ID сообщения
+            text (str): Текст запроса
+            primary (dict): Результат основной версии NLP
+            assistant_id (int): ID помощника, с профилем которого получен primary
+        """
+        if not self.enabled or primary.get('degraded') or random.random() >= self.sample_rate:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((message_id, text, primary['intent'], primary['category'],
+                                    primary['confidence'], assistant_id))
+        except queue.Full:
+            SHADOW_EVALUATIONS.inc(('dropped',))
+
+    def _worker(self):
+        """Цикл фонового потока"""
+        while True:
+            task = self._queue.get()
+            try:
+                result = (self._pool.submit(_evaluate, task[1], task[5]).result() if self._pool
+                          else _evaluate(task[1], task[5]))
+                with self.app.app_context():
+                    try:
+                        self._save(task, result)
+                    finally:
+                        Database().close_connection()
+            except BrokenProcessPool:
+                # Кандидат уронил процесс - теневой режим выключается до перезапуска
+                SHADOW_EVALUATIONS.inc(('failed',))
+                self.enabled = False
+                print('⚠️ Теневой режим NLP остановлен: процесс кандидата завершился аварийно')
+            except Exception as e:
+                SHADOW_EVALUATIONS.inc(('failed',))
+                print(f'⚠️ Ошибка теневой оценки сообщения {task[0]}: {e}')
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _save(task, result):
+        """Запись сравнения в nlp_shadow_results"""
+        message_id, text, intent, category, confidence, _ = task
+        agreed = intent == result['intent'] and category == result['category']
+        SHADOW_EVALUATIONS.inc(('agreed' if agreed else 'disagreed',))
+        db = Database()
+        db.execute('''
+                   INSERT INTO nlp_shadow_results (message_id, message, candidate,
+                                                   primary_intent, primary_category, primary_confidence,
+                                                   candidate_intent, candidate_category, candidate_confidence,
+                                                   primary_ms, candidate_ms, agreed)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ''', (message_id, text, result['candidate'], intent, category, confidence,
+                         result['intent'], result['category'], result['confidence'],
+                         result['primary_ms'], result['candidate_ms'], agreed))
+        db.commit()
+
+    def wait(self):
+        """Ожидание обработки очереди (для тестов и бенчмарков)"""
+        self._queue.join()
+
+    @staticmethod
+    def summary(limit=50):
+        """
+        Сводка теневых оценок.
+
+        Args:
+            limit (int): Сколько последних расхождений вернуть
+
+        Returns:
+            dict: Сводка по кандидатам, частые замены интентов и расхождения
+        """
+        db = Database()
+        candidates = db.execute_all('''
+                                    SELECT candidate,
+                                           COUNT(*)                            AS total,
+                                           SUM(agreed)                         AS agreed,
+                                           AVG(primary_ms)                     AS primary_ms,
+                                           AVG(candidate_ms)                   AS candidate_ms,
+                                           AVG(candidate_ms - primary_ms)      AS delta_ms,
+                                           MAX(created_at)                     AS last_at
+                                    FROM nlp_shadow_results
+                                    GROUP BY candidate
+                                    ORDER BY last_at DESC
+                                    ''')
+        changes = db.execute_all('''
+                                 SELECT candidate, primary_intent, candidate_intent, COUNT(*) AS count
+                                 FROM nlp_shadow_results
+                                 WHERE agreed = 0
+                                 GROUP BY candidate, primary_intent, candidate_intent
+                                 ORDER BY count DESC
+                                 LIMIT 20
+                                 ''')
+        disagreements = db.execute_all('''
+                                       SELECT *
+                                       FROM nlp_shadow_results
+                                       WHERE agreed = 0
+                                       ORDER BY id DESC
+                                       LIMIT ?
+                                       ''', (limit,))
+        return {
+            'candidates': [dict(row) for row in candidates],
+            'changes': [dict(row) for row in changes],
+            'disagreements': [dict(row) for row in disagreements],
+        }
+
+    @staticmethod
+    def clear():
+        """Удаление результатов теневых оценок"""
+        db = Database()
+        db.execute('DELETE FROM nlp_shadow_results')
+        db.commit()
+
+
+shadow_runner = ShadowRunner()
+
+metrics.gauge('nlp_shadow_queue_depth', 'Запросов в очереди теневой оценки', (),
+              lambda: shadow_runner._queue.qsize())
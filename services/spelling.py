@@ -0,0 +1,360 @@
+"""
+Исправление опечаток в запросах
+Индекс симметричного удаления (SymSpell) по основам ключевых слов
+интентов и самым частым словам проверенных статей базы знаний
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, has_app_context
+
+from config import Config
+from utils.database import Database
+from utils.lemmatizer import is_known
+from .nlp_rules import nlp_rules
+
+TOKEN_RE = re.compile(r'[а-яё]+')
+
+# Основы короче не исправляются: слишком много слов на расстоянии 1
+MIN_STEM_LENGTH = 5
+
+# Частота основы ключевого слова: при равном расстоянии основа важнее слова статьи
+STEM_FREQUENCY = 10 ** 6
+
+# Основы и слова запроса короче исправляются не больше чем на одну букву
+# (иначе «документов» становится «покупентов»)
+SHORT_STEM_LENGTH = 8
+
+# Исправлений слов, запоминаемых индексом (слова запросов повторяются)
+LOOKUP_CACHE_SIZE = 50000
+
+# Беглые гласные в последних FLEETING_LENGTH буквах основы: «ребенка» - форма
+# основы «ребенок», а не опечатка
+FLEETING_VOWELS = 'оеё'
+FLEETING_LENGTH = 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Расстояние Дамерау-Левенштейна (с перестановкой соседних букв).
+
+    Args:
+        a (str): Первая строка
+        b (str): Вторая строка
+        limit (int): Максимальное интересующее расстояние
+
+    Returns:
+        int: Расстояние или limit + 1, если оно больше limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def deletes(word, distance):
+    """Все варианты слова без 0..distance букв"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier if len(variant) > 1
+                    for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+class SpellingIndex:
+    """
+    Класс SpellingIndex - неизменяемый индекс симметричного удаления.
+
+    Для каждого слова словаря заранее построены варианты его начала
+    (prefix_length букв) без одной-двух букв, для основ - варианты всей
+    основы. Проверка слова запроса - поиск в словаре его собственных
+    удалений и уточнение расстояния для найденных кандидатов, то есть
+    время почти не зависит от размера словаря.
+
+    Основы ключевых слов (stems) сравниваются с началом слова запроса:
+    «алементы» исправляется в «алименты» по основе «алимент».
+
+    Исправляются только неизвестные слова: не из словаря статей, не
+    начинающиеся с основы ключевого слова (в том числе без беглой
+    гласной) и, если установлен pymorphy2, отсутствующие в его словаре.
+    """
+
+    def __init__(self, words, stems, max_distance=None, prefix_length=None, min_length=None, known_words=None):
+        """
+        Args:
+            words (dict): Слово -> частота (словарь статей, по которому исправляются слова)
+            stems (iterable): Основы ключевых слов интентов
+            max_distance (int): Максимальное расстояние (по умолчанию NLP_SPELLING_MAX_DISTANCE)
+            prefix_length (int): Длина индексируемого начала слова
+            min_length (int): Слова запроса короче не исправляются
+            known_words (iterable): Остальные правильные слова (не исправляются,
+                но и не предлагаются как исправления)
+        """
+        self.max_distance = Config.NLP_SPELLING_MAX_DISTANCE if max_distance is None else max_distance
+        self.prefix_length = prefix_length or Config.NLP_SPELLING_PREFIX_LENGTH
+        self.min_length = min_length or Config.NLP_SPELLING_MIN_LENGTH
+        self.words = dict(words)
+        self.stems = tuple(sorted({stem for stem in stems if len(stem) >= MIN_STEM_LENGTH}))
+        self._stem_prefixes = tuple(sorted(set(stems)))
+        self._fleeting_prefixes = tuple(sorted({stem[:i] + stem[i + 1:] for stem in self.stems
+                                                for i in range(len(stem) - FLEETING_LENGTH, len(stem))
+                                                if stem[i] in FLEETING_VOWELS}))
+        self._known_words = frozenset(known_words or ())
+        self._stem_lengths = tuple(sorted({len(stem) for stem in self.stems}))
+
+        self._word_index = self._build(self.words, lambda word: word[:self.prefix_length])
+        self._stem_index = self._build(self.stems, lambda stem: stem)
+        self._lookups = {}
+
+    def _build(self, entries, key):
+        """Вариант с удалёнными буквами -> слова словаря"""
+        index = {}
+        for entry in entries:
+            for variant in deletes(key(entry), self.max_distance):
+                index.setdefault(variant, []).append(entry)
+        return {variant: tuple(entries) for variant, entries in index.items()}
+
+    def __len__(self):
+        return len(self.words) + len(self.stems)
+
+    def known(self, token):
+        """Слово правильное: в словаре, форма основы ключевого слова или известно pymorphy2"""
+        return (token in self.words or token in self._known_words
+                or token.startswith(self._stem_prefixes)
+                or token.startswith(self._fleeting_prefixes)
+                or bool(is_known(token)))
+
+    def _limit(self, token):
+        """Допустимое расстояние: короткие слова - не больше одной ошибки"""
+        return min(self.max_distance, 1 if len(token) < SHORT_STEM_LENGTH else 2)
+
+    def lookup(self, token):
+        """
+        Исправление одного слова.
+
+        Args:
+            token (str): Слово в нижнем регистре
+
+        Returns:
+            tuple: (исправление, расстояние) или (token, 0), если исправлять
+                нечего или подходящего слова нет
+        """
+        if len(token) < self.min_length or self.known(token):
+            return token, 0
+        result = self._lookups.get(token)
+        if result is None:
+            if len(self._lookups) >= LOOKUP_CACHE_SIZE:
+                self._lookups = {}
+            result = self._lookups[token] = self._lookup(token)
+        return result
+
+    def _lookup(self, token):
+        """Поиск ближайшего слова или основы по индексу"""
+        limit = self._limit(token)
+        best = None
+        # Основы сравниваются с началом слова той же длины, слова статей - по началу слова
+        queries = [(self._stem_index, token[:length], True) for length in self._stem_lengths]
+        queries.append((self._word_index, token[:self.prefix_length], False))
+        seen = set()
+        for index, key, is_stem in queries:
+            for variant in deletes(key, limit):
+                for entry in index.get(variant, ()):
+                    if (entry, is_stem) in seen:
+                        continue
+                    seen.add((entry, is_stem))
+                    candidate = self._match(token, entry, is_stem, limit)
+                    if candidate is None:
+                        continue
+                    frequency = STEM_FREQUENCY if is_stem else self.words[entry]
+                    rank = (candidate[1], -frequency)
+                    if best is None or rank < best[0]:
+                        best = (rank, candidate)
+        return best[1] if best else (token, 0)
+
+    @staticmethod
+    def _match(token, entry, is_stem, limit):
+        """
+        Проверка кандидата.
+
+        Returns:
+            tuple: (исправленное слово, расстояние) или None
+        """
+        if not is_stem:
+            distance = edit_distance(token, entry, limit)
+            return (entry, distance) if distance <= limit else None
+        # Основа сравнивается с началом слова подходящей длины, окончание сохраняется
+        # (при равном расстоянии - начало той же длины, что и основа)
+        if len(entry) < SHORT_STEM_LENGTH:
+            limit = 1
+        best = None
+        for length in range(max(len(entry) - limit, 1), min(len(entry) + limit, len(token)) + 1):
+            distance = edit_distance(token[:length], entry, limit)
+            rank = (distance, abs(length - len(entry)))
+            if distance <= limit and (best is None or rank < best[0]):
+                best = (rank, entry + token[length:])
+        return (best[1], best[0][0]) if best else None
+
+    def correct(self, text):
+        """
+        Исправление опечаток в тексте.
+
+        Args:
+            text (str): Текст в нижнем регистре
+
+        Returns:
+            tuple: (исправленный текст, список пар (было, стало))
+        """
+        corrections = []
+
+        def replace(match):
+            token = match.group(0)
+            fixed, distance = self.lookup(token)
+            if distance:
+                corrections.append((token, fixed))
+            return fixed
+
+        corrected = TOKEN_RE.sub(replace, text)
+        return corrected, corrections
+
+
+class SpellingRegistry:
+    """
+    Класс SpellingRegistry хранит текущий SpellingIndex процесса.
+
+    Первое обращение сразу получает индекс основ ключевых слов, а полный
+    индекс (основы и NLP_SPELLING_VOCABULARY_SIZE самых частых слов
+    проверенных статей) собирается в фоновом потоке. Индекс пересобирается
+    в фоне, когда меняется версия правил NLP или версия базы знаний
+    (knowledge_version, увеличивается триггерами при любом изменении
+    статей); проверка - не чаще NLP_SPELLING_RELOAD_INTERVAL секунд.
+    До конца сборки запросы проверяются предыдущим индексом: новый
+    подменяет его целиком, чтение без блокировок.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._signature = None
+        self._next_check = 0.0
+        self._building = False
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        Текущий индекс.
+
+        Returns:
+            SpellingIndex: Индекс последней собранной версии словаря
+        """
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    # Основы собираются быстро; слова статей - в фоне
+                    self._index = SpellingIndex({}, self._stems())
+                    self._signature = (nlp_rules.current().version, None)
+                    self._check()
+            return self._index
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._check()
+            finally:
+                self._lock.release()
+        return self._index
+
+    def _check(self):
+        """Запуск фоновой сборки, если словарь изменился (вызывается под блокировкой)"""
+        self._next_check = time.monotonic() + Config.NLP_SPELLING_RELOAD_INTERVAL
+        signature = self._read_signature()
+        if signature == self._signature or self._building or not has_app_context():
+            return
+        self._building = True
+        self._signature = signature
+        threading.Thread(target=self._build, args=(current_app._get_current_object(), signature),
+                         name='spelling-index', daemon=True).start()
+
+    @staticmethod
+    def _read_signature():
+        """Версия правил и версия базы знаний (None - нет контекста приложения)"""
+        try:
+            row = Database().execute_one('SELECT version FROM knowledge_version WHERE id = 1')
+            knowledge = row['version'] if row else 0
+        except (RuntimeError, sqlite3.OperationalError):
+            knowledge = None
+        return nlp_rules.current().version, knowledge
+
+    @staticmethod
+    def _stems():
+        """Основы ключевых слов текущих правил"""
+        return [kw for _, keywords in nlp_rules.current().keywords for kw in keywords]
+
+    @staticmethod
+    def _vocabulary():
+        """
+        Словарь проверенных статей базы знаний.
+
+        Returns:
+            tuple: (самые частые слова -> частота, остальные слова)
+        """
+        try:
+            rows = Database().execute_all('SELECT title, content FROM knowledge_base WHERE is_verified = 1')
+        except (RuntimeError, sqlite3.OperationalError):
+            return {}, ()
+        words = Counter()
+        for row in rows:
+            words.update(word for word in TOKEN_RE.findall(f"{row['title']} {row['content']}".lower())
+                         if len(word) >= Config.NLP_SPELLING_MIN_LENGTH)
+        frequent = dict(words.most_common(Config.NLP_SPELLING_VOCABULARY_SIZE))
+        return frequent, [word for word in words if word not in frequent]
+
+    def _build(self, app, signature):
+        """Сборка полного индекса в фоновом потоке"""
+        try:
+            with app.app_context():
+                try:
+                    stems = self._stems()
+                    words, known_words = self._vocabulary()
+                finally:
+                    Database().close_connection()
+            self._index = SpellingIndex(words, stems, known_words=known_words)
+        except Exception as e:
+            print(f"⚠️ Ошибка сборки индекса опечаток: {e}")
+            self._signature = None  # повтор при следующей проверке
+        finally:
+            self._building = False
+
+    def load(self):
+        """
+        Синхронная сборка полного индекса (для бенчмарков и командной строки).
+        Вызывается в контексте приложения.
+
+        Returns:
+            SpellingIndex: Собранный индекс
+        """
+        with self._lock:
+            signature = self._read_signature()
+            words, known_words = self._vocabulary()
+            self._index = SpellingIndex(words, self._stems(), known_words=known_words)
+            self._signature = signature
+            self._next_check = time.monotonic() + Config.NLP_SPELLING_RELOAD_INTERVAL
+            return self._index
+
+
+spelling = SpellingRegistry()
@@ -0,0 +1,408 @@
+"""
+Запуск тестов панели разработчика
+Тесты из таблицы tests (запрос и ожидаемый результат) выполняются против
+NLPService в отдельных процессах с таймаутами и ограничениями ресурсов
+"""
+import json
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows: процесс тестов без ограничений памяти и процессорного времени
+    resource = None
+
+from config import Config, BASE_DIR
+from utils.database import Database
+from utils.logger import SystemLogger
+
+# Ключи ожидаемого результата NLP-теста
+EXPECTATION_KEYS = ('intent', 'category', 'min_confidence', 'response_contains')
+
+# Сколько символов ответа сохраняется в actual_output
+OUTPUT_LIMIT = 500
+
+# Копия БД в рабочем каталоге процесса тестов
+SNAPSHOT_NAME = 'snapshot.db'
+
+# Таймаут отдельного теста через SIGALRM (на Windows его нет - тест
+# ограничивает только общий срок процесса в TestRunner._spawn)
+ALARM_AVAILABLE = hasattr(signal, 'setitimer')
+
+
+class TestTimeout(Exception):
+    """Тест не уложился в TEST_RUNNER_TIMEOUT"""
+
+
+def is_script(code):
+    """Код теста похож на Python-скрипт (такие тесты не выполняются)"""
+    return 'def test_' in code or 'assert ' in code or 'import ' in code
+
+
+def parse_expected(expected_output):
+    """
+    Ожидаемый результат NLP-теста.
+
+    Args:
+        expected_output (str): JSON-объект с ключами intent, category,
+            min_confidence, response_contains или просто название интента
+
+    Returns:
+        dict: Проверяемые значения
+    """
+    text = (expected_output or '').strip()
+    if not text:
+        return {}
+    if not text.startswith('{'):
+        return {'intent': text}
+    expected = json.loads(text)
+    unknown = set(expected) - set(EXPECTATION_KEYS)
+    if unknown:
+        raise ValueError(f'Неизвестные ключи ожидаемого результата: {", ".join(sorted(unknown))}')
+    return expected
+
+
+def check_query(nlp, query, expected, assistant_id=None):
+    """
+    Проверка ответа NLPService на запрос.
+
+    Args:
+        nlp (NLPService): Сервис NLP рабочего процесса
+        query (str): Текст запроса
+        expected (dict): Результат parse_expected
+        assistant_id (int): Помощник, чей профиль проверяется (None - без профиля)
+
+    Returns:
+        tuple: (список расхождений, фактический результат)
+    """
+    result = nlp.process_query(query, assistant_id)
+    failures = []
+    for key in ('intent', 'category'):
+        if key in expected and result[key] != expected[key]:
+            failures.append(f'{key}: ожидалось {expected[key]}, получено {result[key]}')
+    if 'min_confidence' in expected and result['confidence'] < float(expected['min_confidence']):
+        failures.append(f"confidence: {result['confidence']:.2f} < {float(expected['min_confidence']):.2f}")
+    fragments = expected.get('response_contains', [])
+    for fragment in [fragments] if isinstance(fragments, str) else fragments:
+        if fragment.lower() not in result['response'].lower():
+            failures.append(f'в ответе нет «{fragment}»')
+
+    return failures, {
+        'intent': result['intent'],
+        'category': result['category'],
+        'confidence': result['confidence'],
+        'response': result['response'][:OUTPUT_LIMIT],
+    }
+
+
+def _alarm(signum, frame):
+    raise TestTimeout()
+
+
+def run_one(nlp, test, timeout):
+    """
+    Выполнение одного теста внутри рабочего процесса.
+
+    Returns:
+        dict: id, status, actual_output (JSON) и duration_ms
+    """
+    code = test['code'].strip()
+    started = time.perf_counter()
+    if ALARM_AVAILABLE:
+        signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if not code:
+            failures, output = ['код теста пуст'], {}
+        elif is_script(code):
+            failures, output = ['Python-код в тестах не выполняется: укажите текст запроса '
+                                'и ожидаемый результат'], {}
+        else:
+            failures, output = check_query(nlp, code, parse_expected(test['expected_output']),
+                                           test.get('assistant_id'))
+        if failures:
+            output['failures'] = failures
+    except TestTimeout:
+        failures, output = True, {'error': f'Превышено время выполнения ({timeout} с)'}
+    except BaseException as e:
+        failures, output = True, {
+            'error': f'{type(e).__name__}: {e}',
+            'traceback': traceback.format_exc(limit=-3)[-OUTPUT_LIMIT:],
+        }
+    finally:
+        if ALARM_AVAILABLE:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return {
+        'id': test['id'],
+        'status': 'failed' if failures else 'passed',
+        'actual_output': json.dumps(output, ensure_ascii=False),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def _worker_main(database, timeout, memory_mb):
+    """
+    Рабочий процесс: читает тесты из stdin, печатает результаты
+    построчно в stdout. Работает с копией БД в своём временном каталоге
+    (изменения теряются вместе с каталогом), пути к рабочей БД не получает.
+    """
+    results = sys.stdout
+    sys.stdout = sys.stderr  # сообщения при загрузке моделей не попадают в результаты
+
+    tests = json.load(sys.stdin)
+    if resource is not None:
+        cpu_seconds = int(Config.TEST_RUNNER_STARTUP_TIMEOUT + timeout * len(tests)) + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        if memory_mb:
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    from flask import Flask, g
+    from services.nlp_service import NLPService
+
+    app = Flask(__name__)
+    nlp = NLPService()
+    with app.app_context():
+        g.db = sqlite3.connect(f'file:{urllib.parse.quote(database)}?mode=ro', uri=True)
+        g.db.row_factory = sqlite3.Row
+        for test in tests:
+            results.write(json.dumps(run_one(nlp, test, timeout), ensure_ascii=False) + '\n')
+            results.flush()
+
+
+class TestRunner:
+    """
+    Класс TestRunner выполняет тесты панели разработчика.
+
+    Тесты делятся между TEST_RUNNER_WORKERS процессами, каждый процесс
+    загружает NLPService один раз и выполняет свою часть тестов по очереди.
+    Тест - только данные (запрос, помощник и ожидаемый результат): код из
+    таблицы tests не выполняется. Процесс запускается во временном каталоге
+    с копией БД, без переменных окружения приложения, с ограничениями памяти
+    и процессорного времени (на Unix).
+    """
+
+    __test__ = False
+
+    def __init__(self, workers=None, timeout=None, memory_mb=None):
+        self.workers = workers or Config.TEST_RUNNER_WORKERS
+        self.timeout = timeout or Config.TEST_RUNNER_TIMEOUT
+        self.memory_mb = Config.TEST_RUNNER_MEMORY_MB if memory_mb is None else memory_mb
+
+    def run(self, tests):
+        """
+        Выполнение тестов.
+
+        Args:
+            tests (list): Строки таблицы tests (id, code, expected_output, assistant_id)
+
+        Returns:
+            list: Результаты (id, status, actual_output, duration_ms)
+        """
+        tests = [{'id': test['id'], 'code': test['code'] or '', 'expected_output': test['expected_output'] or '',
+                  'assistant_id': test['assistant_id']}
+                 for test in tests]
+        if not tests:
+            return []
+        workers = min(self.workers, len(tests))
+        chunks = [tests[i::workers] for i in range(workers)]
+        with tempfile.TemporaryDirectory(prefix='legal-ai-snapshot-') as directory:
+            snapshot = self._snapshot(directory)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return [result for chunk in pool.map(lambda part: self._run_chunk(part, snapshot), chunks)
+                        for result in chunk]
+
+    @staticmethod
+    def _snapshot(directory):
+        """
+        Согласованная копия рабочей БД (backup API SQLite) на время запуска.
+
+        Returns:
+            str: Путь к копии
+        """
+        path = os.path.join(directory, SNAPSHOT_NAME)
+        source = sqlite3.connect(f'file:{urllib.parse.quote(os.path.abspath(Config.DATABASE))}?mode=ro', uri=True)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return path
+
+    def _run_chunk(self, tests, snapshot):
+        """
+        Выполнение части тестов в отдельном процессе. Если процесс упал
+        или завис, провалом отмечается тест, на котором это произошло,
+        а оставшиеся тесты выполняются в новом процессе.
+        """
+        results = []
+        while tests:
+            done, reason, stderr = self._spawn(tests, snapshot)
+            results.extend(done)
+            if len(done) == len(tests):
+                break
+            culprit = tests[len(done)]
+            results.append({
+                'id': culprit['id'],
+                'status': 'failed',
+                'actual_output': json.dumps({'error': reason, 'stderr': stderr[-OUTPUT_LIMIT:]},
+                                            ensure_ascii=False),
+                'duration_ms': None,
+            })
+            tests = tests[len(done) + 1:]
+        return results
+
+    def _spawn(self, tests, snapshot):
+        """
+        Запуск рабочего процесса для тестов. Процесс получает свою копию
+        снимка БД: изменения одного процесса не видны другим.
+
+        Returns:
+            tuple: (результаты выполненных по порядку тестов, причина остановки, stderr)
+        """
+        deadline = Config.TEST_RUNNER_STARTUP_TIMEOUT + self.timeout * len(tests)
+        with tempfile.TemporaryDirectory(prefix='legal-ai-tests-') as workdir:
+            shutil.copyfile(snapshot, os.path.join(workdir, SNAPSHOT_NAME))
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'services.test_runner', SNAPSHOT_NAME, str(self.timeout), str(self.memory_mb)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                cwd=workdir, env=self._environment(workdir), text=True, encoding='utf-8'
+            )
+            try:
+                stdout, stderr = process.communicate(json.dumps(tests, ensure_ascii=False), timeout=deadline)
+                reason = f'Процесс тестов завершился с кодом {process.returncode}'
+            except subprocess.TimeoutExpired:
+                process.kill()
+                stdout, stderr = process.communicate()
+                reason = f'Процесс тестов остановлен: не уложился в {deadline} с'
+
+        # Кроме результатов в stdout могут быть сообщения импорта пакета services
+        done = []
+        for line in stdout.splitlines():
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(result, dict) and 'id' in result:
+                done.append(result)
+        return done, reason, stderr
+
+    @staticmethod
+    def _environment(workdir):
+        """Окружение рабочего процесса: без секретов и настроек приложения"""
+        return {
+            'PATH': os.environ.get('PATH', '/usr/bin:/bin'),
+            'PYTHONPATH': BASE_DIR,
+            'PYTHONIOENCODING': 'utf-8',
+            'PYTHONDONTWRITEBYTECODE': '1',
+            'HOME': workdir,
+            'TMPDIR': workdir,
+        }
+
+    @staticmethod
+    def save(results):
+        """
+        Сохранение результатов в таблицу tests.
+
+        Args:
+            results (list): Результаты run()
+        """
+        db = Database()
+        for result in results:
+            db.execute('''
+                       UPDATE tests
+                       SET status        = ?,
+                           actual_output = ?,
+                           duration_ms   = ?,
+                           executed_at   = CURRENT_TIMESTAMP
+                       WHERE id = ?
+                       ''', (result['status'], result['actual_output'], result['duration_ms'], result['id']))
+        db.commit()
+
+
+class TestRunJobs:
+    """
+    Класс TestRunJobs выполняет тесты, запущенные из панели разработчика,
+    в фоновом потоке (не больше одного запуска на процесс): запрос
+    не ждёт загрузки моделей и выполнения тестов. Состояние последнего
+    запуска доступно через status().
+    """
+
+    __test__ = False
+
+    def __init__(self, runner):
+        self.runner = runner
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = None
+
+    def start(self, app, tests, user_id=None):
+        """
+        Запуск тестов.
+
+        Args:
+            app (Flask): Приложение (для контекста фонового потока)
+            tests (list): Строки таблицы tests (id, code, expected_output, assistant_id)
+            user_id (int): Запустивший разработчик (для журнала)
+
+        Returns:
+            bool: False, если предыдущий запуск ещё выполняется
+        """
+        tests = [{'id': test['id'], 'code': test['code'], 'expected_output': test['expected_output'],
+                  'assistant_id': test['assistant_id']}
+                 for test in tests]
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._status = {'state': 'running', 'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                            'total': len(tests), 'passed': 0, 'failed': 0, 'seconds': 0.0}
+            self._thread = threading.Thread(target=self._run, args=(app, tests, user_id),
+                                            name='developer-tests', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, app, tests, user_id):
+        """Выполнение тестов в фоновом потоке"""
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                results = self.runner.run(tests)
+                self.runner.save(results)
+                passed = sum(1 for result in results if result['status'] == 'passed')
+                SystemLogger.info(f'Запущено тестов: {len(results)}, пройдено: {passed}', 'developer', user_id)
+                self._status.update(state='done', passed=passed, failed=len(results) - passed,
+                                    seconds=round(time.perf_counter() - started, 1))
+            except Exception as e:
+                print(f"⚠️ Ошибка запуска тестов: {e}")
+                self._status.update(state='failed', error=str(e))
+            finally:
+                Database().close_connection()
+
+    def status(self):
+        """
+        Состояние последнего запуска.
+
+        Returns:
+            dict или None: state (running, done, failed), total, passed, failed, seconds
+        """
+        return dict(self._status) if self._status else None
+
+
+test_runner = TestRunner()
+test_run_jobs = TestRunJobs(test_runner)
+
+
+if __name__ == '__main__':
+    _worker_main(sys.argv[1], float(sys.argv[2]), int(sys.argv[3]))
@@ -3,8 +3,55 @@
 Обеспечивает централизованный доступ к данным
 """
 import sqlite3
+import sys
+from time import perf_counter_ns
+
 from flask import g
 from config import Config
+from utils.metrics import metrics
+from utils.sql_profiler import sql_profiler
+
+# Длительность SQL-запросов по месту вызова (модуль:функция)
+DB_QUERY_LATENCY = metrics.histogram(
+    'db_query_duration', 'Длительность SQL-запросов через Database.execute', ('site',)
+)
+DB_QUERY_ERRORS = metrics.counter(
+    'db_query_errors', 'Ошибки SQL-запросов через Database.execute', ('site',)
+)
+
+# Кэш имён мест вызова по объекту кода
+_call_sites = {}
+
+# Вторичные индексы базы знаний (массовый импорт пересоздаёт их после загрузки)
+KNOWLEDGE_INDEXES = {
+    # Поиск ответа помощником с профилем ограничен категориями его специализации
+    'idx_knowledge_base_category':
+        'CREATE INDEX IF NOT EXISTS idx_knowledge_base_category ON knowledge_base (category, is_verified)',
+    # Фрагменты статьи по порядку; по нему же ищутся статьи без фрагментов
+    'idx_knowledge_passages_article':
+        'CREATE INDEX IF NOT EXISTS idx_knowledge_passages_article ON knowledge_passages (knowledge_id, position)',
+    # Корзины LSH подписей статей (поиск почти дубликатов)
+    'idx_knowledge_lsh_bucket':
+        'CREATE INDEX IF NOT EXISTS idx_knowledge_lsh_bucket ON knowledge_lsh (bucket)',
+}
+
+
+def _call_site():
+    """
+    Место вызова запроса за пределами этого модуля.
+
+    Returns:
+        str: Имя вида services.chat_service:ChatService.save_message
+            (до Python 3.11 - без имени класса: services.chat_service:save_message)
+    """
+    frame = sys._getframe(2)
+    while frame.f_globals.get('__name__') == __name__:
+        frame = frame.f_back
+    code = frame.f_code
+    site = _call_sites.get(code)
+    if site is None:
+        site = _call_sites[code] = f"{frame.f_globals.get('__name__')}:{getattr(code, 'co_qualname', code.co_name)}"
+    return site
 
 
 class Database:
@@ -43,8 +90,7 @@ class Database:
         Returns:
             Cursor: Курсор с результатами
         """
-        conn = self.get_connection()
-        return conn.execute(query, params)
+        return self._run(query, params, None)
 
     def execute_one(self, query, params=()):
         """
@@ -53,8 +99,7 @@ class Database:
         Returns:
             Row или None: Первая строка результата или None
         """
-        cursor = self.execute(query, params)
-        return cursor.fetchone()
+        return self._run(query, params, 'one')
 
     def execute_all(self, query, params=()):
         """
@@ -63,14 +108,77 @@ class Database:
         Returns:
             list: Список строк результата
         """
-        cursor = self.execute(query, params)
-        return cursor.fetchall()
+        return self._run(query, params, 'all')
+
+    def execute_many(self, query, rows):
+        """
+        Выполнение запроса для каждой строки одним вызовом executemany
+        (пакетная вставка; в метриках и профилировщике SQL - один запрос).
+
+        Args:
+            query (str): SQL запрос
+            rows (list): Параметры запроса для каждой строки
+
+        Returns:
+            Cursor: Курсор (rowcount - число изменённых строк)
+        """
+        return self._run(query, rows, 'many')
+
+    def _run(self, query, params, fetch):
+        """
+        Выполнение запроса с замером времени (включая выборку строк).
+
+        Args:
+            fetch (str): None - вернуть курсор, 'one' - строку, 'all' - все строки,
+                'many' - executemany по списку параметров, вернуть курсор
+        """
+        conn = self.get_connection()
+        started = perf_counter_ns()
+        try:
+            cursor = conn.executemany(query, params) if fetch == 'many' else conn.execute(query, params)
+            if fetch in (None, 'many'):
+                result = cursor
+            elif fetch == 'one':
+                result = cursor.fetchone()
+            else:
+                result = cursor.fetchall()
+        except Exception:
+            DB_QUERY_ERRORS.inc((_call_site(),))
+            raise
+        elapsed = perf_counter_ns() - started
+        site = _call_site()
+        DB_QUERY_LATENCY.observe((site,), elapsed)
+
+        if sql_profiler.enabled:
+            if fetch in (None, 'many'):
+                rows = cursor.rowcount if cursor.rowcount >= 0 else None
+            else:
+                rows = len(result) if fetch == 'all' else int(result is not None)
+            if fetch == 'many':
+                # План запроса строится по параметрам первой строки
+                params = params[0] if params else ()
+            sql_profiler.record(conn, query, params, elapsed, rows, site)
+        return result
 
     def commit(self):
         """Фиксация изменений в БД"""
         conn = self.get_connection()
         conn.commit()
 
+    def add_column(self, table, column, definition):
+        """
+        Добавление столбца в существующую таблицу (миграция старых БД).
+
+        Args:
+            table (str): Имя таблицы
+            column (str): Имя столбца
+            definition (str): Тип и ограничения столбца
+        """
+        conn = self.get_connection()
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
     def init_database(self):
         """
         Инициализация структуры базы данных.
@@ -211,6 +319,12 @@ class Database:
                          INTEGER,
                          verification_notes
                          TEXT,
+                         status
+                         TEXT
+                         DEFAULT
+                         'done',
+                         response_hash
+                         TEXT,
                          FOREIGN
                          KEY
                      (
@@ -368,6 +482,8 @@ class Database:
                          CURRENT_TIMESTAMP,
                          executed_at
                          TIMESTAMP,
+                         duration_ms
+                         REAL,
                          FOREIGN
                          KEY
                      (
@@ -379,5 +495,231 @@ class Database:
                          )
                      ''')
 
+        # Шаблоны ответов, отредактированные экспертами
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS response_templates
+                     (
+                         intent     TEXT PRIMARY KEY,
+                         body       TEXT NOT NULL,
+                         updated_by INTEGER,
+                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         FOREIGN KEY (updated_by) REFERENCES users (id)
+                     )
+                     ''')
+
+        # HTML ответов, общий для одинаковых ответов (ключ - хеш содержимого)
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS rendered_answers
+                     (
+                         hash       TEXT PRIMARY KEY,
+                         html       TEXT NOT NULL,
+                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                     )
+                     ''')
+
+        # Сравнение основного и кандидатного NLP в теневом режиме
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS nlp_shadow_results
+                     (
+                         id                   INTEGER PRIMARY KEY AUTOINCREMENT,
+                         message_id           INTEGER,
+                         message              TEXT NOT NULL,
+                         candidate            TEXT NOT NULL,
+                         primary_intent       TEXT,
+                         primary_category     TEXT,
+                         primary_confidence   FLOAT,
+                         candidate_intent     TEXT,
+                         candidate_category   TEXT,
+                         candidate_confidence FLOAT,
+                         primary_ms           REAL,
+                         candidate_ms         REAL,
+                         agreed               BOOLEAN,
+                         created_at           TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         FOREIGN KEY (message_id) REFERENCES chat_messages (id)
+                     )
+                     ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_nlp_shadow_candidate ON nlp_shadow_results (candidate, agreed)')
+
+        # Правила NLP, отредактированные разработчиками (ключевые слова - JSON-список)
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS nlp_rules
+                     (
+                         intent     TEXT PRIMARY KEY,
+                         keywords   TEXT NOT NULL,
+                         category   TEXT,
+                         kb_query   TEXT,
+                         updated_by INTEGER,
+                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                         FOREIGN KEY (updated_by) REFERENCES users (id)
+                     )
+                     ''')
+
+        # Версия правил NLP: увеличивается при каждой правке, процессы сверяют её
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS nlp_rules_version
+                     (
+                         id      INTEGER PRIMARY KEY CHECK (id = 1),
+                         version INTEGER NOT NULL
+                     )
+                     ''')
+
+        # Версия каталога помощников: увеличивается при каждом изменении таблицы assistants
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS assistants_version
+                     (
+                         id      INTEGER PRIMARY KEY CHECK (id = 1),
+                         version INTEGER NOT NULL
+                     )
+                     ''')
+
+        # Версия шаблонов ответов: увеличивается при каждой правке эксперта
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS response_templates_version
+                     (
+                         id      INTEGER PRIMARY KEY CHECK (id = 1),
+                         version INTEGER NOT NULL
+                     )
+                     ''')
+
+        # Версия базы знаний: увеличивается триггерами при любом изменении статей
+        # (в том числе мимо KnowledgeService), процессы сверяют её
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS knowledge_version
+                     (
+                         id      INTEGER PRIMARY KEY CHECK (id = 1),
+                         version INTEGER NOT NULL
+                     )
+                     ''')
+        conn.execute('INSERT OR IGNORE INTO knowledge_version (id, version) VALUES (1, 0)')
+        for event in ('INSERT', 'UPDATE OF title, content, is_verified', 'DELETE'):
+            conn.execute(f'''
+                         CREATE TRIGGER IF NOT EXISTS knowledge_version_{event.split()[0].lower()}
+                             AFTER {event}
+                             ON knowledge_base
+                         BEGIN
+                             UPDATE knowledge_version SET version = version + 1 WHERE id = 1;
+                         END
+                         ''')
+
+        # Фрагменты статей базы знаний (по заголовкам и абзацам, с перекрытием)
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS knowledge_passages
+                     (
+                         id           INTEGER PRIMARY KEY AUTOINCREMENT,
+                         knowledge_id INTEGER NOT NULL,
+                         position     INTEGER NOT NULL,
+                         heading      TEXT,
+                         content      TEXT    NOT NULL,
+                         lemmas       TEXT,
+                         FOREIGN KEY (knowledge_id) REFERENCES knowledge_base (id)
+                     )
+                     ''')
+
+        # Полнотекстовый индекс лемм фрагментов (FTS5 поверх knowledge_passages,
+        # синхронизируется триггерами); существующие фрагменты индексируются один раз
+        fts_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'knowledge_passages_fts'"
+        ).fetchone()
+        conn.execute('''
+                     CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_passages_fts USING fts5
+                     (
+                         lemmas,
+                         content = 'knowledge_passages',
+                         content_rowid = 'id',
+                         tokenize = 'unicode61 remove_diacritics 0'
+                     )
+                     ''')
+        conn.execute('''
+                     CREATE TRIGGER IF NOT EXISTS knowledge_passages_fts_insert
+                         AFTER INSERT
+                         ON knowledge_passages
+                     BEGIN
+                         INSERT INTO knowledge_passages_fts (rowid, lemmas) VALUES (new.id, new.lemmas);
+                     END
+                     ''')
+        conn.execute('''
+                     CREATE TRIGGER IF NOT EXISTS knowledge_passages_fts_delete
+                         AFTER DELETE
+                         ON knowledge_passages
+                     BEGIN
+                         INSERT INTO knowledge_passages_fts (knowledge_passages_fts, rowid, lemmas)
+                         VALUES ('delete', old.id, old.lemmas);
+                     END
+                     ''')
+        conn.execute('''
+                     CREATE TRIGGER IF NOT EXISTS knowledge_passages_fts_update
+                         AFTER UPDATE OF lemmas
+                         ON knowledge_passages
+                     BEGIN
+                         INSERT INTO knowledge_passages_fts (knowledge_passages_fts, rowid, lemmas)
+                         VALUES ('delete', old.id, old.lemmas);
+                         INSERT INTO knowledge_passages_fts (rowid, lemmas) VALUES (new.id, new.lemmas);
+                     END
+                     ''')
+        if not fts_exists:
+            conn.execute("INSERT INTO knowledge_passages_fts (knowledge_passages_fts) VALUES ('rebuild')")
+
+        # LSH-индекс MinHash-подписей статей: корзина полосы подписи -> статья
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS knowledge_lsh
+                     (
+                         bucket       INTEGER NOT NULL,
+                         knowledge_id INTEGER NOT NULL,
+                         FOREIGN KEY (knowledge_id) REFERENCES knowledge_base (id)
+                     )
+                     ''')
+
+        # Фрагменты и корзины LSH удалённой статьи (внешние ключи SQLite
+        # не включены, каскадное удаление - триггером)
+        conn.execute('''
+                     CREATE TRIGGER IF NOT EXISTS knowledge_base_delete_children
+                         AFTER DELETE
+                         ON knowledge_base
+                     BEGIN
+                         DELETE FROM knowledge_passages WHERE knowledge_id = old.id;
+                         DELETE FROM knowledge_lsh WHERE knowledge_id = old.id;
+                     END
+                     ''')
+
+        # LSH-индекс групп похожих вопросов: корзины полос подписи первого
+        # вопроса группы (chat_messages.question_group), пока в группе есть
+        # непроверенные вопросы
+        conn.execute('''
+                     CREATE TABLE IF NOT EXISTS question_lsh
+                     (
+                         bucket   INTEGER NOT NULL,
+                         group_id INTEGER NOT NULL
+                     )
+                     ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_question_lsh_bucket ON question_lsh (bucket)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_question_lsh_group ON question_lsh (group_id)')
+
+        # Миграции БД, созданных предыдущими версиями
+        self.add_column('chat_messages', 'status', "TEXT DEFAULT 'done'")
+        self.add_column('chat_messages', 'response_hash', 'TEXT')
+        self.add_column('tests', 'duration_ms', 'REAL')
+        self.add_column('tests', 'assistant_id', 'INTEGER')
+        self.add_column('knowledge_base', 'lemmas', 'TEXT')
+        self.add_column('knowledge_base', 'minhash', 'BLOB')
+        self.add_column('knowledge_base', 'duplicate_of', 'INTEGER')
+        self.add_column('knowledge_base', 'duplicate_score', 'REAL')
+        self.add_column('chat_messages', 'minhash', 'BLOB')
+        self.add_column('chat_messages', 'intent_corrected', 'INTEGER DEFAULT 0')
+        self.add_column('chat_messages', 'attempts', 'INTEGER DEFAULT 0')
+        self.add_column('chat_messages', 'claimed_at', 'TIMESTAMP')
+        self.add_column('chat_messages', 'question_group', 'INTEGER')
+        self.add_column('chat_messages', 'question_leader', 'INTEGER DEFAULT 0')
+
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages (user_id, created_at)')
+        # Очередь верификации: представители групп вопросов и вопросы группы
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_question_leader '
+                     'ON chat_messages (question_leader, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_question_group '
+                     'ON chat_messages (question_group, id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_group_leader '
+                     'ON chat_messages (question_group) WHERE question_leader = 1')
+        for index_sql in KNOWLEDGE_INDEXES.values():
+            conn.execute(index_sql)
+
         self.commit()
         print("✅ База данных инициализирована")
\ No newline at end of file
@@ -23,13 +23,13 @@ def login_required(f):
     return decorated_function
 
 
-def role_required(role):
+def role_required(*roles):
     """
     Декоратор для проверки роли пользователя.
     Проверяет, имеет ли пользователь необходимую роль для доступа.
 
     Args:
-        role (str): Требуемая роль (admin, developer, expert, client)
+        roles (str): Допустимые роли (admin, developer, expert, client)
     """
 
     def decorator(f):
@@ -43,7 +43,7 @@ def role_required(role):
             user = db.execute_one('SELECT role FROM users WHERE id = ?',
                                   (session['user_id'],))
 
-            if not user or user['role'] != role:
+            if not user or user['role'] not in roles:
                 flash('Недостаточно прав для выполнения операции', 'danger')
                 return redirect(url_for('chat.chat'))
 
@@ -0,0 +1,74 @@
+"""
+Лемматизация слов
+pymorphy2, если установлен и его словари загружаются; иначе - начало слова
+"""
+import re
+import threading
+from functools import lru_cache
+
+TOKEN_RE = re.compile(r'[а-яёa-z0-9]+')
+
+# Длина основы, если pymorphy2 недоступен
+STEM_LENGTH = 6
+
+_morph = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def _analyzer():
+    """
+    Анализатор pymorphy2, создаётся при первом обращении (загрузка
+    словарей занимает заметное время и память).
+
+    Returns:
+        MorphAnalyzer или None: None, если pymorphy2 не установлен или его словари не загрузились
+    """
+    global _morph, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                try:
+                    import pymorphy2
+
+                    _morph = pymorphy2.MorphAnalyzer()
+                except Exception as e:
+                    if not isinstance(e, ImportError):
+                        print(f"⚠️ pymorphy2 недоступен, используются основы слов: {e}")
+                    _morph = None
+                _loaded = True
+    return _morph
+
+
+def lemmatizer_name():
+    """Используемый лемматизатор: pymorphy2 или stem"""
+    return 'pymorphy2' if _analyzer() is not None else 'stem'
+
+
+@lru_cache(maxsize=100000)
+def lemma(word):
+    """Нормальная форма слова (без pymorphy2 - начало слова)"""
+    morph = _analyzer()
+    if morph is not None:
+        return morph.parse(word)[0].normal_form
+    return word[:STEM_LENGTH]
+
+
+def lemmas(text):
+    """Леммы слов текста"""
+    return [lemma(word) for word in TOKEN_RE.findall(text.lower().replace('ё', 'е'))]
+
+
+@lru_cache(maxsize=100000)
+def is_known(word):
+    """
+    Есть ли слово в словаре pymorphy2.
+
+    Returns:
+        bool или None: None, если pymorphy2 недоступен
+    """
+    morph = _analyzer()
+    if morph is None:
+        return None
+    return morph.word_is_known(word)
+
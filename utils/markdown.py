@@ -0,0 +1,33 @@
+"""
+Преобразование ответов помощника из markdown в HTML
+Поддерживается подмножество разметки, используемое в шаблонах ответов
+"""
+import re
+from markupsafe import escape
+
+_BOLD = re.compile(r'\*\*(.+?)\*\*')
+_ITALIC = re.compile(r'(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])')
+_PARAGRAPHS = re.compile(r'\n\s*\n')
+
+
+def render_markdown(text):
+    """
+    Рендеринг markdown-ответа в безопасный HTML.
+    Текст экранируется, поддерживаются **жирный**, *курсив*,
+    абзацы и переносы строк.
+
+    Args:
+        text (str): Ответ в markdown
+
+    Returns:
+        str: HTML-фрагмент
+    """
+    if not text:
+        return ''
+
+    html = str(escape(text.strip()))
+    html = _BOLD.sub(r'<strong>\1</strong>', html)
+    html = _ITALIC.sub(r'<em>\1</em>', html)
+
+    paragraphs = (p.replace('\n', '<br>\n') for p in _PARAGRAPHS.split(html))
+    return '\n'.join(f'<p>{p}</p>' for p in paragraphs)
@@ -0,0 +1,474 @@
+"""
+Метрики производительности
+Гистограммы задержек и счётчики с потоко-локальными массивами,
+суммируемыми при чтении, и выгрузка в текстовом формате Prometheus
+"""
+import threading
+import weakref
+from bisect import bisect_right
+from time import perf_counter_ns
+
+# Границы корзин гистограмм в наносекундах: от 1 мкс до ~60 с, шаг 2^(1/4)
+BUCKET_BOUNDS = tuple(int(1000 * 2 ** (i / 4)) for i in range(104))
+
+# В /metrics выгружается каждая 4-я граница (шаг x2), счётчики остаются точными
+EXPOSITION_BUCKET_STEP = 4
+INF_BUCKET = 'le="+Inf"'
+
+
+def percentile(counts, bounds, q):
+    """
+    Оценка перцентиля по корзинам гистограммы.
+
+    Args:
+        counts (list): Число наблюдений в корзинах (последняя - выше всех границ)
+        bounds (tuple): Верхние границы корзин
+        q (float): Перцентиль от 0 до 1
+
+    Returns:
+        int: Верхняя граница корзины, в которую попадает перцентиль (нс)
+    """
+    total = sum(counts)
+    if not total:
+        return 0
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bounds[i] if i < len(bounds) else bounds[-1]
+    return bounds[-1]
+
+
+class ThreadOwner:
+    """
+    Объект, который живёт в threading.local потока, пока жив поток.
+    К нему привязываются (weakref.finalize) массивы счётчиков потока:
+    после завершения потока они сливаются в общий итог метрики, поэтому
+    число массивов не растёт с числом потоков (сервер разработки Flask
+    создаёт поток на каждый запрос).
+    """
+
+    __slots__ = ('__weakref__',)
+
+
+class Histogram:
+    """
+    Класс Histogram накапливает распределение значений по корзинам.
+
+    Каждый поток пишет в собственный массив счётчиков (без блокировок),
+    массивы суммируются только при чтении (snapshot). Массивы
+    завершившихся потоков добавляются к итогу _retired.
+    """
+
+    __slots__ = ('bounds', '_local', '_shards', '_retired', '_lock')
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self._local = threading.local()
+        self._shards = {}  # id(массив) -> массив живого потока
+        self._retired = [0] * (len(bounds) + 2)
+        self._lock = threading.Lock()
+
+    def new_shard(self, owner):
+        """
+        Массив счётчиков для текущего потока: корзины + сумма значений.
+
+        Args:
+            owner (ThreadOwner): Объект потока; когда он удаляется,
+                массив сливается в итог
+        """
+        shard = [0] * (len(self.bounds) + 2)
+        with self._lock:
+            self._shards[id(shard)] = shard
+        weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        """Слияние массива завершившегося потока в итог"""
+        with self._lock:
+            del self._shards[id(shard)]
+            for i, value in enumerate(shard):
+                self._retired[i] += value
+
+    def observe(self, value):
+        """
+        Добавление наблюдения.
+
+        Args:
+            value (int): Значение (для задержек - наносекунды)
+        """
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            owner = self._local.owner = ThreadOwner()
+            shard = self._local.shard = self.new_shard(owner)
+        shard[bisect_right(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """
+        Сумма счётчиков всех потоков.
+
+        Returns:
+            tuple: (список счётчиков по корзинам, сумма значений)
+        """
+        with self._lock:
+            shards = list(self._shards.values())
+            shards.append(list(self._retired))
+        size = len(self.bounds) + 1
+        counts = [0] * size
+        total = 0
+        for shard in shards:
+            for i in range(size):
+                counts[i] += shard[i]
+            total += shard[-1]
+        return counts, total
+
+
+class HistogramFamily:
+    """
+    Класс HistogramFamily - набор гистограмм с одинаковым именем,
+    различающихся значениями меток (например, stage и intent).
+    """
+
+    def __init__(self, name, documentation, labelnames, bounds=BUCKET_BOUNDS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.bounds = bounds
+        self._children = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Гистограмма для набора значений меток"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = Histogram(self.bounds)
+        return child
+
+    def observe(self, values, value):
+        """
+        Добавление наблюдения в гистограмму с метками values.
+        То же, что labels(*values).observe(value), но за один вызов:
+        поток держит свой словарь {метки: массив счётчиков}.
+
+        Args:
+            values (tuple): Значения меток
+            value (int): Значение (нс)
+        """
+        try:
+            shard = self._local.shards[values]
+        except AttributeError:
+            self._local.owner = ThreadOwner()
+            self._local.shards = {}
+            shard = self._local.shards[values] = self.labels(*values).new_shard(self._local.owner)
+        except KeyError:
+            shard = self._local.shards[values] = self.labels(*values).new_shard(self._local.owner)
+        shard[bisect_right(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def collect(self):
+        """
+        Снимок всех гистограмм семейства.
+
+        Returns:
+            dict: {значения меток: (счётчики корзин, сумма)}
+        """
+        return {values: child.snapshot() for values, child in list(self._children.items())}
+
+    def summary(self, by=None):
+        """
+        Перцентили задержек, агрегированные по части меток.
+
+        Args:
+            by (tuple): Имена меток для группировки (по умолчанию - все)
+
+        Returns:
+            list: Словари с метками, count, p50/p95/p99 и средним (мс)
+        """
+        by = self.labelnames if by is None else tuple(by)
+        indexes = [self.labelnames.index(name) for name in by]
+
+        groups = {}
+        for values, (counts, total) in self.collect().items():
+            key = tuple(values[i] for i in indexes)
+            group = groups.setdefault(key, [[0] * len(counts), 0])
+            for i, count in enumerate(counts):
+                group[0][i] += count
+            group[1] += total
+
+        report = []
+        for key, (counts, total) in sorted(groups.items()):
+            count = sum(counts)
+            item = dict(zip(by, key))
+            item.update({
+                'count': count,
+                'avg_ms': round(total / count / 1e6, 3) if count else 0.0,
+                'p50_ms': round(percentile(counts, self.bounds, 0.50) / 1e6, 3),
+                'p95_ms': round(percentile(counts, self.bounds, 0.95) / 1e6, 3),
+                'p99_ms': round(percentile(counts, self.bounds, 0.99) / 1e6, 3),
+            })
+            report.append(item)
+        return report
+
+
+class CounterFamily:
+    """
+    Класс CounterFamily - монотонные счётчики с метками.
+
+    Как и у гистограмм, каждый поток увеличивает собственные ячейки,
+    а суммирование по потокам выполняется при чтении. Ячейки
+    завершившихся потоков добавляются к итогу _retired.
+    """
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._cells = {}  # id(ячейка) -> (значения меток, ячейка живого потока)
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _new_cell(self, values):
+        """Ячейка счётчика для текущего потока"""
+        cell = [0]
+        with self._lock:
+            self._cells[id(cell)] = (values, cell)
+        weakref.finalize(self._local.owner, self._retire, values, cell)
+        return cell
+
+    def _retire(self, values, cell):
+        """Слияние ячейки завершившегося потока в итог"""
+        with self._lock:
+            del self._cells[id(cell)]
+            self._retired[values] = self._retired.get(values, 0) + cell[0]
+
+    def inc(self, values=(), amount=1):
+        """
+        Увеличение счётчика.
+
+        Args:
+            values (tuple): Значения меток
+            amount (int): Приращение
+        """
+        try:
+            cell = self._local.cells[values]
+        except AttributeError:
+            self._local.owner = ThreadOwner()
+            self._local.cells = {}
+            cell = self._local.cells[values] = self._new_cell(values)
+        except KeyError:
+            cell = self._local.cells[values] = self._new_cell(values)
+        cell[0] += amount
+
+    def collect(self):
+        """
+        Значения счётчиков, просуммированные по потокам.
+
+        Returns:
+            dict: {значения меток: значение}
+        """
+        with self._lock:
+            cells = list(self._cells.values())
+            totals = dict(self._retired)
+        for values, cell in cells:
+            totals[values] = totals.get(values, 0) + cell[0]
+        return totals
+
+
+class GaugeFamily:
+    """
+    Класс GaugeFamily - текущие значения (глубина очереди, размер кэша),
+    которые вычисляются функцией в момент чтения метрик.
+
+    С kind='counter' так же выгружаются счётчики, которые уже ведёт
+    сам объект (например, NLPExecutor.stats).
+    """
+
+    def __init__(self, name, documentation, labelnames, func, kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self.kind = kind
+
+    def collect(self):
+        """
+        Текущие значения.
+
+        Returns:
+            dict: {значения меток: значение}; функция может вернуть
+                число (для метрики без меток) или такой же словарь
+        """
+        value = self.func()
+        return value if isinstance(value, dict) else {(): value}
+
+
+class MetricsRegistry:
+    """
+    Класс MetricsRegistry хранит все метрики процесса по имени.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, factory):
+        """Получение метрики по имени или создание через factory"""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def histogram(self, name, documentation='', labelnames=()):
+        """Получение (или создание) семейства гистограмм (значения в нс)"""
+        return self._register(name, lambda: HistogramFamily(name, documentation, labelnames))
+
+    def counter(self, name, documentation='', labelnames=()):
+        """Получение (или создание) семейства счётчиков"""
+        return self._register(name, lambda: CounterFamily(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames, func, kind='gauge'):
+        """
+        Регистрация показателя, вычисляемого при чтении.
+
+        Args:
+            func (callable): Функция без аргументов, возвращающая значение
+                или словарь {значения меток: значение}
+            kind (str): Тип при выгрузке: gauge или counter
+        """
+        return self._register(name, lambda: GaugeFamily(name, documentation, labelnames, func, kind))
+
+    def all(self):
+        """Все зарегистрированные метрики"""
+        with self._lock:
+            return list(self._metrics.values())
+
+    def exposition(self):
+        """
+        Все метрики в текстовом формате Prometheus (version 0.0.4).
+        Гистограммы выгружаются в секундах с суффиксом _seconds.
+
+        Returns:
+            str: Текст для ответа /metrics
+        """
+        lines = []
+        for metric in sorted(self.all(), key=lambda m: m.name):
+            if isinstance(metric, HistogramFamily):
+                _expose_histogram(metric, lines)
+            elif isinstance(metric, CounterFamily):
+                _expose_samples(metric, f'{metric.name}_total', 'counter', lines)
+            else:
+                sample_name = f'{metric.name}_total' if metric.kind == 'counter' else metric.name
+                try:
+                    _expose_samples(metric, sample_name, metric.kind, lines)
+                except Exception:
+                    # Показатель недоступен (например, пул ещё не создан)
+                    continue
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    """Экранирование значения метки"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    """Метки в виде {name="value",...}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """Число в формате экспозиции"""
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def _expose_samples(metric, sample_name, kind, lines):
+    """Выгрузка счётчика или показателя"""
+    samples = metric.collect()
+    lines.append(f'# HELP {sample_name} {metric.documentation}')
+    lines.append(f'# TYPE {sample_name} {kind}')
+    for values, value in sorted(samples.items()):
+        lines.append(f'{sample_name}{_format_labels(metric.labelnames, values)} {_format_value(value)}')
+
+
+def _expose_histogram(metric, lines):
+    """Выгрузка гистограммы с кумулятивными корзинами"""
+    name = f'{metric.name}_seconds'
+    lines.append(f'# HELP {name} {metric.documentation}')
+    lines.append(f'# TYPE {name} histogram')
+    bounds = metric.bounds
+    for values, (counts, total) in sorted(metric.collect().items()):
+        cumulative = 0
+        for i, count in enumerate(counts[:len(bounds)]):
+            cumulative += count
+            if i % EXPOSITION_BUCKET_STEP == 0:
+                le = f'le="{bounds[i] / 1e9:.9g}"'
+                lines.append(f'{name}_bucket{_format_labels(metric.labelnames, values, le)} {cumulative}')
+        count = cumulative + counts[-1]
+        labels = _format_labels(metric.labelnames, values)
+        lines.append(f'{name}_bucket{_format_labels(metric.labelnames, values, INF_BUCKET)} {count}')
+        lines.append(f'{name}_sum{labels} {total / 1e9:.9g}')
+        lines.append(f'{name}_count{labels} {count}')
+
+
+class StageTimer:
+    """
+    Класс StageTimer измеряет длительность последовательных этапов обработки.
+
+    mark(stage) записывает время, прошедшее с предыдущей отметки, поэтому
+    замер этапа стоит одного вызова perf_counter_ns и добавления в список.
+    """
+
+    __slots__ = ('started', '_last', 'timings')
+
+    def __init__(self):
+        self.started = self._last = perf_counter_ns()
+        self.timings = []
+
+    def mark(self, stage):
+        """Завершение этапа stage"""
+        now = perf_counter_ns()
+        self.timings.append((stage, now - self._last))
+        self._last = now
+
+    def skip(self):
+        """Исключение прошедшего времени из следующего этапа"""
+        self._last = perf_counter_ns()
+
+    def total(self):
+        """Время с момента создания таймера, нс"""
+        return perf_counter_ns() - self.started
+
+
+class NullTimer:
+    """Таймер-заглушка, когда замеры не нужны"""
+
+    __slots__ = ()
+    timings = ()
+
+    def mark(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+metrics = MetricsRegistry()
+
+# Обращения к кэшам процесса (cache: render, rendered_html; result: hit, miss)
+CACHE_REQUESTS = metrics.counter('cache_requests', 'Обращения к кэшам', ('cache', 'result'))
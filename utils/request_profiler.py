@@ -0,0 +1,272 @@
+"""
+Профилирование отдельных HTTP-запросов
+cProfile или выборка стека, результат - файлы collapsed stacks для flamegraph
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request, session
+from config import Config
+
+MODES = ('sampling', 'cprofile')
+
+
+def _label(filename, lineno, name):
+    """Имя кадра для collapsed stacks (без ';', который разделяет кадры)"""
+    if filename == '~':
+        return name.replace(';', ',')
+    return f'{name} ({os.path.basename(filename)}:{lineno})'.replace(';', ',')
+
+
+class StackSampler(threading.Thread):
+    """
+    Класс StackSampler с заданным интервалом снимает стек одного потока
+    через sys._current_frames() и считает одинаковые стеки.
+    Профилируемый код не замедляется, кроме переключений GIL.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True, name='request-profiler')
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_label(code.co_filename, code.co_firstlineno,
+                                    getattr(code, 'co_qualname', code.co_name)))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        """Остановка выборки"""
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+def collapse_pstats(stats, max_depth=64):
+    """
+    Преобразование статистики cProfile в collapsed stacks.
+
+    cProfile хранит только пары вызывающий-вызываемый, поэтому время
+    функции распределяется по путям пропорционально времени вызовов
+    с каждого ребра (как это делают flameprof и подобные утилиты).
+
+    Args:
+        stats (dict): pstats.Stats(...).stats
+        max_depth (int): Максимальная глубина стека
+
+    Returns:
+        Counter: {стек: микросекунды}
+    """
+    children = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller in callers:
+            children.setdefault(caller, []).append(func)
+
+    collapsed = Counter()
+
+    def walk(func, path, labels, scale):
+        _, _, tt, ct, _ = stats[func]
+        labels = labels + [_label(*func)]
+        self_us = int(tt * scale * 1e6)
+        if self_us:
+            collapsed[';'.join(labels)] += self_us
+        if len(labels) >= max_depth:
+            return
+        for child in children.get(func, ()):
+            if child in path:
+                continue
+            child_ct = stats[child][3]
+            edge_ct = stats[child][4][func][3]
+            if child_ct and edge_ct:
+                walk(child, path | {child}, labels, scale * edge_ct / child_ct)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, {func}, [], 1.0)
+    return collapsed
+
+
+class RequestProfiler:
+    """
+    Класс RequestProfiler решает, какие HTTP-запросы профилировать
+    (по маршруту, пользователю или доле запросов), и сохраняет профили
+    в PROFILER_DIR: <id>.collapsed (для flamegraph.pl / speedscope),
+    <id>.prof (pstats, только cprofile) и <id>.json (сведения о запросе).
+
+    Настройки меняются из админ-панели без перезапуска (в текущем процессе).
+    """
+
+    def __init__(self):
+        self.enabled = Config.PROFILER_ENABLED
+        self.mode = Config.PROFILER_MODE
+        self.routes = set(Config.PROFILER_ROUTES)
+        self.user_ids = set(Config.PROFILER_USERS)
+        self.sample_rate = Config.PROFILER_SAMPLE_RATE
+        self.interval = Config.PROFILER_INTERVAL
+        self.directory = Config.PROFILER_DIR
+        self._cprofile_lock = threading.Lock()
+
+    def configure(self, enabled, mode, routes, user_ids, sample_rate):
+        """
+        Изменение настроек профилирования.
+
+        Args:
+            enabled (bool): Профилирование включено
+            mode (str): sampling или cprofile
+            routes (iterable): Endpoint'ы маршрутов (например chat.chat)
+            user_ids (iterable): ID пользователей
+            sample_rate (float): Доля остальных запросов от 0 до 1
+        """
+        if mode not in MODES:
+            raise ValueError(f'Неизвестный режим профилирования: {mode}')
+        self.enabled = enabled
+        self.mode = mode
+        self.routes = set(routes)
+        self.user_ids = set(user_ids)
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def _selected(self):
+        """Нужно ли профилировать текущий запрос"""
+        if request.endpoint in self.routes:
+            return 'route'
+        if self.user_ids and session.get('user_id') in self.user_ids:
+            return 'user'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self):
+        """Начало профилирования запроса (before_request)"""
+        if not self.enabled or request.endpoint in (None, 'static'):
+            return
+        reason = self._selected()
+        if reason is None:
+            return
+
+        if self.mode == 'cprofile':
+            # cProfile не может работать в нескольких потоках одновременно
+            if not self._cprofile_lock.acquire(blocking=False):
+                return
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                self._cprofile_lock.release()
+                return
+        else:
+            profiler = StackSampler(threading.get_ident(), self.interval)
+            profiler.start()
+
+        g.request_profile = (profiler, reason, time.perf_counter())
+
+    def finish(self):
+        """Завершение профилирования и сохранение профиля (teardown_request)"""
+        active = g.pop('request_profile', None)
+        if active is None:
+            return None
+        profiler, reason, started = active
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile_id)
+
+        if isinstance(profiler, StackSampler):
+            stacks = profiler.stop()
+            mode, unit = 'sampling', 'samples'
+        else:
+            try:
+                profiler.disable()
+            finally:
+                self._cprofile_lock.release()
+            profiler.dump_stats(base + '.prof')
+            stacks = collapse_pstats(pstats.Stats(profiler).stats)
+            mode, unit = 'cprofile', 'us'
+
+        with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+            for stack, value in stacks.most_common():
+                f.write(f'{stack} {value}\n')
+
+        meta = {
+            'id': profile_id,
+            'mode': mode,
+            'unit': unit,
+            'reason': reason,
+            'endpoint': request.endpoint,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'user_id': session.get('user_id'),
+            'duration_ms': duration_ms,
+            'stacks': len(stacks),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        self._cleanup()
+        return meta
+
+    def _cleanup(self):
+        """Удаление самых старых профилей сверх PROFILER_MAX_FILES"""
+        profiles = self.list_profiles()
+        for meta in profiles[Config.PROFILER_MAX_FILES:]:
+            self.delete(meta['id'])
+
+    def list_profiles(self):
+        """
+        Сохранённые профили, от новых к старым.
+
+        Returns:
+            list: Сведения о профилях
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, filename), encoding='utf-8') as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(profiles, key=lambda meta: meta['id'], reverse=True)
+
+    def path(self, profile_id, extension):
+        """
+        Путь к файлу профиля (None, если файла нет или id некорректен).
+
+        Args:
+            profile_id (str): ID профиля
+            extension (str): collapsed или prof
+        """
+        if extension not in ('collapsed', 'prof') or not profile_id.replace('-', '').isalnum():
+            return None
+        path = os.path.join(self.directory, f'{profile_id}.{extension}')
+        return path if os.path.isfile(path) else None
+
+    def delete(self, profile_id):
+        """Удаление файлов профиля"""
+        for extension in ('collapsed', 'prof', 'json'):
+            path = os.path.join(self.directory, f'{profile_id}.{extension}')
+            if os.path.exists(path):
+                os.remove(path)
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,189 @@
+"""
+Профилировщик SQL-запросов
+Статистика по запросам, журнал самых медленных и бюджет запросов на HTTP-запрос
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+from flask import g, has_request_context, request
+from config import Config
+from utils.trace import Tracer
+
+tracer = Tracer('sql')
+
+
+@lru_cache(maxsize=Config.SQL_PROFILER_MAX_STATEMENTS)
+def normalize_sql(query):
+    """Запрос без лишних пробелов (ключ статистики)"""
+    return ' '.join(query.split())
+
+
+class QueryProfiler:
+    """
+    Класс QueryProfiler собирает сведения о запросах, прошедших через Database.
+
+    Включается через SQL_PROFILER (или из админ-панели) и в выключенном
+    состоянии стоит одной проверки атрибута. Для каждого различного
+    запроса (не более SQL_PROFILER_MAX_STATEMENTS) ведётся статистика
+    (число, время, строки, место вызова) и один раз снимается
+    EXPLAIN QUERY PLAN. Самые медленные выполнения хранятся
+    в куче из SQL_SLOW_LOG_SIZE элементов, превышения бюджета на HTTP-запрос
+    (в том числе повторы одного запроса - признак N+1) - в кольцевом буфере.
+    """
+
+    def __init__(self, enabled=None, slow_ms=None, capacity=None):
+        self.enabled = Config.SQL_PROFILER_ENABLED if enabled is None else enabled
+        self.slow_ns = int((Config.SQL_SLOW_QUERY_MS if slow_ms is None else slow_ms) * 1e6)
+        self.capacity = capacity or Config.SQL_SLOW_LOG_SIZE
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self.reset()
+
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._statements = {}
+            self._slowest = []
+            self.violations = deque(maxlen=self.capacity)
+            self.started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    @staticmethod
+    def _explain(conn, query, params):
+        """План выполнения запроса (EXPLAIN сам запрос не выполняет)"""
+        if not query.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+            return None
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+        except Exception as e:
+            return f'нет плана: {e}'
+        return '\n'.join(row[3] for row in rows)
+
+    def record(self, conn, query, params, elapsed_ns, rows, site):
+        """
+        Учёт выполненного запроса.
+
+        Args:
+            conn (Connection): Подключение, на котором выполнялся запрос
+            query (str): SQL запрос
+            params (tuple): Параметры запроса
+            elapsed_ns (int): Длительность, нс
+            rows (int или None): Число строк (возвращённых или изменённых)
+            site (str): Место вызова
+        """
+        sql = normalize_sql(query)
+
+        with self._lock:
+            stat = self._statements.get(sql)
+            is_new = stat is None
+            if is_new:
+                stat = {
+                    'sql': sql, 'count': 0, 'total_ns': 0, 'max_ns': 0, 'rows': 0,
+                    'sites': set(), 'plan': None, 'correlated': False,
+                }
+                # Запросы со встроенными значениями не растят статистику без предела:
+                # сверх лимита новый запрос не учитывается и не анализируется EXPLAIN
+                if len(self._statements) < Config.SQL_PROFILER_MAX_STATEMENTS:
+                    self._statements[sql] = stat
+                else:
+                    is_new = False
+            stat['count'] += 1
+            stat['total_ns'] += elapsed_ns
+            stat['rows'] += rows or 0
+            stat['sites'].add(site)
+            if elapsed_ns > stat['max_ns']:
+                stat['max_ns'] = elapsed_ns
+
+        if is_new:
+            plan = self._explain(conn, query, params)
+            stat['plan'] = plan
+            if plan and 'CORRELATED' in plan:
+                # Подзапрос выполняется для каждой строки внешнего запроса
+                stat['correlated'] = True
+                tracer.begin().warning('N+1 внутри SQL (коррелированный подзапрос) в %s: %s', site, sql)
+
+        if elapsed_ns >= self.slow_ns:
+            entry = (elapsed_ns, next(self._order), {
+                'sql': sql,
+                'params': repr(tuple(params))[:200],
+                'ms': round(elapsed_ns / 1e6, 2),
+                'rows': rows,
+                'site': site,
+                'at': time.strftime('%H:%M:%S'),
+                'endpoint': request.endpoint if has_request_context() else None,
+            })
+            with self._lock:
+                if len(self._slowest) < self.capacity:
+                    heapq.heappush(self._slowest, entry)
+                elif elapsed_ns > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+        if has_request_context():
+            counts = g.get('sql_queries')
+            if counts is None:
+                counts = g.sql_queries = {}
+            counts[sql] = counts.get(sql, 0) + 1
+
+    def end_request(self):
+        """
+        Проверка бюджета запросов завершившегося HTTP-запроса.
+
+        Returns:
+            dict или None: Сведения о превышении бюджета
+        """
+        counts = g.pop('sql_queries', None)
+        if not counts:
+            return None
+
+        total = sum(counts.values())
+        repeated = sorted(((count, sql) for sql, count in counts.items()
+                           if count >= Config.SQL_REPEAT_THRESHOLD), reverse=True)
+        if total <= Config.SQL_QUERY_BUDGET and not repeated:
+            return None
+
+        violation = {
+            'at': time.strftime('%H:%M:%S'),
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'total': total,
+            'distinct': len(counts),
+            'repeated': [{'sql': sql, 'count': count} for count, sql in repeated[:5]],
+        }
+        self.violations.append(violation)
+        tracer.begin().warning('Бюджет SQL превышен: %s - %d запросов (%d различных), повторы: %s',
+                               request.path, total, len(counts),
+                               [f"{item['count']}x {item['sql'][:80]}" for item in violation['repeated']])
+        return violation
+
+    def statements(self):
+        """
+        Статистика по запросам, от самых дорогих по суммарному времени.
+
+        Returns:
+            list: Словари с числом выполнений, временем (мс), строками, местами вызова и планом
+        """
+        with self._lock:
+            stats = [dict(stat, sites=sorted(stat['sites'])) for stat in self._statements.values()]
+        for stat in stats:
+            stat['total_ms'] = round(stat.pop('total_ns') / 1e6, 2)
+            stat['avg_ms'] = round(stat['total_ms'] / stat['count'], 3)
+            stat['max_ms'] = round(stat.pop('max_ns') / 1e6, 2)
+        return sorted(stats, key=lambda stat: stat['total_ms'], reverse=True)
+
+    def slowest(self):
+        """
+        Самые медленные выполнения.
+
+        Returns:
+            list: От самого медленного к быстрому
+        """
+        with self._lock:
+            entries = sorted(self._slowest, reverse=True)
+            plans = {sql: stat['plan'] for sql, stat in self._statements.items()}
+        return [dict(entry, plan=plans.get(entry['sql'])) for _, _, entry in entries]
+
+
+sql_profiler = QueryProfiler()
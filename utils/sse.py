@@ -0,0 +1,62 @@
+"""
+Server-Sent Events
+Форматирование событий для потоковой доставки ответов
+"""
+import json
+
+
+def format_sse(data, event=None, event_id=None):
+    """
+    Форматирование одного события SSE.
+
+    Args:
+        data (dict или str): Данные события (dict сериализуется в JSON)
+        event (str): Тип события
+        event_id: Идентификатор события
+
+    Returns:
+        str: Событие в формате text/event-stream
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.extend(f'data: {line}' for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+
+def iter_chunks(text, size=256):
+    """
+    Разбиение ответа на фрагменты для потоковой отправки.
+    Фрагменты не превышают size символов и по возможности
+    режутся по границам слов и строк.
+
+    Args:
+        text (str): Текст ответа
+        size (int): Желаемый размер фрагмента
+
+    Yields:
+        str: Очередной фрагмент; склейка фрагментов даёт исходный текст
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = start + size
+        if end < length:
+            cut = text.rfind(' ', start, end)
+            cut_line = text.rfind('\n', start, end)
+            cut = max(cut, cut_line)
+            if cut > start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
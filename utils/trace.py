@@ -0,0 +1,142 @@
+"""
+Отладочная трассировка обработки запросов
+Уровни, выборочная запись запросов и ленивое форматирование поверх logging
+"""
+import itertools
+import logging
+import os
+import random
+import sys
+
+from config import Config
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s'
+
+
+class Lazy:
+    """
+    Значение, вычисляемое только при форматировании сообщения.
+
+    Пример:
+        trace.debug('Статьи: %s', Lazy(lambda: [a.title for a in articles]))
+    """
+
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+    __repr__ = __str__
+
+
+class Trace:
+    """
+    Класс Trace - трассировка одного запроса.
+
+    Сообщения ниже порога level отбрасываются одним сравнением, до
+    обращения к logging и форматирования аргументов.
+    """
+
+    __slots__ = ('logger', 'level', 'extra')
+
+    def __init__(self, logger, level, trace_id='-'):
+        self.logger = logger
+        self.level = level
+        self.extra = {'trace_id': trace_id}
+
+    @property
+    def sampled(self):
+        """Включена ли подробная трассировка запроса"""
+        return self.extra['trace_id'] != '-'
+
+    def enabled(self, level):
+        """Будет ли записано сообщение уровня level"""
+        return level >= self.level
+
+    def debug(self, msg, *args):
+        """Отладочное сообщение (аргументы форматируются только при записи)"""
+        if DEBUG >= self.level:
+            self.logger.log(DEBUG, msg, *args, extra=self.extra)
+
+    def info(self, msg, *args):
+        """Информационное сообщение (аргументы форматируются только при записи)"""
+        if INFO >= self.level:
+            self.logger.log(INFO, msg, *args, extra=self.extra)
+
+    def warning(self, msg, *args):
+        """Предупреждение (аргументы форматируются только при записи)"""
+        if WARNING >= self.level:
+            self.logger.log(WARNING, msg, *args, extra=self.extra)
+
+    def error(self, msg, *args):
+        """Ошибка (аргументы форматируются только при записи)"""
+        if ERROR >= self.level:
+            self.logger.log(ERROR, msg, *args, extra=self.extra)
+
+
+class Tracer:
+    """
+    Класс Tracer выдаёт трассировки запросов одного компонента.
+
+    Доля TRACE_SAMPLE_RATE запросов трассируется подробно (DEBUG) со своим
+    идентификатором, остальные - только с уровня TRACE_LEVEL. Вывод идёт
+    через logging (по умолчанию в stderr), а не print в stdout.
+    """
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(f'legal_ai.{name}')
+        self.level = None
+        self.sample_rate = 0.0
+        self._quiet = None
+        self._counter = itertools.count(1)
+
+    def configure(self, level=None, sample_rate=None):
+        """
+        Настройка уровня и доли трассируемых запросов.
+
+        Args:
+            level (str или int): Порог для обычных запросов (по умолчанию Config.TRACE_LEVEL)
+            sample_rate (float): Доля запросов с подробной трассировкой от 0 до 1
+        """
+        level = Config.TRACE_LEVEL if level is None else level
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        self.level = level
+        self.sample_rate = Config.TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self._quiet = Trace(self.logger, level)
+        _setup_handler()
+
+    def begin(self):
+        """
+        Начало трассировки запроса (решение о выборке принимается здесь).
+
+        Returns:
+            Trace: Трассировка запроса
+        """
+        if self._quiet is None:
+            self.configure()
+        if self.sample_rate and random.random() < self.sample_rate:
+            return Trace(self.logger, DEBUG, f'{os.getpid()}-{next(self._counter)}')
+        return self._quiet
+
+
+def _setup_handler():
+    """
+    Обработчик для логгеров трассировки, если приложение не настроило свой.
+    Пороги проверяет Trace, поэтому сам логгер пропускает всё.
+    """
+    root = logging.getLogger('legal_ai')
+    root.setLevel(DEBUG)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.propagate = False